@@ -1,9 +1,51 @@
-from fastapi import FastAPI, File, UploadFile, Request
+import os
+from fastapi import FastAPI, File, UploadFile, Request, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
+
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_MB", "10")) * 1024 * 1024
+
+class BodyTooLarge(HTTPException):
+    # An HTTPException so FastAPI answers 413 when it is raised while the
+    # form is being parsed
+    def __init__(self):
+        super().__init__(status_code=413, detail="File too large")
+
+class UploadLimitMiddleware:
+    # Stops oversized uploads while they arrive instead of spooling them in
+    # full: the declared Content-Length is checked first, then the bytes
+    # actually received are counted
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        too_large = JSONResponse(status_code=413, content={"detail": "File too large"})
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > self.max_bytes:
+            return await too_large(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            received += len(message.get("body", b""))
+            if received > self.max_bytes:
+                raise BodyTooLarge()
+            return message
+
+        try:
+            await self.app(scope, limited_receive, send)
+        except BodyTooLarge:
+            await too_large(scope, receive, send)
 
 app = FastAPI()
+app.add_middleware(UploadLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
@@ -14,6 +56,7 @@ async def read_root(request: Request):
 
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
+    # The size comes from the spooled upload; the content is never read
     return {
         "filename": file.filename,
         "size": file.size,
@@ -3,6 +3,8 @@ from flask_restful import Api, Resource
 import os
 
 app = Flask(__name__)
+# Werkzeug rejects bigger request bodies with 413 while they are read
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', '10')) * 1024 * 1024
 api = Api(app)
 
 class AnimalImage(Resource):
@@ -20,9 +22,15 @@ class FileInfo(Resource):
         if file.filename == '':
             return {'error': 'No selected file'}, 400
         
+        # Size from the spooled stream's end offset instead of reading the
+        # whole file into memory
+        file.stream.seek(0, os.SEEK_END)
+        size = file.stream.tell()
+        file.stream.seek(0)
+
         file_info = {
             'name': file.filename,
-            'size': len(file.read()),
+            'size': size,
             'type': file.content_type
         }
 
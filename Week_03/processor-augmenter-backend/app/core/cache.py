@@ -0,0 +1,208 @@
+import asyncio
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from .config import env_int, env_str
+from .timing import server_timing
+
+
+class DiskTier:
+    # SQLite file holding pickled results across restarts. Least recently
+    # read rows go first once the file's byte budget is exceeded.
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._db.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute('UPDATE results SET accessed = ? WHERE key = ?', (time.time(), key))
+            return row[0]
+
+    def put(self, key: str, blob: bytes):
+        if len(blob) > self.max_bytes:
+            return
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)',
+                (key, blob, len(blob), time.time())
+            )
+            total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+            while total > self.max_bytes:
+                key, size = self._db.execute(
+                    'SELECT key, size FROM results ORDER BY accessed LIMIT 1'
+                ).fetchone()
+                self._db.execute('DELETE FROM results WHERE key = ?', (key,))
+                total -= size
+                self.evictions += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries, size = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results').fetchone()
+        return {'path': self.path, 'entries': entries, 'bytes': size, 'max_bytes': self.max_bytes,
+                'evictions': self.evictions}
+
+
+class ResultCache:
+    # Results of deterministic service calls keyed by a hash of the input
+    # bytes, the operation and its parameters. A bounded in-memory LRU sits
+    # in front of an optional SQLite tier, and concurrent requests for the
+    # same key share one computation.
+    def __init__(self, max_bytes: int, disk: Optional[DiskTier] = None):
+        self.max_bytes = max_bytes
+        self.disk = disk
+        self._entries: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._pending: Dict[str, asyncio.Future] = {}
+
+        # Metrics
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.shared = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 or self.disk is not None
+
+    @staticmethod
+    def key(operation: str, data: bytes, params: Optional[Dict] = None) -> str:
+        digest = hashlib.sha256()
+        digest.update(operation.encode('utf-8') + b'\0')
+        digest.update(json.dumps(params or {}, sort_keys=True, default=str).encode('utf-8') + b'\0')
+        digest.update(data)
+        return digest.hexdigest()
+
+    def _remember(self, key: str, blob: bytes):
+        if len(blob) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = blob
+            self._bytes += len(blob)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def _lookup_memory(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            blob = self._entries.get(key)
+            if blob is not None:
+                self._entries.move_to_end(key)
+            return blob
+
+    async def get(self, key: str) -> Tuple[bool, Any]:
+        blob = self._lookup_memory(key)
+        if blob is not None:
+            self.hits += 1
+            return True, pickle.loads(blob)
+        if self.disk is not None:
+            blob = await asyncio.to_thread(self.disk.get, key)
+            if blob is not None:
+                self.disk_hits += 1
+                self._remember(key, blob)
+                return True, pickle.loads(blob)
+        self.misses += 1
+        return False, None
+
+    async def put(self, key: str, value: Any):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._remember(key, blob)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.put, key, blob)
+
+    async def get_or_compute(self, key: Optional[str], compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        # Returns (value, served_from_cache). A None key bypasses the cache,
+        # e.g. for unseeded random augmentations.
+        if key is None or not self.enabled:
+            return await compute(), False
+
+        found, value = await self.get(key)
+        if found:
+            return value, True
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            # Same input already being computed: wait for that result
+            self.shared += 1
+            try:
+                return await asyncio.shield(pending), True
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+            # The request computing it was cancelled (e.g. a cancelled job),
+            # not this one: compute it here instead
+            return await self.get_or_compute(key, compute)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            value = await compute()
+            await self.put(key, value)
+            future.set_result(value)
+            return value, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; don't leave "exception never retrieved" noise
+            future.exception()
+            raise
+        finally:
+            del self._pending[key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            memory = {'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes}
+        return {
+            'memory': memory,
+            'disk': self.disk.stats() if self.disk is not None else None,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'shared': self.shared,
+            'evictions': self.evictions,
+        }
+
+
+def cache_headers(hit: bool, timings: Optional[Dict[str, float]] = None) -> Dict[str, str]:
+    headers = {'X-Cache': 'HIT' if hit else 'MISS'}
+    if timings is not None and not hit:
+        # Stage timings only describe the request that actually ran them
+        headers['Server-Timing'] = server_timing(timings)
+    return headers
+
+
+def _disk_tier() -> Optional[DiskTier]:
+    cache_dir = env_str('PA_CACHE_DIR', '')
+    if not cache_dir:
+        return None
+    os.makedirs(cache_dir, exist_ok=True)
+    return DiskTier(os.path.join(cache_dir, 'results.sqlite3'), env_int('PA_CACHE_DISK_MB', 2048) * 1024 * 1024)
+
+
+result_cache = ResultCache(max(0, env_int('PA_CACHE_MB', 256)) * 1024 * 1024, _disk_tier())
@@ -0,0 +1,138 @@
+import os
+from typing import Dict, Tuple
+
+# Which executor each endpoint runs on. librosa and torch hold the GIL for
+# most of their work, so they get real processes; OpenCV and the Rust
+# tokenizer release the GIL and are fine on threads.
+ENDPOINT_POOLS = {
+    'process-image': 'thread',
+    'augment-image': 'thread',
+    'augment-image-batch': 'thread',
+    'process-audio': 'process',
+    'augment-audio': 'process',
+    # Streaming responses are drained chunk by chunk from the thread pool
+    'process-audio-stream': 'thread',
+    'augment-audio-stream': 'thread',
+    'process-text': 'thread',
+    'augment-text': 'thread',
+    'process-text-batch': 'thread',
+    'augment-text-batch': 'thread',
+    'upload-model': 'process',
+    'process-model': 'process',
+    'augment-model': 'process',
+    'augment-model-batch': 'thread',
+}
+
+
+MODALITIES = ('text', 'image', 'audio', 'model')
+
+
+def env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    if value is None or value.strip() == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"Ignoring invalid value for {name}: {value!r}")
+        return default
+
+
+def env_str(name: str, default: str) -> str:
+    value = os.environ.get(name)
+    return value.strip() if value and value.strip() else default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None or value.strip() == '':
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def endpoint_env_name(prefix: str, endpoint: str) -> str:
+    return f"{prefix}_{endpoint.upper().replace('-', '_')}"
+
+
+class Settings:
+    def __init__(self):
+        cpus = os.cpu_count() or 1
+
+        # Pool sizes
+        self.process_workers = max(1, env_int('PA_PROCESS_WORKERS', cpus))
+        self.thread_workers = max(1, env_int('PA_THREAD_WORKERS', cpus))
+        self.mp_start_method = env_str('PA_MP_START_METHOD', 'spawn')
+
+        # Default per-endpoint admission limits
+        self.default_queue_size = max(0, env_int('PA_QUEUE_SIZE', 16))
+
+        # Image processing: OpenCV's own thread count (0 keeps its default)
+        # and how many tiles of a large image are denoised at once
+        self.cv_threads = max(0, env_int('PA_CV_THREADS', 0))
+        self.image_tile_workers = max(1, env_int('PA_IMAGE_TILE_WORKERS', cpus))
+        # Images one /api/augment-image/batch request may carry
+        self.batch_max_images = max(1, env_int('PA_BATCH_MAX_IMAGES', 1000))
+
+        # Startup: never touch the network when offline, warm services up in
+        # the background once the server is listening, or load them at import
+        # time (for gunicorn --preload, before workers fork)
+        self.offline = env_bool('PA_OFFLINE', False)
+        self.warmup = env_bool('PA_WARMUP', True)
+        self.preload = env_bool('PA_PRELOAD', False)
+        self.tokenizer_path = env_str('PA_TOKENIZER_PATH', 'bert-base-uncased')
+
+        # Which routers the app serves; the others' libraries are never imported
+        self.modalities = self.parse_modalities(env_str('PA_MODALITIES', ','.join(MODALITIES)))
+
+    @staticmethod
+    def parse_modalities(value: str) -> Tuple[str, ...]:
+        names = [name.strip().lower() for name in value.split(',') if name.strip()]
+        for name in names:
+            if name not in MODALITIES:
+                print(f"Ignoring unknown modality {name!r}; expected one of {', '.join(MODALITIES)}")
+        return tuple(name for name in MODALITIES if name in names)
+
+    def endpoint_pool(self, endpoint: str) -> str:
+        default = ENDPOINT_POOLS.get(endpoint, 'thread')
+        pool = env_str(endpoint_env_name('PA_POOL', endpoint), default)
+        if pool not in ('thread', 'process'):
+            print(f"Unknown pool {pool!r} for {endpoint}, using {default}")
+            return default
+        return pool
+
+    def endpoint_limits(self, endpoint: str) -> Tuple[int, int]:
+        # PA_LIMIT_PROCESS_AUDIO=2:8 -> at most 2 running, 8 waiting
+        pool = self.endpoint_pool(endpoint)
+        concurrency = self.process_workers if pool == 'process' else self.thread_workers
+        queue_size = self.default_queue_size
+
+        value = os.environ.get(endpoint_env_name('PA_LIMIT', endpoint))
+        if value:
+            try:
+                parts = value.split(':')
+                concurrency = int(parts[0])
+                if len(parts) > 1:
+                    queue_size = int(parts[1])
+            except ValueError:
+                print(f"Ignoring invalid limit for {endpoint}: {value!r}")
+
+        return max(1, concurrency), max(0, queue_size)
+
+    def as_dict(self) -> Dict:
+        return {
+            'process_workers': self.process_workers,
+            'thread_workers': self.thread_workers,
+            'mp_start_method': self.mp_start_method,
+            'default_queue_size': self.default_queue_size,
+            'cv_threads': self.cv_threads,
+            'image_tile_workers': self.image_tile_workers,
+            'batch_max_images': self.batch_max_images,
+            'offline': self.offline,
+            'warmup': self.warmup,
+            'preload': self.preload,
+            'tokenizer_path': self.tokenizer_path,
+            'modalities': list(self.modalities),
+        }
+
+
+settings = Settings()
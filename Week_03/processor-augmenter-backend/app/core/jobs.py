@@ -0,0 +1,436 @@
+import asyncio
+import itertools
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from .config import env_int, env_str
+
+FINISHED = ('done', 'failed', 'cancelled')
+
+# Response headers worth replaying when a job result is downloaded
+RESULT_HEADERS = ('x-cache', 'server-timing', 'x-mesh-id')
+
+# How long a job waits before retrying when its endpoint's queue is full
+BUSY_RETRY_MAX = 5.0
+
+# How often the store is polled for jobs owned by another worker process
+# (their events) and for cancel requests made through another worker
+STORE_POLL = 1.0
+
+
+def process_token(pid: int) -> Optional[str]:
+    # "<pid>:<start time>" for a live process, None when it is gone. With
+    # /proc the start time tells a reused pid apart from the original one.
+    if os.path.isdir('/proc'):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            return f"{pid}:{fields[19]}"
+        except (FileNotFoundError, ProcessLookupError):
+            return None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return None
+    except PermissionError:
+        pass
+    return str(pid)
+
+
+def owner_alive(owner: Optional[str]) -> bool:
+    if not owner:
+        return False
+    return process_token(int(owner.split(':')[0])) == owner
+
+
+def response_parts(result: Any) -> Tuple[bytes, str, Dict[str, str]]:
+    # Jobs reuse the handlers of the synchronous endpoints, which return
+    # either a Response or a JSON-able dict
+    if isinstance(result, Response):
+        headers = {name: value for name, value in result.headers.items() if name in RESULT_HEADERS}
+        return bytes(result.body), result.media_type or 'application/octet-stream', headers
+    return json.dumps(result).encode('utf-8'), 'application/json', {}
+
+
+class Job:
+    def __init__(self, kind: str, priority: int, params: Dict, run: Callable[[], Awaitable[Any]]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.priority = priority
+        self.params = params
+        self.run = run
+        self.status = 'queued'
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.error: Optional[str] = None
+        self.message: Optional[str] = None
+        self.media_type: Optional[str] = None
+        self.size: Optional[int] = None
+        self.headers: Dict[str, str] = {}
+        self.task: Optional[asyncio.Task] = None
+        self.version = 0
+
+    def record(self) -> Dict:
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'priority': self.priority,
+            'params': self.params,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'error': self.error,
+            'message': self.message,
+            'media_type': self.media_type,
+            'size': self.size,
+            'headers': self.headers,
+        }
+
+
+class JobStore:
+    # Job records in SQLite and results as files next to it, so finished
+    # jobs survive restarts without an external broker. Every record names
+    # the process that owns it, so several worker processes (gunicorn -w N)
+    # can share one directory.
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._owner: Optional[Tuple[int, Optional[str]]] = None
+        self._db = sqlite3.connect(os.path.join(directory, 'jobs.sqlite3'), check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'id TEXT PRIMARY KEY, status TEXT NOT NULL, created REAL NOT NULL, record TEXT NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created)')
+        # Added after the first release; older databases get the columns here
+        for column in ('owner TEXT', 'cancel INTEGER NOT NULL DEFAULT 0'):
+            try:
+                self._db.execute(f'ALTER TABLE jobs ADD COLUMN {column}')
+            except sqlite3.OperationalError:
+                pass
+
+    @property
+    def owner(self) -> Optional[str]:
+        # Resolved per pid: the store may be created in a gunicorn --preload
+        # master and used by the forked workers
+        pid = os.getpid()
+        if self._owner is None or self._owner[0] != pid:
+            self._owner = (pid, process_token(pid))
+        return self._owner[1]
+
+    def save(self, record: Dict):
+        # Upsert, so a cancel request from another process isn't overwritten
+        with self._lock:
+            self._db.execute(
+                'INSERT INTO jobs (id, status, created, record, owner) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(id) DO UPDATE SET status = excluded.status, record = excluded.record, '
+                'owner = excluded.owner',
+                (record['id'], record['status'], record['created'], json.dumps(record), self.owner)
+            )
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute('SELECT record FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def recent(self, limit: int) -> List[Dict]:
+        with self._lock:
+            rows = self._db.execute('SELECT record FROM jobs ORDER BY created DESC LIMIT ?', (limit,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def result_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.result")
+
+    def write_result(self, job_id: str, data: bytes):
+        path = self.result_path(job_id)
+        with open(f"{path}.tmp", 'wb') as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+
+    def expire(self, before: float) -> int:
+        with self._lock:
+            ids = [row[0] for row in self._db.execute(
+                f"SELECT id FROM jobs WHERE created < ? AND status IN ({','.join('?' * len(FINISHED))})",
+                (before, *FINISHED)
+            )]
+            self._db.executemany('DELETE FROM jobs WHERE id = ?', [(job_id,) for job_id in ids])
+        for job_id in ids:
+            try:
+                os.remove(self.result_path(job_id))
+            except FileNotFoundError:
+                pass
+        return len(ids)
+
+    def request_cancel(self, job_id: str) -> bool:
+        # For a job owned by another process, which picks the flag up
+        with self._lock:
+            cursor = self._db.execute(
+                f"UPDATE jobs SET cancel = 1 WHERE id = ? AND status NOT IN ({','.join('?' * len(FINISHED))})",
+                (job_id, *FINISHED)
+            )
+        return cursor.rowcount > 0
+
+    def cancel_requests(self) -> List[str]:
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id FROM jobs WHERE cancel = 1 AND owner = ? AND status NOT IN ({','.join('?' * len(FINISHED))})",
+                (self.owner, *FINISHED)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def interrupt_unfinished(self):
+        # Queued and running jobs whose process is gone can't be resumed:
+        # their inputs only lived in that process. Jobs of sibling worker
+        # processes that are still running are left alone.
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT owner, record FROM jobs WHERE status NOT IN ({','.join('?' * len(FINISHED))})", FINISHED
+            ).fetchall()
+        for owner, raw in rows:
+            if owner_alive(owner):
+                continue
+            record = json.loads(raw)
+            record.update(status='failed', error='Interrupted by a server restart', finished=time.time())
+            self.save(record)
+
+
+class JobQueue:
+    # Long media jobs run in the background instead of holding a request
+    # open. Dispatchers take the highest priority job first (FIFO within a
+    # priority) and run the same handler as the synchronous endpoint, so
+    # the worker pools, their limits and the result cache all still apply.
+    def __init__(self, store: JobStore, workers: int, max_queued: int, ttl: int):
+        self.store = store
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self._jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._changed: Optional[asyncio.Condition] = None
+        self._dispatchers: List[asyncio.Task] = []
+        self._watcher: Optional[asyncio.Task] = None
+        self._order = itertools.count()
+
+        # Metrics
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    async def start(self):
+        self._queue = asyncio.PriorityQueue()
+        self._changed = asyncio.Condition()
+        await asyncio.to_thread(self.store.interrupt_unfinished)
+        await asyncio.to_thread(self.store.expire, time.time() - self.ttl)
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+        self._watcher = asyncio.create_task(self._watch_cancel_requests())
+
+    async def stop(self):
+        for job in list(self._jobs.values()):
+            if job.task is not None:
+                job.task.cancel()
+        tasks = self._dispatchers + ([self._watcher] if self._watcher is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._dispatchers = []
+        self._watcher = None
+
+    def queued(self) -> List[Job]:
+        jobs = [job for job in self._jobs.values() if job.status == 'queued']
+        return sorted(jobs, key=lambda job: (-job.priority, job.created))
+
+    def submit(self, kind: str, run: Callable[[], Awaitable[Any]], priority: int = 0,
+               params: Optional[Dict] = None) -> Dict:
+        if self._queue is None:
+            raise HTTPException(status_code=503, detail="Job queue is not running")
+        if len(self.queued()) >= self.max_queued:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Job queue is full", headers={"Retry-After": "10"})
+
+        job = Job(kind, priority, params or {}, run)
+        self._jobs[job.id] = job
+        self.store.save(job.record())
+        self._queue.put_nowait((-priority, next(self._order), job.id))
+        self.submitted += 1
+        return self.info(job.id)
+
+    def info(self, job_id: str) -> Optional[Dict]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return self.store.get(job_id)
+        record = job.record()
+        if job.status == 'queued':
+            record['position'] = next(i for i, queued in enumerate(self.queued()) if queued is job)
+        return record
+
+    def recent(self, limit: int = 50) -> List[Dict]:
+        return self.store.recent(limit)
+
+    async def cancel(self, job_id: str) -> Optional[Dict]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            # Owned by another worker process (or already finished): leave a
+            # request that the owner acts on within STORE_POLL seconds
+            await asyncio.to_thread(self.store.request_cancel, job_id)
+            return self.store.get(job_id)
+        if job.status == 'queued':
+            # The dispatcher skips it when it comes up
+            await self._finish(job, 'cancelled')
+        elif job.status == 'running' and job.task is not None:
+            # A computation already inside a worker runs to completion and
+            # keeps its endpoint slot until then; its result is dropped and
+            # the job dispatcher moves on right away
+            job.task.cancel()
+        return self.info(job_id)
+
+    async def events(self, job_id: str, keepalive: float = 15.0) -> AsyncIterator[Optional[Dict]]:
+        # Current state first, then every change until the job finishes.
+        # None is yielded when nothing happened for `keepalive` seconds.
+        seen = -1
+        while True:
+            job = self._jobs.get(job_id)
+            if job is None:
+                async for record in self._follow_store(job_id, keepalive):
+                    yield record
+                return
+            if job.version != seen:
+                seen = job.version
+                yield self.info(job_id)
+                if job.status in FINISHED:
+                    return
+                continue
+            try:
+                async with self._changed:
+                    await asyncio.wait_for(self._changed.wait_for(lambda: job.version != seen), keepalive)
+            except asyncio.TimeoutError:
+                yield None
+
+    async def _follow_store(self, job_id: str, keepalive: float) -> AsyncIterator[Optional[Dict]]:
+        # Events of a job this process doesn't run (another worker's, or one
+        # that already finished), from its stored record
+        last, quiet = None, 0.0
+        while True:
+            record = await asyncio.to_thread(self.store.get, job_id)
+            if record is None:
+                return
+            if record != last:
+                last, quiet = record, 0.0
+                yield record
+                if record['status'] in FINISHED:
+                    return
+            elif quiet >= keepalive:
+                quiet = 0.0
+                yield None
+            await asyncio.sleep(STORE_POLL)
+            quiet += STORE_POLL
+
+    async def _watch_cancel_requests(self):
+        while True:
+            await asyncio.sleep(STORE_POLL)
+            if not self._jobs:
+                continue
+            try:
+                for job_id in await asyncio.to_thread(self.store.cancel_requests):
+                    if job_id in self._jobs:
+                        await self.cancel(job_id)
+            except sqlite3.Error as e:
+                print(f"Checking job cancel requests failed: {e}")
+
+    async def _notify(self, job: Job):
+        job.version += 1
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _update(self, job: Job, **fields):
+        for name, value in fields.items():
+            setattr(job, name, value)
+        await asyncio.to_thread(self.store.save, job.record())
+        await self._notify(job)
+
+    async def _finish(self, job: Job, status: str, **fields):
+        await self._update(job, status=status, finished=time.time(), **fields)
+        self._jobs.pop(job.id, None)
+        if status == 'done':
+            self.completed += 1
+        elif status == 'failed':
+            self.failed += 1
+        else:
+            self.cancelled += 1
+
+    async def _dispatch(self):
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None or job.status != 'queued':
+                continue
+            job.task = asyncio.create_task(self._execute(job))
+            await asyncio.wait([job.task])
+            if len(self.queued()) == 0:
+                await asyncio.to_thread(self.store.expire, time.time() - self.ttl)
+
+    async def _execute(self, job: Job):
+        await self._update(job, status='running', started=time.time())
+        try:
+            while True:
+                try:
+                    result = await job.run()
+                    break
+                except HTTPException as e:
+                    if e.status_code != 503:
+                        raise
+                    # The endpoint's own queue is full: wait for room instead
+                    # of failing a job that was already accepted
+                    retry = min(float((e.headers or {}).get('Retry-After', 1)), BUSY_RETRY_MAX)
+                    await self._update(job, message=f"Waiting for a worker: {e.detail}")
+                    await asyncio.sleep(retry)
+
+            data, media_type, headers = response_parts(result)
+            await asyncio.to_thread(self.store.write_result, job.id, data)
+            await self._finish(job, 'done', media_type=media_type, size=len(data), headers=headers, message=None)
+        except asyncio.CancelledError:
+            await asyncio.shield(self._finish(job, 'cancelled', message=None))
+        except HTTPException as e:
+            await self._finish(job, 'failed', error=str(e.detail), message=None)
+        except Exception as e:
+            print(f"Job {job.id} ({job.kind}) failed: {e}")
+            await self._finish(job, 'failed', error=str(e), message=None)
+
+    def stats(self) -> Dict:
+        running = [job for job in self._jobs.values() if job.status == 'running']
+        return {
+            'workers': self.workers,
+            'max_queued': self.max_queued,
+            'ttl_seconds': self.ttl,
+            'directory': self.store.directory,
+            'queued': len(self.queued()),
+            'running': len(running),
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'cancelled': self.cancelled,
+            'rejected': self.rejected,
+        }
+
+
+job_queue = JobQueue(
+    JobStore(env_str('PA_JOBS_DIR', os.path.join(tempfile.gettempdir(), 'pa-jobs'))),
+    workers=env_int('PA_JOB_WORKERS', 2),
+    max_queued=env_int('PA_JOB_QUEUE', 100),
+    ttl=env_int('PA_JOB_TTL', 3600),
+)
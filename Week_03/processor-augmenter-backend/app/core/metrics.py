@@ -0,0 +1,258 @@
+import bisect
+import mmap
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .config import env_str
+from .timing import server_timing
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Upper bounds in seconds, from sub-millisecond stages to minute-long jobs
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Input size classes for the `size` label: a handful of upper bounds keeps
+# the number of series small no matter what clients upload
+SIZE_CLASSES = (
+    (100 * 1024, '100KB'),
+    (1024 * 1024, '1MB'),
+    (10 * 1024 * 1024, '10MB'),
+    (100 * 1024 * 1024, '100MB'),
+)
+
+# off: never send Server-Timing; request: only when the request carries
+# X-Server-Timing: 1; always: on every response
+SERVER_TIMING_MODES = ('off', 'request', 'always')
+
+# Stage durations of the current request's worker calls, set by
+# MetricsMiddleware when the client asked for Server-Timing
+_request_trace: ContextVar[Optional[Dict[str, float]]] = ContextVar('pa_request_trace', default=None)
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    # Prometheus histogram with fixed buckets. observe() is a bisect and a
+    # few additions under a lock, cheap enough for every stage of every call.
+    def __init__(self, name: str, help_text: str, labels: Sequence[str],
+                 buckets: Sequence[float] = DURATION_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> per-bucket counts (last one is +Inf), then the sum
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        bounds = self.buckets + (float('inf'),)
+        for labels, series in items:
+            count = 0
+            for bound, n in zip(bounds, series[:-1]):
+                count += n
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, labels, le)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {series[-1]!r}")
+            lines.append(f"{self.name}_count{_labels(self.labels, labels)} {count}")
+        return lines
+
+
+class MaxGauge:
+    # Highest value seen per label set, e.g. peak memory
+    def __init__(self, name: str, help_text: str, labels: Sequence[str]):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def update(self, value: float, *labels: str):
+        with self._lock:
+            if value > self._values.get(labels, float('-inf')):
+                self._values[labels] = value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return family(self.name, self.help, 'gauge', [(dict(zip(self.labels, labels)), value) for labels, value in items])
+
+
+def family(name: str, help_text: str, kind: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> List[str]:
+    # One metric family in the text exposition format
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(list(labels), list(labels.values()))} {_number(value)}")
+    return lines
+
+
+def size_class(size: Optional[int]) -> str:
+    if size is None:
+        return 'unknown'
+    for bound, label in SIZE_CLASSES:
+        if size <= bound:
+            return label
+    return '+Inf'
+
+
+def input_size(args: Iterable) -> Optional[int]:
+    # Bytes of the payload arguments of a service call: uploads, text and
+    # arrays, also inside a dict such as model_data. None when nothing
+    # measurable was passed (e.g. a model as nested JSON lists).
+    total = None
+    for value in args:
+        if isinstance(value, (bytes, bytearray, memoryview, mmap.mmap)):
+            size = len(value)
+        elif isinstance(value, str):
+            size = len(value)
+        elif isinstance(value, dict):
+            size = input_size(value.values())
+        else:
+            size = getattr(value, 'nbytes', None)
+        if size is not None:
+            total = (total or 0) + size
+    return total
+
+
+def peak_rss() -> Optional[int]:
+    # Peak resident set size of this process in bytes. One getrusage call;
+    # in a process-pool worker it is that worker's own high-water mark.
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Metrics:
+    def __init__(self, server_timing_mode: str = 'request'):
+        self.server_timing_mode = server_timing_mode if server_timing_mode in SERVER_TIMING_MODES else 'request'
+        self.stage_seconds = Histogram(
+            'pa_stage_duration_seconds',
+            'Time spent in each stage of a service call; stage="total" is the whole call',
+            ('endpoint', 'stage', 'size')
+        )
+        self.request_seconds = Histogram(
+            'pa_request_duration_seconds',
+            'HTTP request latency until the response body is complete',
+            ('method', 'route', 'status')
+        )
+        self.peak_rss = MaxGauge(
+            'pa_worker_peak_rss_bytes',
+            'Highest peak RSS of a worker (thread pool: the server process) after a call',
+            ('endpoint',)
+        )
+
+    def observe_call(self, endpoint: str, timings: Dict[str, float], size: Optional[int] = None,
+                     peak: Optional[int] = None):
+        label = size_class(size)
+        for name, seconds in timings.items():
+            self.stage_seconds.observe(seconds, endpoint, name, label)
+        if peak is not None:
+            self.peak_rss.update(peak, endpoint)
+        trace = _request_trace.get()
+        if trace is not None:
+            for name, seconds in timings.items():
+                trace[name] = trace.get(name, 0.0) + seconds
+
+    def render(self, extra: Iterable[str] = ()) -> str:
+        lines = self.stage_seconds.render() + self.request_seconds.render() + self.peak_rss.render()
+        lines.extend(extra)
+        return '\n'.join(lines) + '\n'
+
+
+def route_template(scope) -> str:
+    # Path template of the matched route ("/api/jobs/{job_id}"), so ids don't
+    # become labels. Newer FastAPI keeps included routes unprefixed and
+    # records the effective path separately.
+    effective = scope.get('fastapi', {}).get('effective_route_context')
+    path = getattr(effective, 'path', None) or getattr(scope.get('route'), 'path', None)
+    return path or 'unmatched'
+
+
+class MetricsMiddleware:
+    # Records request latency per route template and status, and handles
+    # Server-Timing: stripped unless the client opted in (or
+    # PA_SERVER_TIMING=always), otherwise filled with the stages of the
+    # request's worker calls plus a "request" entry for the whole handler.
+    def __init__(self, app, registry: Optional['Metrics'] = None):
+        self.app = app
+        self.metrics = registry or metrics
+
+    def wants_timing(self, scope) -> bool:
+        mode = self.metrics.server_timing_mode
+        if mode != 'request':
+            return mode == 'always'
+        for name, value in scope['headers']:
+            if name == b'x-server-timing':
+                return value.strip().lower() in (b'1', b'true', b'yes', b'on')
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        trace = {} if self.wants_timing(scope) else None
+        token = _request_trace.set(trace)
+        status = 500
+
+        async def timed_send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                headers = message.get('headers', [])
+                existing = [value for name, value in headers if name.lower() == b'server-timing']
+                if trace is not None:
+                    value = existing[0].decode('latin-1') if existing else server_timing(trace)
+                    request = server_timing({'request': time.perf_counter() - start})
+                    headers = [(name, value) for name, value in headers if name.lower() != b'server-timing']
+                    value = f"{value}, {request}" if value else request
+                    headers.append((b'server-timing', value.encode('latin-1')))
+                    message = {**message, 'headers': headers}
+                elif existing:
+                    headers = [(name, value) for name, value in headers if name.lower() != b'server-timing']
+                    message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            _request_trace.reset(token)
+            self.metrics.request_seconds.observe(
+                time.perf_counter() - start, scope['method'], route_template(scope), str(status)
+            )
+
+
+metrics = Metrics(env_str('PA_SERVER_TIMING', 'request'))
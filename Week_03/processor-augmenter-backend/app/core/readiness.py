@@ -0,0 +1,87 @@
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+# Wall-clock reference for cold-start reporting: this module is imported
+# while the app itself is being imported
+PROCESS_STARTED = time.time()
+
+
+class Component:
+    def __init__(self, name: str, loader: Callable[[], Dict]):
+        self.name = name
+        self.loader = loader
+        self.status = 'pending'
+        self.seconds: Optional[float] = None
+        self.detail: Dict = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        # The loader returns details; a "degraded" key marks a component that
+        # works with reduced features (e.g. offline without a cached tokenizer)
+        with self._lock:
+            if self.status != 'pending':
+                return
+            self.status = 'loading'
+            start = time.perf_counter()
+            try:
+                self.detail = self.loader() or {}
+                self.status = 'degraded' if self.detail.get('degraded') else 'ready'
+            except Exception as e:
+                print(f"Warmup of {self.name} failed: {e}")
+                self.detail = {'error': str(e)}
+                self.status = 'failed'
+            self.seconds = time.perf_counter() - start
+
+    def stats(self) -> Dict:
+        return {'status': self.status, 'seconds': self.seconds, **self.detail}
+
+
+class Readiness:
+    # Services register their heavy initialisation here instead of running
+    # it in __init__. It runs once: at import time (PA_PRELOAD), in the
+    # background after startup (PA_WARMUP), or lazily on the first request.
+    def __init__(self):
+        self.components: Dict[str, Component] = {}
+        self.app_ready_at: Optional[float] = None
+        self.warm_at: Optional[float] = None
+
+    def register(self, name: str, loader: Callable[[], Dict]) -> Component:
+        component = Component(name, loader)
+        self.components[name] = component
+        return component
+
+    def load(self, name: str):
+        self.components[name].load()
+
+    def warmup_all(self):
+        for component in list(self.components.values()):
+            component.load()
+        if self.warm_at is None:
+            self.warm_at = time.time()
+            print(f"Warmup finished {self.warm_at - PROCESS_STARTED:.2f}s after import")
+
+    def mark_app_ready(self):
+        self.app_ready_at = time.time()
+
+    @property
+    def ready(self) -> bool:
+        # Degraded components still serve requests; failed ones don't
+        return all(c.status in ('ready', 'degraded') for c in self.components.values())
+
+    @property
+    def failed(self) -> bool:
+        return any(c.status == 'failed' for c in self.components.values())
+
+    def stats(self) -> Dict:
+        return {
+            'ready': self.ready,
+            'startup': {
+                'app_ready_seconds': None if self.app_ready_at is None else self.app_ready_at - PROCESS_STARTED,
+                'warm_seconds': None if self.warm_at is None else self.warm_at - PROCESS_STARTED,
+            },
+            'components': {name: c.stats() for name, c in self.components.items()},
+        }
+
+
+readiness = Readiness()
@@ -0,0 +1,66 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Tuple
+
+# Stage durations for the call currently being timed. Unset (None) outside
+# collect(), which makes stage() a no-op for untimed calls.
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar('pa_timings', default=None)
+
+
+@contextmanager
+def stage(name: str):
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+@contextmanager
+def collect():
+    timings: Dict[str, float] = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def timed_call(func: Callable, *args, **kwargs) -> Tuple[object, Dict[str, float]]:
+    # Runs inside the worker (thread or process) so the stages recorded by
+    # the service come back with the result
+    with collect() as timings:
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        timings['total'] = time.perf_counter() - start
+    return result, timings
+
+
+def timed_next(iterator, default, timings: Dict[str, float]):
+    # next() with the stages of this chunk added to timings; streamed
+    # responses are pulled one chunk per executor call
+    token = _timings.set(timings)
+    try:
+        return next(iterator, default)
+    finally:
+        _timings.reset(token)
+
+
+def timed_apply(func: Callable, item, timings: Dict[str, float]):
+    # func(item) with its stages added to timings, for streams whose work
+    # items arrive from the event loop rather than from an iterator
+    token = _timings.set(timings)
+    try:
+        return func(item)
+    finally:
+        _timings.reset(token)
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    # Server-Timing header value, durations in milliseconds
+    return ', '.join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
@@ -0,0 +1,171 @@
+import io
+import json
+import mmap
+from typing import Optional, Union
+
+from fastapi import HTTPException, UploadFile
+
+from .config import endpoint_env_name, env_int
+
+# Default body limits in MB by the first key an endpoint name contains;
+# PA_MAX_UPLOAD_<ENDPOINT> overrides one endpoint, PA_MAX_UPLOAD_MB the rest
+UPLOAD_LIMITS_MB = {
+    'image-batch': 500,
+    'image': 50,
+    'audio': 200,
+    'model': 200,
+    'text': 20,
+}
+
+# (family, format, magic bytes, offset of the magic)
+SIGNATURES = [
+    ('image', 'png', b'\x89PNG\r\n\x1a\n', 0),
+    ('image', 'jpeg', b'\xff\xd8\xff', 0),
+    ('image', 'gif', b'GIF8', 0),
+    ('image', 'bmp', b'BM', 0),
+    ('image', 'tiff', b'II*\x00', 0),
+    ('image', 'tiff', b'MM\x00*', 0),
+    ('image', 'webp', b'WEBP', 8),
+    ('image', 'avif', b'ftypavif', 4),
+    ('audio', 'wav', b'WAVE', 8),
+    ('audio', 'flac', b'fLaC', 0),
+    ('audio', 'ogg', b'OggS', 0),
+    ('audio', 'mp3', b'ID3', 0),
+    ('audio', 'aiff', b'FORM', 0),
+    ('audio', 'm4a', b'ftypM4A', 4),
+    ('model', 'off', b'OFF', 0),
+    ('model', 'npz', b'PK\x03\x04', 0),
+    ('model', 'ply', b'ply', 0),
+]
+
+Buffer = Union[bytes, memoryview, mmap.mmap]
+
+
+class UploadTooLarge(HTTPException):
+    def __init__(self, limit: int):
+        super().__init__(status_code=413, detail=f"Upload exceeds the {limit // (1024 * 1024)} MB limit")
+
+
+def endpoint_for_path(path: str, prefix: str = '/api/') -> Optional[str]:
+    # /api/process-audio/stream -> process-audio-stream, the name the pools use
+    if not path.startswith(prefix):
+        return None
+    return path[len(prefix):].strip('/').replace('/', '-')
+
+
+def upload_limit(endpoint: str) -> int:
+    default = env_int('PA_MAX_UPLOAD_MB', 100)
+    for modality, limit in UPLOAD_LIMITS_MB.items():
+        if modality in endpoint:
+            default = limit
+            break
+    return env_int(endpoint_env_name('PA_MAX_UPLOAD', endpoint), default) * 1024 * 1024
+
+
+def sniff_format(head: bytes) -> Optional[tuple]:
+    # (family, format) from the first bytes, or None when unrecognised
+    for family, fmt, magic, offset in SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            return family, fmt
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        return 'audio', 'mp3'  # MPEG frame sync without an ID3 tag
+    return None
+
+
+class UploadLimitMiddleware:
+    # Rejects request bodies over the endpoint's limit while they arrive:
+    # a declared Content-Length is checked before anything is read, and
+    # the bytes actually received are counted for chunked uploads, so an
+    # oversized body is never spooled in full.
+    def __init__(self, app, prefix: str = '/api/'):
+        self.app = app
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] not in ('POST', 'PUT', 'PATCH'):
+            return await self.app(scope, receive, send)
+        endpoint = endpoint_for_path(scope['path'], self.prefix)
+        if endpoint is None:
+            return await self.app(scope, receive, send)
+
+        limit = upload_limit(endpoint)
+        headers = dict(scope['headers'])
+        declared = headers.get(b'content-length')
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            return await self._reject(send, limit)
+
+        received = 0
+        started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > limit:
+                    raise UploadTooLarge(limit)
+            return message
+
+        async def tracking_send(message):
+            nonlocal started
+            if message['type'] == 'http.response.start':
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except UploadTooLarge:
+            # Normally FastAPI turns it into a 413 itself; this covers
+            # bodies read outside a route
+            if started:
+                raise
+            await self._reject(send, limit)
+
+    async def _reject(self, send, limit: int):
+        body = json.dumps({'detail': UploadTooLarge(limit).detail}).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': 413,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                        (b'connection', b'close')],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def read_upload(upload: UploadFile, family: Optional[str] = None) -> Buffer:
+    # The upload's bytes without another full copy. Starlette spools
+    # uploads over 1 MB to a temporary file, which is memory-mapped here;
+    # smaller ones are still in memory and are simply read. Mapped
+    # pages are file-backed, so the kernel can drop them instead of the
+    # process holding a private copy, and they stay valid after the upload
+    # is closed (e.g. for queued jobs).
+    # Process-pool calls copy the buffer once when it is pickled.
+    spool = upload.file
+    spool.seek(0)
+    head = spool.read(16)
+    sniffed = sniff_format(head)
+    if not head:
+        raise HTTPException(status_code=400, detail="Empty upload")
+    if family is not None and sniffed is not None and sniffed[0] != family:
+        # Formats nobody recognises go on to the decoder; only clear
+        # mismatches (e.g. a PNG sent to an audio endpoint) stop here
+        raise HTTPException(
+            status_code=415,
+            detail=f"Expected {family} data, got {sniffed[1].upper()}"
+        )
+
+    # A SpooledTemporaryFile keeps its BytesIO or temporary file in _file;
+    # anything without a real descriptor behind it (a BytesIO, a spool not
+    # rolled over yet, other Starlette versions) is read instead
+    raw = getattr(spool, '_file', spool)
+    try:
+        fileno = raw.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        fileno = None
+    if fileno is not None:
+        try:
+            return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            pass  # e.g. a pipe, which can't be mapped
+    spool.seek(0)
+    return spool.read()
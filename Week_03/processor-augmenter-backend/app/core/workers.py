@@ -0,0 +1,373 @@
+import asyncio
+import functools
+import inspect
+import math
+import mmap
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from .config import settings
+from .metrics import input_size, metrics, peak_rss
+from .timing import timed_apply, timed_call, timed_next
+
+# Service instances living inside worker processes, one per class
+_worker_services: Dict[type, Any] = {}
+
+
+def _invoke(service_cls: Optional[type], func: Any, args: tuple, kwargs: dict):
+    # Runs inside a pool process. Bound methods are shipped as
+    # (class, method name) so the service is built once per process instead
+    # of being pickled with every call. Every call is timed by stage and
+    # returns (result, timings, peak RSS) for the metrics.
+    if service_cls is not None:
+        service = _worker_services.get(service_cls)
+        if service is None:
+            service = service_cls()
+            _worker_services[service_cls] = service
+        func = getattr(service, func)
+    result, timings = timed_call(func, *args, **kwargs)
+    return result, timings, peak_rss()
+
+
+def _picklable(value: Any) -> Any:
+    # Zero-copy upload buffers (memoryview, mmap) can't cross a process
+    # boundary; this is the one copy the pickling needs anyway
+    if isinstance(value, (memoryview, mmap.mmap)):
+        return bytes(value)
+    return value
+
+
+def _portable(func: Callable):
+    if inspect.ismethod(func) and not inspect.isclass(func.__self__):
+        return type(func.__self__), func.__name__
+    return None, func
+
+
+class EndpointLimiter:
+    def __init__(self, name: str, pool: str, concurrency: int, max_queue: int):
+        self.name = name
+        self.pool = pool
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+        # Metrics
+        self.active = 0
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.run_seconds_total = 0.0
+
+    def retry_after(self) -> int:
+        # Rough estimate of how long the current backlog takes to drain
+        finished = self.completed + self.failed
+        avg_run = self.run_seconds_total / finished if finished else 1.0
+        backlog = (self.queued + self.active) / self.concurrency
+        return max(1, math.ceil(avg_run * backlog))
+
+    async def acquire(self):
+        if self._semaphore.locked() and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail=f"Server busy: {self.name} queue is full",
+                headers={"Retry-After": str(self.retry_after())}
+            )
+
+        self.queued += 1
+        start = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        waited = time.perf_counter() - start
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        self.active += 1
+        return time.perf_counter()
+
+    def release(self, started: float, failed: bool = False):
+        if failed:
+            self.failed += 1
+        else:
+            self.completed += 1
+        self.run_seconds_total += time.perf_counter() - started
+        self.active -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict:
+        admitted = self.completed + self.failed + self.active
+        return {
+            'pool': self.pool,
+            'concurrency': self.concurrency,
+            'max_queue': self.max_queue,
+            'active': self.active,
+            'queued': self.queued,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'wait_seconds_avg': self.wait_seconds_total / admitted if admitted else 0.0,
+            'wait_seconds_max': self.wait_seconds_max,
+            'run_seconds_total': self.run_seconds_total,
+        }
+
+
+class WorkerPool:
+    def __init__(self):
+        self._limiters: Dict[str, EndpointLimiter] = {}
+        self._thread_executor: Optional[ThreadPoolExecutor] = None
+        self._process_executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def limiter(self, endpoint: str) -> EndpointLimiter:
+        limiter = self._limiters.get(endpoint)
+        if limiter is None:
+            concurrency, max_queue = settings.endpoint_limits(endpoint)
+            limiter = EndpointLimiter(endpoint, settings.endpoint_pool(endpoint), concurrency, max_queue)
+            self._limiters[endpoint] = limiter
+        return limiter
+
+    def thread_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._thread_executor is None:
+                self._thread_executor = ThreadPoolExecutor(
+                    max_workers=settings.thread_workers,
+                    thread_name_prefix='pa-worker'
+                )
+            return self._thread_executor
+
+    def process_executor(self) -> ProcessPoolExecutor:
+        # Created on first use so deployments that never touch audio or
+        # models don't pay for idle worker processes
+        with self._lock:
+            if self._process_executor is None:
+                self._process_executor = ProcessPoolExecutor(
+                    max_workers=settings.process_workers,
+                    mp_context=multiprocessing.get_context(settings.mp_start_method)
+                )
+            return self._process_executor
+
+    def _reset_process_executor(self, broken: ProcessPoolExecutor):
+        with self._lock:
+            if self._process_executor is broken:
+                self._process_executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, endpoint: str, func: Callable, *args, **kwargs):
+        return await self._run(endpoint, func, args, kwargs, timed=False)
+
+    async def run_timed(self, endpoint: str, func: Callable, *args, **kwargs):
+        # Like run(), but returns (result, timings) with the stages the
+        # service recorded through core.timing.stage()
+        return await self._run(endpoint, func, args, kwargs, timed=True)
+
+    async def _run(self, endpoint: str, func: Callable, args: tuple, kwargs: dict, timed: bool):
+        limiter = self.limiter(endpoint)
+        size = input_size(args)
+        started = await limiter.acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            executor = self.process_executor() if limiter.pool == 'process' else self.thread_executor()
+            if limiter.pool == 'process':
+                service_cls, target = _portable(func)
+                args = tuple(_picklable(arg) for arg in args)
+                kwargs = {name: _picklable(value) for name, value in kwargs.items()}
+                call = functools.partial(_invoke, service_cls, target, args, kwargs)
+            else:
+                call = functools.partial(_invoke, None, func, args, kwargs)
+            future = loop.run_in_executor(executor, call)
+        except BaseException:
+            limiter.release(started, failed=True)
+            raise
+
+        # The slot belongs to the computation, not to the caller: a cancelled
+        # request or job stops waiting, but the slot is only freed once the
+        # executor is done, so cancelling and resubmitting can't push work
+        # past the endpoint's concurrency limit
+        future.add_done_callback(
+            lambda done: limiter.release(started, failed=done.cancelled() or done.exception() is not None)
+        )
+        try:
+            result, timings, peak = await asyncio.shield(future)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); start a fresh pool for the next request
+            self._reset_process_executor(executor)
+            raise
+
+        metrics.observe_call(endpoint, timings, size, peak)
+        return (result, timings) if timed else result
+
+    async def stream(self, endpoint: str, iterator: Iterator, size: Optional[int] = None,
+                     cleanup: Optional[Callable[[], None]] = None) -> 'PooledStream':
+        # Admission happens here, before any response bytes are sent, so a
+        # full queue still turns into a clean 503. The slot is then held
+        # while the thread pool drains the iterator chunk by chunk, and
+        # released by the returned stream (serve it with
+        # PooledStreamingResponse so that happens on every exit path).
+        limiter = self.limiter(endpoint)
+        started = await limiter.acquire()
+        return PooledStream(limiter, started, iterator, self.thread_executor(), size, cleanup)
+
+    async def stream_map(self, endpoint: str, items: AsyncIterator, func: Callable[[Any], bytes]) -> 'PooledMapStream':
+        # Like stream(), for work that arrives while the response is being
+        # sent (e.g. batches parsed from a request body still uploading):
+        # items are awaited on the event loop and func(item) runs on the
+        # thread pool, so no thread waits on the network
+        limiter = self.limiter(endpoint)
+        started = await limiter.acquire()
+        return PooledMapStream(limiter, started, items, func, self.thread_executor())
+
+    def stats(self) -> Dict:
+        return {
+            'settings': settings.as_dict(),
+            'endpoints': {name: limiter.stats() for name, limiter in self._limiters.items()},
+        }
+
+    def shutdown(self):
+        with self._lock:
+            thread_executor, self._thread_executor = self._thread_executor, None
+            process_executor, self._process_executor = self._process_executor, None
+        if thread_executor is not None:
+            thread_executor.shutdown(wait=False, cancel_futures=True)
+        if process_executor is not None:
+            process_executor.shutdown(wait=True, cancel_futures=True)
+
+
+class PooledStream:
+    # Async iterator over a blocking chunk iterator that owns an endpoint
+    # slot. The slot, the iterator and `cleanup` (e.g. removing a temp file)
+    # are released exactly once: when the stream ends or fails, or when
+    # aclose() is called. Unlike an async generator's finally, aclose()
+    # also works when iteration never started, e.g. when the client
+    # disconnects before the first chunk.
+    def __init__(self, limiter: EndpointLimiter, started: float, iterator: Iterator,
+                 executor: ThreadPoolExecutor, size: Optional[int] = None,
+                 cleanup: Optional[Callable[[], None]] = None):
+        self._limiter = limiter
+        self._started = started
+        self._iterator = iterator
+        self._executor = executor
+        self._size = size
+        self._cleanup = cleanup
+        self._timings: Dict[str, float] = {}
+        self._pending: Optional[Future] = None
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._closed:
+            raise StopAsyncIteration
+        done = object()
+        self._pending = self._executor.submit(timed_next, self._iterator, done, self._timings)
+        try:
+            chunk = await asyncio.wrap_future(self._pending)
+        except BaseException:
+            await self.aclose()
+            raise
+        if chunk is done:
+            await self.aclose(failed=False)
+            raise StopAsyncIteration
+        return chunk
+
+    async def aclose(self, failed: bool = True):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            # A chunk still being produced (the request was cancelled while
+            # waiting for it) must finish before the iterator can be closed
+            if self._pending is not None and not self._pending.done():
+                await asyncio.wait([asyncio.wrap_future(self._pending)])
+            close = getattr(self._iterator, 'close', None)
+            if close is not None:
+                await asyncio.get_running_loop().run_in_executor(self._executor, close)
+        finally:
+            try:
+                if self._cleanup is not None:
+                    self._cleanup()
+            finally:
+                self._limiter.release(self._started, failed=failed)
+                if not failed:
+                    # total includes time spent waiting on the client between chunks
+                    self._timings['total'] = time.perf_counter() - self._started
+                    metrics.observe_call(self._limiter.name, self._timings, self._size, peak_rss())
+
+
+class PooledMapStream(PooledStream):
+    # A PooledStream over func(item) for items of an async iterator. The
+    # input size for the metrics is added up as the items arrive.
+    def __init__(self, limiter: EndpointLimiter, started: float, items: AsyncIterator,
+                 func: Callable[[Any], bytes], executor: ThreadPoolExecutor):
+        super().__init__(limiter, started, iter(()), executor)
+        self._items = items
+        self._func = func
+
+    async def __anext__(self):
+        if self._closed:
+            raise StopAsyncIteration
+        try:
+            item = await self._items.__anext__()
+        except StopAsyncIteration:
+            await self.aclose(failed=False)
+            raise
+        except BaseException:
+            await self.aclose()
+            raise
+        self._size = (self._size or 0) + (input_size(item) or 0)
+        self._pending = self._executor.submit(timed_apply, self._func, item, self._timings)
+        try:
+            return await asyncio.wrap_future(self._pending)
+        except BaseException:
+            await self.aclose()
+            raise
+
+    async def aclose(self, failed: bool = True):
+        if self._closed:
+            return
+        try:
+            close = getattr(self._items, 'aclose', None)
+            if close is not None:
+                await close()
+        finally:
+            await super().aclose(failed)
+
+
+class PooledStreamingResponse(StreamingResponse):
+    # Closes a PooledStream however the response ends: Starlette neither
+    # iterates nor closes the body when the client is gone before it starts
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            close = getattr(self.body_iterator, 'aclose', None)
+            if close is not None:
+                await close()
+
+
+class DuplexStreamingResponse(PooledStreamingResponse):
+    # For bodies that read the request while the response is sent. Before
+    # ASGI spec 2.4 Starlette listens for disconnects on the receive channel
+    # while streaming, which would swallow request body messages, so the
+    # listener only starts once `input_done` is set.
+    def __init__(self, content, input_done: asyncio.Event, **kwargs):
+        super().__init__(content, **kwargs)
+        self.input_done = input_done
+
+    async def listen_for_disconnect(self, receive):
+        await self.input_done.wait()
+        await super().listen_for_disconnect(receive)
+
+
+worker_pool = WorkerPool()
@@ -1,8 +1,40 @@
+import asyncio
+import importlib
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import text_router, image_router, audio_router, model_router
+from .core.config import settings
+from .core.readiness import readiness
+from .core.uploads import UploadLimitMiddleware
+from .core.metrics import MetricsMiddleware
+from .core.jobs import job_queue
+from .core.workers import worker_pool
+from .routers import jobs_router, metrics_router, system_router
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    readiness.mark_app_ready()
+    warmup = None
+    if settings.warmup and not readiness.ready:
+        # Load in the background: the server answers right away and
+        # /api/ready reports progress until everything is warm
+        warmup = asyncio.create_task(asyncio.to_thread(readiness.warmup_all))
+    await job_queue.start()
+    yield
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+    await job_queue.stop()
+    worker_pool.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+# Per-endpoint upload size limits, enforced while the body arrives. Added
+# first so CORS wraps it and browsers can read the 413.
+app.add_middleware(UploadLimitMiddleware)
+
+# Request latency histograms and opt-in Server-Timing; outside the upload
+# limit so rejected uploads are counted too
+app.add_middleware(MetricsMiddleware)
 
 # Configure CORS
 app.add_middleware(
@@ -14,8 +46,15 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
-# Add routers
-app.include_router(text_router.router, prefix="/api")
-app.include_router(image_router.router, prefix="/api")
-app.include_router(audio_router.router, prefix="/api")
-app.include_router(model_router.router, prefix="/api")
\ No newline at end of file
+# Add routers; only enabled modalities are imported (PA_MODALITIES)
+for modality in settings.modalities:
+    module = importlib.import_module(f".routers.{modality}_router", __package__)
+    app.include_router(module.router, prefix="/api")
+app.include_router(jobs_router.router, prefix="/api")
+app.include_router(system_router.router, prefix="/api")
+app.include_router(metrics_router.router)
+
+# gunicorn --preload imports the app once in the master, so loading here
+# is shared by every forked worker
+if settings.preload:
+    readiness.warmup_all()
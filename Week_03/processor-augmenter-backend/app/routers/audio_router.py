@@ -1,7 +1,16 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Depends
 from fastapi.responses import Response, JSONResponse
 from ..services.audio_service import AudioService
+from ..core.workers import PooledStreamingResponse, worker_pool
+from ..core.cache import result_cache, cache_headers
+from ..core.jobs import job_queue
+from ..core.uploads import read_upload
+from ..services.mfcc_render import encode_npy
+from ..services.audio_pipeline import AudioDecodeError, parse_stages
+from typing import Dict
 import base64
+import os
+import tempfile
 
 router = APIRouter()
 audio_service = AudioService()
@@ -9,24 +18,235 @@ audio_service = AudioService()
 def bytes_to_base64(bytes_data):
     return base64.b64encode(bytes_data).decode('utf-8')
 
+def effect_options(
+    voices: int = Query(3, ge=0, le=8),
+    chorus_delay: float = Query(0.02, ge=0, le=0.1),
+    chorus_step: float = Query(0.01, ge=0, le=0.05),
+    chorus_depth: float = Query(0.002, ge=0, le=0.01),
+    chorus_mix: float = Query(0.5, ge=0, le=1),
+    reverb_delay: float = Query(0.1, gt=0, le=1),
+    decay: float = Query(0.3, ge=0, lt=1),
+    taps: int = Query(3, ge=0, le=16),
+    wet: float = Query(0.3, ge=0, le=1),
+    hpss_margin: float = Query(1.0, ge=0, le=16)
+) -> Dict:
+    # Chorus, reverb and harmonic-separation settings shared by both augment
+    # endpoints. librosa needs a margin of at least 1; anything lower skips
+    # harmonic separation.
+    return {
+        "voices": voices,
+        "chorus_delay": chorus_delay,
+        "chorus_step": chorus_step,
+        "chorus_depth": chorus_depth,
+        "chorus_mix": chorus_mix,
+        "reverb_delay": reverb_delay,
+        "decay": decay,
+        "taps": taps,
+        "wet": wet,
+        "hpss_margin": hpss_margin if hpss_margin >= 1 else 0.0,
+    }
+
+def mfcc_fields(result, mfcc):
+    # plot: PNG data URL; json: nested lists; npy: float32 .npy data URL
+    # (np.load on the decoded bytes gives the coefficient x frame matrix)
+    if mfcc == 'none':
+        return {}
+    fields = {"mfcc_range": result['mfcc_range']}
+    if mfcc == 'plot':
+        fields["mfcc_plot"] = f"data:image/png;base64,{bytes_to_base64(result['mfcc_plot'])}"
+        return fields
+    matrix = result['mfcc']
+    fields["mfcc_shape"] = list(matrix.shape)
+    fields["mfcc_sr"] = result['mfcc_sr']
+    if mfcc == 'json':
+        fields["mfcc"] = matrix.tolist()
+    else:
+        fields["mfcc"] = f"data:application/x-npy;base64,{bytes_to_base64(encode_npy(matrix))}"
+    return fields
+
+async def save_upload(upload: UploadFile) -> str:
+    # Copy the upload to a named file in chunks so soundfile can open it
+    # (twice, for the resampling reader) without holding it in memory
+    suffix = os.path.splitext(upload.filename or '')[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        while True:
+            chunk = await upload.read(1 << 20)
+            if not chunk:
+                break
+            tmp.write(chunk)
+    return tmp.name
+
+async def stream_audio(endpoint, path, start_stream):
+    try:
+        chunks = start_stream(path)
+    except RuntimeError as e:
+        os.remove(path)
+        raise HTTPException(status_code=415, detail=f"Streaming needs a format libsndfile can read: {e}")
+    except Exception:
+        os.remove(path)
+        raise
+
+    try:
+        # The stream removes the file once it is finished or abandoned
+        body = await worker_pool.stream(endpoint, chunks, os.path.getsize(path), cleanup=lambda: os.remove(path))
+    except Exception:
+        os.remove(path)
+        raise
+    return PooledStreamingResponse(body, media_type="audio/wav")
+
+def check_knee(threshold: float, knee: float):
+    # The soft knee spans threshold +- knee/2 and has to stay above silence
+    if knee > 2 * threshold:
+        raise HTTPException(status_code=400, detail="knee may be at most twice the threshold")
+
+def process_options(
+    threshold: float = Query(0.1, gt=0),
+    ratio: float = Query(4.0, ge=1),
+    knee: float = Query(0.0, ge=0),
+    attack_ms: float = Query(0.0, ge=0),
+    release_ms: float = Query(0.0, ge=0),
+    mfcc: str = Query("plot", pattern="^(plot|json|npy|none)$"),
+    stages: str = Query("resample,bandpass,compress")
+) -> Dict:
+    check_knee(threshold, knee)
+    try:
+        chosen_stages = parse_stages(stages)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "threshold": threshold,
+        "ratio": ratio,
+        "knee": knee,
+        "attack_ms": attack_ms,
+        "release_ms": release_ms,
+        "mfcc": mfcc,
+        "stages": chosen_stages
+    }
+
+async def run_process_audio(contents: bytes, options: Dict) -> JSONResponse:
+    mfcc = options["mfcc"]
+    # json and npy share one cached matrix
+    params = {**options, "mfcc": mfcc if mfcc in ("plot", "none") else "raw"}
+    try:
+        (result, timings), hit = await result_cache.get_or_compute(
+            result_cache.key("process-audio", contents, params),
+            lambda: worker_pool.run_timed("process-audio", audio_service.process_audio, contents, **params)
+        )
+    except AudioDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(content={
+        "processed_audio": f"data:audio/wav;base64,{bytes_to_base64(result['processed_audio'])}",
+        **mfcc_fields(result, mfcc)
+    }, headers=cache_headers(hit, timings))
+
+async def run_augment_audio(contents: bytes, effects: Dict) -> Response:
+    # Deterministic effects chain, so it is cached like processing
+    try:
+        (augmented_audio, timings), hit = await result_cache.get_or_compute(
+            result_cache.key("augment-audio", contents, effects),
+            lambda: worker_pool.run_timed("augment-audio", audio_service.augment_audio, contents, **effects)
+        )
+    except AudioDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=augmented_audio, media_type="audio/wav", headers=cache_headers(hit, timings))
+
 @router.post("/process-audio")
-async def process_audio(audio: UploadFile = File(...)):
-    try:
-        contents = await audio.read()
-        result = audio_service.process_audio(contents)
-        
-        return JSONResponse(content={
-            "processed_audio": f"data:audio/wav;base64,{bytes_to_base64(result['processed_audio'])}",
-            "mfcc_plot": f"data:image/png;base64,{bytes_to_base64(result['mfcc_plot'])}"
-        })
+async def process_audio(audio: UploadFile = File(...), options: Dict = Depends(process_options)):
+    try:
+        contents = read_upload(audio, "audio")
+        return await run_process_audio(contents, options)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/augment-audio")
-async def augment_audio(audio: UploadFile = File(...)):
+async def augment_audio(audio: UploadFile = File(...), effects: Dict = Depends(effect_options)):
     try:
-        contents = await audio.read()
-        augmented_audio = audio_service.augment_audio(contents)
-        return Response(content=augmented_audio, media_type="audio/wav")
+        contents = read_upload(audio, "audio")
+        return await run_augment_audio(contents, effects)
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/jobs/process-audio", status_code=202)
+async def submit_process_audio(
+    audio: UploadFile = File(...),
+    options: Dict = Depends(process_options),
+    priority: int = Query(0, ge=-10, le=10)
+):
+    contents = read_upload(audio, "audio")
+    return job_queue.submit(
+        "process-audio", lambda: run_process_audio(contents, options), priority,
+        {"filename": audio.filename, **options}
+    )
+
+@router.post("/jobs/augment-audio", status_code=202)
+async def submit_augment_audio(
+    audio: UploadFile = File(...),
+    effects: Dict = Depends(effect_options),
+    priority: int = Query(0, ge=-10, le=10)
+):
+    contents = read_upload(audio, "audio")
+    return job_queue.submit(
+        "augment-audio", lambda: run_augment_audio(contents, effects), priority,
+        {"filename": audio.filename, **effects}
+    )
+
+@router.post("/process-audio/stream")
+async def process_audio_stream(
+    audio: UploadFile = File(...),
+    threshold: float = Query(0.1, gt=0),
+    ratio: float = Query(4.0, ge=1),
+    knee: float = Query(0.0, ge=0),
+    attack_ms: float = Query(0.0, ge=0),
+    release_ms: float = Query(0.0, ge=0),
+    normalize: bool = Query(True)
+):
+    check_knee(threshold, knee)
+    try:
+        path = await save_upload(audio)
+        return await stream_audio(
+            "process-audio-stream",
+            path,
+            lambda p: audio_service.stream_process_audio(
+                p,
+                threshold=threshold,
+                ratio=ratio,
+                knee=knee,
+                attack_ms=attack_ms,
+                release_ms=release_ms,
+                normalize=normalize
+            )
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/augment-audio/stream")
+async def augment_audio_stream(
+    audio: UploadFile = File(...),
+    normalize: bool = Query(True),
+    block_seconds: float = Query(10.0, gt=0, le=120),
+    overlap_seconds: float = Query(0.5, ge=0, le=10),
+    effects: Dict = Depends(effect_options)
+):
+    try:
+        path = await save_upload(audio)
+        return await stream_audio(
+            "augment-audio-stream",
+            path,
+            lambda p: audio_service.stream_augment_audio(
+                p,
+                normalize=normalize,
+                block_seconds=block_seconds,
+                overlap_seconds=overlap_seconds,
+                **effects
+            )
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,8 +1,23 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query, Request, Depends
 from fastapi.responses import Response, JSONResponse
 from ..services.image_service import ImageService
+from ..services.image_codec import ImageDecodeError, format_for_accept, media_type
+from ..services.image_augment import DEFAULT_SPECS, parse_specs
+from ..services.image_batch import (ARCHIVE_MEDIA_TYPES, iter_archive_images, list_archive_images,
+                                    stream_archive, stream_ndjson)
+from ..core.config import settings
+from ..core.workers import PooledStreamingResponse, worker_pool
+from ..core.cache import result_cache, cache_headers
+from ..core.jobs import job_queue
+from ..core.uploads import read_upload, upload_limit
+from ..core.metrics import input_size
+from typing import Dict, List, Optional
+import asyncio
 import base64
 import io
+import json
+import secrets
+import uuid
 
 router = APIRouter()
 image_service = ImageService()
@@ -10,27 +25,202 @@ image_service = ImageService()
 def bytes_to_base64(bytes_data):
     return base64.b64encode(bytes_data).decode('utf-8')
 
+def output_options(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(png|jpeg|webp|avif)$"),
+    quality: Optional[int] = Query(None, ge=1, le=100),
+    png_level: Optional[int] = Query(None, ge=0, le=9),
+    max_dim: Optional[int] = Query(None, ge=16),
+    crop: Optional[str] = Query(None, pattern=r"^\d+,\d+,\d+,\d+$")
+) -> Dict:
+    # An explicit ?format= wins, otherwise the Accept header picks; PNG by default.
+    # crop=x,y,width,height selects a region of the upright original before
+    # max_dim is applied; both are honoured at decode time.
+    region = tuple(int(v) for v in crop.split(",")) if crop else None
+    if region is not None and (region[2] == 0 or region[3] == 0):
+        raise HTTPException(status_code=400, detail="Crop width and height must be positive")
+    return {
+        "fmt": format or format_for_accept(request.headers.get("accept")),
+        "quality": quality,
+        "png_level": png_level,
+        "max_dim": max_dim,
+        "crop": region,
+    }
+
+def vary_accept(request: Request, headers, *params: str):
+    # Responses picked from the Accept header (any of `params` left out of
+    # the query) must say so, or shared caches could serve the wrong type
+    if any(name not in request.query_params for name in params):
+        headers["Vary"] = "Accept"
+    return headers
+
+def multipart_response(parts: Dict[str, bytes], part_type: str, headers: Dict) -> Response:
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, data in parts.items():
+        body.write(f"--{boundary}\r\n".encode())
+        body.write(f'Content-Disposition: form-data; name="{name}"\r\n'.encode())
+        body.write(f"Content-Type: {part_type}\r\n\r\n".encode())
+        body.write(data)
+        body.write(b"\r\n")
+    body.write(f"--{boundary}--\r\n".encode())
+    return Response(
+        content=body.getvalue(),
+        media_type=f"multipart/mixed; boundary={boundary}",
+        headers=headers
+    )
+
+async def run_process_image(contents: bytes, mode: str, output: Dict) -> Response:
+    key = result_cache.key("process-image", contents, {"mode": mode, **output})
+    try:
+        (processed_image, timings), hit = await result_cache.get_or_compute(
+            key,
+            lambda: worker_pool.run_timed(
+                "process-image", image_service.process_image, contents, mode=mode, **output
+            )
+        )
+    except ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(
+        content=processed_image,
+        media_type=media_type(output["fmt"]),
+        headers=cache_headers(hit, timings)
+    )
+
 @router.post("/process-image")
-async def process_image(image: UploadFile = File(...)):
+async def process_image(
+    request: Request,
+    image: UploadFile = File(...),
+    mode: str = Query("quality", pattern="^(quality|fast)$"),
+    output: Dict = Depends(output_options)
+):
     try:
-        contents = await image.read()
-        processed_image = image_service.process_image(contents)
-        return Response(content=processed_image, media_type="image/png")
+        contents = read_upload(image, "image")
+        result = await run_process_image(contents, mode, output)
+        vary_accept(request, result.headers, "format")
+        return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/jobs/process-image", status_code=202)
+async def submit_process_image(
+    image: UploadFile = File(...),
+    mode: str = Query("quality", pattern="^(quality|fast)$"),
+    output: Dict = Depends(output_options),
+    priority: int = Query(0, ge=-10, le=10)
+):
+    # Large images in quality mode can denoise for tens of seconds
+    contents = read_upload(image, "image")
+    return job_queue.submit(
+        "process-image", lambda: run_process_image(contents, mode, output), priority,
+        {"filename": image.filename, "mode": mode, **output}
+    )
+
 @router.post("/augment-image")
-async def augment_image(image: UploadFile = File(...)):
+async def augment_image(
+    request: Request,
+    image: UploadFile = File(...),
+    response: Optional[str] = Query(None, pattern="^(json|multipart)$"),
+    output: Dict = Depends(output_options)
+):
     try:
-        contents = await image.read()
-        augmented_images = image_service.augment_image(contents)
+        contents = read_upload(image, "image")
+        # The augmentation has no random parts, so it is cached like processing
+        key = result_cache.key("augment-image", contents, output)
+        try:
+            (augmented_images, timings), hit = await result_cache.get_or_compute(
+                key,
+                lambda: worker_pool.run_timed(
+                    "augment-image", image_service.augment_image, contents, **output
+                )
+            )
+        except ImageDecodeError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        headers = vary_accept(request, cache_headers(hit, timings), "format", "response")
+        part_type = media_type(output["fmt"])
+
+        # Raw image parts skip the base64 inflation and the big string copies
+        if response is None and "multipart/" in (request.headers.get("accept") or ""):
+            response = "multipart"
+        if response == "multipart":
+            return multipart_response(augmented_images, part_type, headers)
         
         # Convert bytes to base64 strings
         response_data = {
-            "adjusted": f"data:image/png;base64,{bytes_to_base64(augmented_images['adjusted'])}",
-            "flipped": f"data:image/png;base64,{bytes_to_base64(augmented_images['flipped'])}"
+            "adjusted": f"data:{part_type};base64,{bytes_to_base64(augmented_images['adjusted'])}",
+            "flipped": f"data:{part_type};base64,{bytes_to_base64(augmented_images['flipped'])}"
         }
         
-        return JSONResponse(content=response_data)
+        return JSONResponse(content=response_data, headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def read_batch_sources(images: Optional[List[UploadFile]], archive: Optional[UploadFile]):
+    # (sources, total bytes): a lazy (name, bytes) iterator over an archive,
+    # or the uploaded files in order
+    if archive is not None:
+        buffer = read_upload(archive)
+        try:
+            names = await asyncio.to_thread(
+                list_archive_images, buffer, settings.batch_max_images, upload_limit("augment-image")
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return iter_archive_images(buffer, names), len(buffer)
+    if not images:
+        raise HTTPException(status_code=400, detail="Send image files as 'images' or a zip/tar as 'archive'")
+    if len(images) > settings.batch_max_images:
+        raise HTTPException(status_code=400, detail=f"At most {settings.batch_max_images} images per batch")
+    buffers = [(image.filename or f"image-{i}", read_upload(image, "image")) for i, image in enumerate(images)]
+    return iter(buffers), input_size(data for _, data in buffers)
+
+def batch_response_kind(response: Optional[str], accept: Optional[str]) -> str:
+    if response:
+        return response
+    for kind, type_ in ARCHIVE_MEDIA_TYPES.items():
+        if type_ in (accept or ""):
+            return kind
+    return "tar"
+
+@router.post("/augment-image/batch")
+async def augment_image_batch(
+    request: Request,
+    images: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    specs: Optional[str] = Form(None),
+    seed: Optional[int] = Query(None, ge=0),
+    response: Optional[str] = Query(None, pattern="^(tar|zip|ndjson)$"),
+    output: Dict = Depends(output_options)
+):
+    # Many images times many variants in one request: each image is decoded
+    # once and all its variants are cut from that array
+    try:
+        try:
+            variants = parse_specs(json.loads(specs) if specs else DEFAULT_SPECS)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid specs: {e}")
+        sources, size = await read_batch_sources(images, archive)
+
+        # Without a seed one is drawn, and reported so the batch can be rerun
+        if seed is None:
+            seed = secrets.randbits(32)
+        kind = batch_response_kind(response, request.headers.get("accept"))
+        results = image_service.augment_batch(sources, variants, seed, **output)
+        if kind == "ndjson":
+            chunks = stream_ndjson(results, output["fmt"], seed)
+        else:
+            chunks = stream_archive(results, kind, output["fmt"], seed)
+        body = await worker_pool.stream("augment-image-batch", chunks, size)
+
+        headers = vary_accept(request, {"X-Batch-Seed": str(seed)}, "format", "response")
+        if kind != "ndjson":
+            headers["Content-Disposition"] = f'attachment; filename="augmented.{kind}"'
+        return PooledStreamingResponse(body, media_type=ARCHIVE_MEDIA_TYPES[kind], headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,60 @@
+import json
+import os
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import FileResponse, StreamingResponse
+from ..core.jobs import job_queue
+
+router = APIRouter()
+
+# Jobs are submitted through POST /api/jobs/<endpoint> in each modality's
+# router, which takes the same upload and query parameters as the
+# synchronous endpoint and answers 202 with the job record right away.
+
+def job_or_404(job_id: str):
+    info = job_queue.info(job_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job id: {job_id}")
+    return info
+
+@router.get("/jobs")
+async def list_jobs(limit: int = Query(50, ge=1, le=1000)):
+    return {"stats": job_queue.stats(), "jobs": job_queue.recent(limit)}
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    return job_or_404(job_id)
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    # Server-sent events: one "status" event per change, the last one when
+    # the job is done, failed or cancelled
+    job_or_404(job_id)
+
+    async def events():
+        async for info in job_queue.events(job_id):
+            if info is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: status\ndata: {json.dumps(info)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    info = job_or_404(job_id)
+    if info["status"] != "done":
+        detail = info["error"] if info["status"] == "failed" else f"Job is {info['status']}"
+        raise HTTPException(status_code=409, detail=detail)
+    path = job_queue.store.result_path(job_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"Result of job {job_id} has expired")
+    return FileResponse(path, media_type=info["media_type"], headers=info["headers"])
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job_or_404(job_id)
+    return await job_queue.cancel(job_id)
@@ -0,0 +1,46 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from ..core.cache import result_cache
+from ..core.jobs import job_queue
+from ..core.metrics import family, metrics
+from ..core.workers import worker_pool
+
+router = APIRouter()
+
+# Served at /metrics (no /api prefix), where Prometheus scrapes by default
+
+WORKER_GAUGES = ('active', 'queued', 'concurrency', 'max_queue')
+WORKER_COUNTERS = ('completed', 'failed', 'rejected', 'run_seconds')
+CACHE_COUNTERS = ('hits', 'disk_hits', 'misses', 'shared', 'evictions')
+JOB_GAUGES = ('queued', 'running')
+JOB_COUNTERS = ('submitted', 'completed', 'failed', 'cancelled', 'rejected')
+
+def stats_lines():
+    # The counters the JSON endpoints (/api/workers, /api/cache, /api/jobs)
+    # already keep, in the exposition format
+    lines = []
+    endpoints = worker_pool.stats()["endpoints"]
+    for name in WORKER_GAUGES:
+        lines += family(f"pa_worker_{name}", f"Worker pool {name} per endpoint", "gauge",
+                        [({"endpoint": endpoint}, stats[name]) for endpoint, stats in endpoints.items()])
+    for name in WORKER_COUNTERS:
+        key = "run_seconds_total" if name == "run_seconds" else name
+        lines += family(f"pa_worker_{name}_total", f"Worker pool calls {name} per endpoint", "counter",
+                        [({"endpoint": endpoint}, stats[key]) for endpoint, stats in endpoints.items()])
+
+    cache = result_cache.stats()
+    for name in CACHE_COUNTERS:
+        lines += family(f"pa_cache_{name}_total", f"Result cache {name}", "counter", [({}, cache[name])])
+    lines += family("pa_cache_memory_bytes", "Bytes held by the in-memory cache tier", "gauge",
+                    [({}, cache["memory"]["bytes"])])
+
+    jobs = job_queue.stats()
+    for name in JOB_GAUGES:
+        lines += family(f"pa_jobs_{name}", f"Background jobs {name}", "gauge", [({}, jobs[name])])
+    for name in JOB_COUNTERS:
+        lines += family(f"pa_jobs_{name}_total", f"Background jobs {name}", "counter", [({}, jobs[name])])
+    return lines
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(stats_lines()), media_type="text/plain; version=0.0.4")
@@ -1,7 +1,16 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Request
-from pydantic import BaseModel
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request, Query, Depends
+from fastapi.responses import Response
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
 from ..services.model_service import ModelService
-from typing import Dict, List
+from ..services.mesh_io import MEDIA_TYPES, MeshFormatError, decode_mesh, format_for_media_type, mesh_arrays
+from ..services.mesh_store import mesh_store
+from ..core.workers import PooledStreamingResponse, worker_pool
+from ..core.cache import result_cache
+from ..core.jobs import job_queue
+from ..core.uploads import read_upload
+from ..core.metrics import input_size
+from typing import Dict, List, Literal, Optional, Tuple, Union
+import asyncio
 import json
 
 router = APIRouter()
@@ -14,56 +23,271 @@ class ModelData(BaseModel):
 class ModelRequest(BaseModel):
     model_data: ModelData
 
+# Bounds shared by the process-model query parameters and the per-step
+# options of an "operations" list
+METHOD_PATTERN = "^(cluster|unique)$"
+PLACEMENT_PATTERN = "^(quadric|mean)$"
+CELL_SIZE_MAX = 2
+
+class ProcessStep(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    op: Literal["process"]
+    method: str = Field("cluster", pattern=METHOD_PATTERN)
+    cell_size: float = Field(0.01, gt=0, le=CELL_SIZE_MAX)
+    target_faces: Optional[int] = Field(None, ge=1)
+    placement: str = Field("quadric", pattern=PLACEMENT_PATTERN)
+
+class AugmentStep(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    op: Literal["augment"]
+    seed: Optional[int] = None
+
+STEP_MODELS = {"process": ProcessStep, "augment": AugmentStep}
+
+def check_operations(operations) -> List[Union[str, Dict]]:
+    # Every step is checked here, before it reaches a worker, so a bad name,
+    # an unknown option or an out-of-range value is a 400 like the query
+    # parameters. Steps come back with their values coerced to the right types.
+    if not isinstance(operations, list):
+        raise HTTPException(status_code=400, detail="operations must be a list of names or {\"op\": ...} objects")
+    checked = []
+    for i, operation in enumerate(operations):
+        if isinstance(operation, str):
+            options = {"op": operation}
+        elif isinstance(operation, dict):
+            options = operation
+        else:
+            raise HTTPException(status_code=400, detail=f"operations[{i}] must be a name or an {{\"op\": ...}} object")
+        step = STEP_MODELS.get(options.get("op"))
+        if step is None:
+            raise HTTPException(status_code=400, detail=f"operations[{i}]: unknown model operation {options.get('op')!r}")
+        try:
+            values = step(**options).model_dump(exclude_unset=True)
+        except ValidationError as e:
+            errors = "; ".join(f"{'.'.join(str(p) for p in error['loc'])}: {error['msg']}" for error in e.errors())
+            raise HTTPException(status_code=400, detail=f"operations[{i}]: {errors}")
+        checked.append(operation if isinstance(operation, str) else values)
+    return checked
+
+def model_response(key: str, result, fmt: str, mesh_id: Optional[str] = None):
+    if fmt == "json":
+        content = {key: result}
+        if mesh_id:
+            content["mesh_id"] = mesh_id
+        return content
+    headers = {"X-Mesh-Id": mesh_id} if mesh_id else None
+    return Response(content=result, media_type=MEDIA_TYPES[fmt], headers=headers)
+
+def stored_mesh(mesh_id: str) -> Dict:
+    entry = mesh_store.get(mesh_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired mesh id: {mesh_id}")
+    return {"vertices": entry.vertices, "faces": entry.faces}
+
+async def read_model_request(request: Request) -> Tuple[Dict, Optional[str], Optional[List[str]]]:
+    # Returns (model_data, mesh_id, operations). Binary payloads are decoded
+    # as views over the body; JSON bodies carry either the full model_data
+    # or the id of a mesh already held by the server.
+    # Meshes are checked here (shapes, face indices in range), so a bad one
+    # is a 400 before any worker or streamed response is involved.
+    fmt = format_for_media_type(request.headers.get("content-type"))
+    if fmt != "json":
+        try:
+            vertices, faces = decode_mesh(await request.body(), fmt)
+        except MeshFormatError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"vertices": vertices, "faces": faces}, None, None
+
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Request body is not valid JSON")
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="Request body must be a JSON object")
+    operations = body.get('operations')
+    if operations is not None:
+        operations = check_operations(operations)
+    if body.get('mesh_id'):
+        return stored_mesh(body['mesh_id']), body['mesh_id'], operations
+
+    model_data = body.get('model_data')
+    if not isinstance(model_data, dict) or 'vertices' not in model_data or 'faces' not in model_data:
+        raise HTTPException(status_code=400, detail="Invalid model data format")
+    try:
+        # Off the event loop: large meshes take a while to convert
+        vertices, faces = await asyncio.to_thread(mesh_arrays, model_data['vertices'], model_data['faces'])
+    except MeshFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"vertices": vertices, "faces": faces}, None, operations
+
+def is_deterministic(operations: List[Union[str, Dict]]) -> bool:
+    # Augmentation is random unless the step carries a seed
+    for operation in operations:
+        name = operation.get("op") if isinstance(operation, dict) else operation
+        if name == "augment" and not (isinstance(operation, dict) and operation.get("seed") is not None):
+            return False
+    return True
+
+async def read_model_operations(request: Request, default_operation: Union[str, Dict]):
+    # Everything a model operation needs from the request, read up front so a
+    # background job can run it after the response has been sent
+    model_data, mesh_id, operations = await read_model_request(request)
+    operations = operations or [default_operation]
+    fmt = format_for_media_type(request.headers.get("accept"))
+    return model_data, mesh_id, operations, fmt, await request.body()
+
+async def execute_model_operations(endpoint: str, key: str, model_data: Dict, mesh_id: Optional[str],
+                                   operations: List[Union[str, Dict]], fmt: str, body: bytes):
+    # Mesh ids are content hashes too, so the raw body identifies the input
+    cache_key = None
+    if is_deterministic(operations):
+        cache_key = result_cache.key(endpoint, body, {"operations": operations, "format": fmt})
+    (vertices, faces, result), _ = await result_cache.get_or_compute(
+        cache_key,
+        lambda: worker_pool.run(endpoint, model_service.run_operations, model_data, operations, fmt)
+    )
+    # Meshes that came from the store keep their results there for the next step
+    result_id = None
+    if mesh_id:
+        result_id = mesh_store.add(vertices, faces, parent=mesh_id, operations=tuple(operations))
+    return model_response(key, result, fmt, result_id)
+
+async def run_model_operations(endpoint: str, request: Request, default_operation: Union[str, Dict], key: str):
+    return await execute_model_operations(endpoint, key, *await read_model_operations(request, default_operation))
+
 @router.post("/upload-model")
-async def upload_model(model: UploadFile = File(...)):
+async def upload_model(model: UploadFile = File(...), format: str = Query("json", pattern="^(json|binary|npz)$")):
     try:
-        contents = await model.read()
-        model_data = model_service.load_off_file(contents)
-        return {"model_data": model_data}
+        contents = read_upload(model, "model")
+        mesh_id = mesh_store.hash_bytes(contents)
+        cache_key = result_cache.key("upload-model", contents, {"format": format})
+        entry = mesh_store.get(mesh_id)
+        if entry is None:
+            vertices, faces, result = await worker_pool.run(
+                "upload-model", model_service.load_off_stored, contents, format
+            )
+            mesh_store.put(mesh_id, vertices, faces)
+            await result_cache.put(cache_key, result)
+        else:
+            # Same file uploaded before: skip parsing, and reuse the encoded
+            # response too when it is still cached
+            async def encode_stored():
+                _, _, encoded = await worker_pool.run(
+                    "upload-model", model_service.run_operations,
+                    {"vertices": entry.vertices, "faces": entry.faces}, [], format
+                )
+                return encoded
+            result, _ = await result_cache.get_or_compute(cache_key, encode_stored)
+        return model_response("model_data", result, format, mesh_id)
+    except HTTPException:
+        raise
+    except MeshFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Upload error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def process_operation(
+    method: str = Query("cluster", pattern=METHOD_PATTERN),
+    cell_size: float = Query(0.01, gt=0, le=CELL_SIZE_MAX),
+    target_faces: Optional[int] = Query(None, ge=1),
+    placement: str = Query("quadric", pattern=PLACEMENT_PATTERN)
+) -> Dict:
+    # Query parameters configure the default step; bodies with an explicit
+    # "operations" list carry their own per-step options
+    return {
+        "op": "process",
+        "method": method,
+        "cell_size": cell_size,
+        "target_faces": target_faces,
+        "placement": placement,
+    }
+
 @router.post("/process-model")
-async def process_model(request: Request):
+async def process_model(request: Request, operation: Dict = Depends(process_operation)):
     try:
-        # Get raw request body
-        body = await request.json()
-        print("Received request body:", body)  # Debug print
-        
-        # Extract model data
-        model_data = body.get('model_data')
-        if not model_data or 'vertices' not in model_data or 'faces' not in model_data:
-            raise ValueError("Invalid model data format")
-            
-        print("Processing model with vertices:", len(model_data['vertices']), "faces:", len(model_data['faces']))
-        
-        processed_model = model_service.process_model(model_data)
-        print("Model processed successfully")
-        
-        return {"processed_model": processed_model}
+        return await run_model_operations("process-model", request, operation, "processed_model")
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Processing error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/jobs/process-model", status_code=202)
+async def submit_process_model(
+    request: Request,
+    operation: Dict = Depends(process_operation),
+    priority: int = Query(0, ge=-10, le=10)
+):
+    try:
+        model_data, mesh_id, operations, fmt, body = await read_model_operations(request, operation)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return job_queue.submit(
+        "process-model",
+        lambda: execute_model_operations(
+            "process-model", "processed_model", model_data, mesh_id, operations, fmt, body
+        ),
+        priority,
+        {"mesh_id": mesh_id, "operations": operations, "format": fmt}
+    )
+
 @router.post("/augment-model")
-async def augment_model(request: Request):
+async def augment_model(request: Request, seed: Optional[int] = Query(None)):
     try:
-        # Get raw request body
-        body = await request.json()
-        print("Received request body:", body)  # Debug print
-        
-        # Extract model data
-        model_data = body.get('model_data')
-        if not model_data or 'vertices' not in model_data or 'faces' not in model_data:
-            raise ValueError("Invalid model data format")
-            
-        print("Augmenting model with vertices:", len(model_data['vertices']), "faces:", len(model_data['faces']))
-        
-        augmented_model = model_service.augment_model(model_data)
-        print("Model augmented successfully")
-        
-        return {"augmented_model": augmented_model}
+        operation = {"op": "augment", "seed": seed} if seed is not None else "augment"
+        return await run_model_operations("augment-model", request, operation, "augmented_model")
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Augmentation error: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/augment-model/batch")
+async def augment_model_batch(
+    request: Request,
+    count: int = Query(8, ge=1, le=1024),
+    seed: Optional[int] = Query(None)
+):
+    try:
+        model_data, _, _ = await read_model_request(request)
+        # Compact binary by default; JSON/NPZ only when asked for explicitly
+        accept = request.headers.get("accept") or ""
+        if MEDIA_TYPES["json"] in accept:
+            fmt = "json"
+        elif MEDIA_TYPES["npz"] in accept:
+            fmt = "npz"
+        else:
+            fmt = "binary"
+        chunks = model_service.augment_model_batch(model_data, count, seed, fmt)
+        body = await worker_pool.stream("augment-model-batch", chunks, input_size([model_data]))
+        return PooledStreamingResponse(body, media_type=MEDIA_TYPES[fmt])
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Batch augmentation error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/models")
+async def mesh_store_stats():
+    return mesh_store.stats()
+
+@router.get("/models/{mesh_id}")
+async def get_model(mesh_id: str, request: Request):
+    try:
+        model_data = stored_mesh(mesh_id)
+        fmt = format_for_media_type(request.headers.get("accept"))
+        _, _, result = await worker_pool.run("upload-model", model_service.run_operations, model_data, [], fmt)
+        return model_response("model_data", result, fmt, mesh_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/models/{mesh_id}")
+async def delete_model(mesh_id: str):
+    if not mesh_store.delete(mesh_id):
+        raise HTTPException(status_code=404, detail=f"Unknown or expired mesh id: {mesh_id}")
+    return {"deleted": mesh_id}
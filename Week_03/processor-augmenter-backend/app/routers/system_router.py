@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from ..core.workers import worker_pool
+from ..core.cache import result_cache
+from ..core.config import settings
+from ..core.readiness import readiness
+
+router = APIRouter()
+
+@router.get("/workers")
+async def worker_stats():
+    return worker_pool.stats()
+
+@router.get("/cache")
+async def cache_stats():
+    return result_cache.stats()
+
+@router.get("/ready")
+async def ready():
+    # 503 until warmup has finished, and whenever a component failed to
+    # load. With PA_WARMUP off services load on first use, so components
+    # that haven't been loaded yet don't hold readiness back.
+    stats = readiness.stats()
+    stats["ready"] = not readiness.failed and (stats["ready"] or not settings.warmup)
+    return JSONResponse(status_code=200 if stats["ready"] else 503, content=stats)
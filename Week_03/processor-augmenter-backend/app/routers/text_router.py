@@ -1,9 +1,16 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from pydantic import BaseModel
 from ..services.text_service import TextService
+from ..core.workers import DuplexStreamingResponse, worker_pool
+from ..core.readiness import readiness
+from ..core.cache import result_cache, cache_headers
+from typing import AsyncIterator, Callable, List, Optional, Tuple, Union
+import asyncio
+import json
 
 router = APIRouter()
 text_service = TextService()
+readiness.register("text", text_service.ensure_loaded)
 
 class TextRequest(BaseModel):
     text: str
@@ -17,6 +24,124 @@ class TextRequest(BaseModel):
         }
     }
 
+def text_cache_key(endpoint: str, text: str, params: Optional[dict] = None) -> Optional[str]:
+    # Without the tokenizer or NLTK data the results are placeholders
+    # ("[N/A]" tags, "augmentation is not available"). They are not cached,
+    # so they never outlive the degraded state, also not in the disk tier.
+    # Before the first load the state is unknown, so that call isn't cached either.
+    report = text_service.load_report
+    if not report or report.get("degraded"):
+        return None
+    return result_cache.key(endpoint, text.encode('utf-8'), params)
+
+def parse_text_line(line: bytes) -> str:
+    # NDJSON lines are either a JSON string or an object with a "text" field
+    item = json.loads(line)
+    if isinstance(item, dict):
+        item = item.get("text")
+    if not isinstance(item, str):
+        raise ValueError("Each NDJSON line must be a string or an object with a \"text\" field")
+    return item
+
+TextItem = Union[str, ValueError]
+
+async def ndjson_items(request: Request) -> AsyncIterator[TextItem]:
+    # Texts parsed line by line as the body arrives. A malformed line is
+    # yielded as its error, so it keeps its index in the output.
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield parse_item(line)
+    if pending.strip():
+        yield parse_item(pending)
+
+def parse_item(line: bytes) -> TextItem:
+    try:
+        return parse_text_line(line)
+    except ValueError as e:
+        return ValueError(f"Invalid NDJSON line: {e}")
+
+async def read_text_batches(request: Request, batch_size: int) -> Tuple[AsyncIterator[List[TextItem]], asyncio.Event]:
+    # Accepts {"texts": [...]}, a bare JSON list, or NDJSON, and returns the
+    # texts in batches of batch_size plus an event set once the body has
+    # been read. NDJSON is streamed: batches are handed on as their lines
+    # arrive, while earlier results are already being sent. The first batch
+    # is read before the response starts, so malformed lines in it are a
+    # 400; later ones become error records in the output.
+    input_done = asyncio.Event()
+    if "ndjson" not in (request.headers.get("content-type") or ""):
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Request body is not valid JSON")
+        finally:
+            input_done.set()
+        texts = body.get("texts") if isinstance(body, dict) else body
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            raise HTTPException(status_code=400, detail="Expected a list of texts")
+
+        async def slices():
+            for start in range(0, len(texts), batch_size):
+                yield texts[start:start + batch_size]
+        return slices(), input_done
+
+    items = ndjson_items(request)
+
+    async def batches():
+        try:
+            batch = []
+            async for item in items:
+                batch.append(item)
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+        finally:
+            input_done.set()
+
+    stream = batches()
+    try:
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        first = []
+    errors = [(i, item) for i, item in enumerate(first) if isinstance(item, ValueError)]
+    if errors:
+        await stream.aclose()
+        raise HTTPException(status_code=400, detail=f"Line {errors[0][0] + 1}: {errors[0][1]}")
+
+    async def with_first():
+        try:
+            if first:
+                yield first
+            async for batch in stream:
+                yield batch
+        finally:
+            await stream.aclose()
+    return with_first(), input_done
+
+def ndjson_results(run_batch: Callable[[List[str], List[int]], List[dict]]) -> Callable[[List[TextItem]], bytes]:
+    # Encodes one batch per call (one tokenizer/tagger call for its valid
+    # texts, which run_batch gets with their indices), numbering texts
+    # across batches. Batches of a stream are run one after another, so the
+    # running index needs no lock.
+    position = 0
+
+    def encode(batch: List[TextItem]) -> bytes:
+        nonlocal position
+        start, position = position, position + len(batch)
+        valid = [(start + i, item) for i, item in enumerate(batch) if isinstance(item, str)]
+        results = iter(run_batch([text for _, text in valid], [index for index, _ in valid]) if valid else [])
+        lines = []
+        for i, item in enumerate(batch):
+            result = {"error": str(item)} if isinstance(item, ValueError) else next(results)
+            lines.append(json.dumps({"index": start + i, **result}) + "\n")
+        return "".join(lines).encode("utf-8")
+    return encode
+
 class TextResponse(BaseModel):
     processed_text: str
     tokens: str
@@ -32,17 +157,73 @@ class TextResponse(BaseModel):
     }
 
 @router.post("/process-text", response_model=TextResponse)
-async def process_text(request: TextRequest):
+async def process_text(request: TextRequest, response: Response):
     try:
-        result = text_service.process_text(request.text)
+        result, hit = await result_cache.get_or_compute(
+            text_cache_key("process-text", request.text),
+            lambda: worker_pool.run("process-text", text_service.process_text, request.text)
+        )
+        response.headers.update(cache_headers(hit))
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/augment-text")
-async def augment_text(request: TextRequest):
+async def augment_text(request: TextRequest, response: Response, seed: Optional[int] = Query(None)):
     try:
-        augmented_text = text_service.augment_text(request.text)
+        # Random augmentations are only cached when they are reproducible
+        key = None
+        if seed is not None:
+            key = text_cache_key("augment-text", request.text, {"seed": seed})
+        augmented_text, hit = await result_cache.get_or_compute(
+            key,
+            lambda: worker_pool.run("augment-text", text_service.augment_text, request.text, seed=seed)
+        )
+        response.headers.update(cache_headers(hit))
         return {"augmented_text": augmented_text}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) 
+
+@router.post("/process-text/batch")
+async def process_text_batch(
+    request: Request,
+    batch_size: int = Query(64, ge=1, le=1024),
+    offsets: bool = Query(False)
+):
+    try:
+        batches, input_done = await read_text_batches(request, batch_size)
+        body = await worker_pool.stream_map("process-text-batch", batches, ndjson_results(
+            lambda texts, indices: text_service.process_texts(texts, offsets=offsets)
+        ))
+        return DuplexStreamingResponse(body, input_done, media_type="application/x-ndjson")
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/augment-text/batch")
+async def augment_text_batch(
+    request: Request,
+    batch_size: int = Query(64, ge=1, le=1024),
+    seed: Optional[int] = Query(None)
+):
+    try:
+        batches, input_done = await read_text_batches(request, batch_size)
+        # Text i uses seed + i, so results match single /augment-text calls
+        body = await worker_pool.stream_map("augment-text-batch", batches, ndjson_results(
+            lambda texts, indices: [
+                {"augmented_text": text}
+                for text in text_service.augment_texts(
+                    texts, seeds=None if seed is None else [seed + index for index in indices]
+                )
+            ]
+        ))
+        return DuplexStreamingResponse(body, input_done, media_type="application/x-ndjson")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
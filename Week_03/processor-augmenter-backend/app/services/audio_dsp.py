@@ -0,0 +1,229 @@
+import numpy as np
+from scipy import signal
+
+
+def _time_coefficient(time_ms: float, sr: int) -> float:
+    # One-pole smoothing coefficient for a given time constant
+    if time_ms <= 0:
+        return 0.0
+    return float(np.exp(-1.0 / (sr * time_ms / 1000.0)))
+
+
+def compressor_curve(level: np.ndarray, threshold: float, ratio: float, knee: float = 0.0) -> np.ndarray:
+    # Static transfer curve on linear amplitudes (level >= 0). With knee=0 this
+    # is the hard-knee curve threshold + (level - threshold) / ratio, computed
+    # in the input precision so float32 audio matches the old per-sample loop.
+    level = np.asarray(level)
+    if not np.issubdtype(level.dtype, np.floating):
+        level = level.astype(np.float64)
+    out = np.where(level > threshold, threshold + (level - threshold) / ratio, level)
+
+    if knee > 0:
+        # Quadratic blend between the two slopes across [threshold - knee/2, threshold + knee/2].
+        # The knee may not reach below zero, where the blend would flip the
+        # sign of quiet samples, so it is at most twice the threshold.
+        knee = min(knee, 2 * threshold)
+        lower = threshold - knee / 2
+        upper = threshold + knee / 2
+        in_knee = (level > lower) & (level < upper)
+        offset = level[in_knee] - lower
+        out[in_knee] = level[in_knee] + (1.0 / ratio - 1.0) * offset * offset / (2 * knee)
+
+    return out
+
+
+def _envelope(level: np.ndarray, release: float, attack: float, hold: float = 0.0, zi=None):
+    # Peak hold with exponential release: env[n] = max(level[n], r * env[n-1]).
+    # Unrolled, env[n] = max_k(level[k] * r^(n-k)), which is a running maximum
+    # in the log domain and needs no Python loop. `hold` is env[-1] from the
+    # previous block when streaming.
+    if release > 0 and len(level):
+        n = np.arange(len(level), dtype=np.float64)
+        log_r = np.log(release)
+        with np.errstate(divide='ignore'):
+            log_level = np.log(level)
+            running = np.maximum.accumulate(log_level - n * log_r)
+            if hold > 0:
+                running = np.maximum(running, np.log(hold) + log_r)
+        level = np.exp(running + n * log_r)
+        hold = float(level[-1])
+
+    # Attack smoothing as a plain one-pole low-pass
+    if attack > 0:
+        if zi is None:
+            zi = np.zeros(1)
+        level, zi = signal.lfilter([1.0 - attack], [1.0, -attack], level, zi=zi)
+
+    return level, hold, zi
+
+
+def envelope(y: np.ndarray, sr: int, attack_ms: float = 0.0, release_ms: float = 0.0) -> np.ndarray:
+    level = np.abs(np.asarray(y, dtype=np.float64))
+    release = _time_coefficient(release_ms, sr)
+    attack = _time_coefficient(attack_ms, sr)
+    return _envelope(level, release, attack)[0]
+
+
+def compress(y: np.ndarray, sr: int = 22050, threshold: float = 0.1, ratio: float = 4.0,
+             knee: float = 0.0, attack_ms: float = 0.0, release_ms: float = 0.0) -> np.ndarray:
+    y = np.asarray(y)
+    if ratio <= 0:
+        raise ValueError("ratio must be positive")
+
+    if attack_ms <= 0 and release_ms <= 0:
+        # Instantaneous compression: apply the curve to each sample directly
+        magnitude = compressor_curve(np.abs(y), threshold, ratio, knee)
+        return (np.sign(y) * magnitude).astype(y.dtype, copy=False)
+
+    # Compute the gain from a smoothed envelope and apply it to the signal
+    env = envelope(y, sr, attack_ms, release_ms)
+    gain = np.ones_like(env)
+    active = env > 0
+    gain[active] = compressor_curve(env[active], threshold, ratio, knee) / env[active]
+    return (y * gain).astype(y.dtype, copy=False)
+
+
+class StreamingCompressor:
+    # Block-by-block version of compress() that carries the envelope across blocks
+    def __init__(self, sr: int, threshold: float = 0.1, ratio: float = 4.0,
+                 knee: float = 0.0, attack_ms: float = 0.0, release_ms: float = 0.0):
+        self.sr = sr
+        self.threshold = threshold
+        self.ratio = ratio
+        self.knee = knee
+        self.attack = _time_coefficient(attack_ms, sr)
+        self.release = _time_coefficient(release_ms, sr)
+        self._hold = 0.0
+        self._zi = None
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        if self.attack <= 0 and self.release <= 0:
+            return compress(block, self.sr, self.threshold, self.ratio, self.knee)
+
+        env, self._hold, self._zi = _envelope(
+            np.abs(block.astype(np.float64)), self.release, self.attack, self._hold, self._zi
+        )
+        gain = np.ones_like(env)
+        active = env > 0
+        gain[active] = compressor_curve(env[active], self.threshold, self.ratio, self.knee) / env[active]
+        return (block * gain).astype(block.dtype, copy=False)
+
+
+class StreamingBandpass:
+    # Causal Butterworth band-pass with filter state kept between blocks. The
+    # filter is cascaded with itself so the magnitude response matches the
+    # forward-backward filtfilt used on whole signals.
+    def __init__(self, sr: int, low_hz: float = 500, high_hz: float = 4000, order: int = 4):
+        nyquist = sr / 2
+        sos = signal.butter(order, [low_hz / nyquist, high_hz / nyquist], btype='band', output='sos')
+        self.sos = np.vstack([sos, sos])
+        self._zi = np.zeros((self.sos.shape[0], 2))
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        out, self._zi = signal.sosfilt(self.sos, block, zi=self._zi)
+        return out.astype(block.dtype, copy=False)
+
+
+class StreamingChorus:
+    # Modulated delay lines read with linear interpolation. The last
+    # `max_delay` input samples are kept so voices can reach back into the
+    # previous block.
+    def __init__(self, sr: int, num_voices: int = 3, base_delay: float = 0.02, delay_step: float = 0.01,
+                 base_rate: float = 0.5, rate_step: float = 0.1, depth: float = 0.002):
+        self.sr = sr
+        voices = np.arange(num_voices)
+        # One row per voice so a block is read for all voices at once
+        self.delays = (sr * (base_delay + delay_step * voices)).astype(np.float32)[:, None]
+        self.omegas = (2 * np.pi * (base_rate + rate_step * voices) / sr)[:, None]
+        self.gains = (0.5 ** (voices + 1)).astype(np.float32)
+        self.depth = np.float32(depth * sr)
+        self.max_delay = int(np.ceil(self.delays.max(initial=0) + self.depth)) + 2
+        self._history = np.zeros(self.max_delay, dtype=np.float32)
+        self._position = 0
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        buffer = np.concatenate([self._history, block.astype(np.float32, copy=False)])
+        n = np.arange(len(block))
+
+        # LFO phase wrapped at the block start so float32 stays precise on
+        # long signals; delays in samples, voices x samples
+        start = (self.omegas * self._position) % (2 * np.pi)
+        delay = (start + self.omegas * n).astype(np.float32)
+        np.sin(delay, out=delay)
+        delay *= self.depth
+        delay += self.delays
+        # At least one sample back: a zero base delay, or a depth larger
+        # than the base delay, would otherwise read the current or future
+        # samples (and past the end of the buffer)
+        np.maximum(delay, 1, out=delay)
+
+        # Reading `delay` samples back: integer part from the ceiling, the
+        # rest interpolates towards the next (newer) sample
+        whole = np.ceil(delay)
+        frac = whole - delay
+        index = (self.max_delay + n) - whole.astype(np.intp)
+        taps = buffer[index]
+        taps += frac * (buffer[index + 1] - taps)
+        chorus = self.gains @ taps
+
+        self._history = buffer[-self.max_delay:]
+        self._position += len(block)
+        return chorus.astype(block.dtype, copy=False)
+
+
+def reverb_impulse_response(sr: int, delay: float = 0.1, decay: float = 0.3, taps: int = 3,
+                            wet: float = 0.3) -> np.ndarray:
+    # Dry impulse plus `taps` echoes spaced `delay` seconds apart
+    step = int(delay * sr)
+    ir = np.zeros(step * taps + 1)
+    ir[0] = 1.0
+    for i in range(taps):
+        ir[step * (i + 1)] += wet * decay ** (i + 1)
+    return ir
+
+
+class StreamingReverb:
+    # Overlap-add convolution with a fixed impulse response
+    def __init__(self, ir: np.ndarray):
+        self.ir = np.asarray(ir, dtype=np.float64)
+        self._tail = np.zeros(len(self.ir) - 1)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        wet = signal.oaconvolve(block.astype(np.float64), self.ir)
+        n = min(len(block), len(self._tail))
+        wet[:n] += self._tail[:n]
+        # Carry whatever of the old tail this block did not cover
+        carry = np.zeros(len(self.ir) - 1)
+        leftover = self._tail[n:]
+        carry[:len(leftover)] += leftover
+        new_tail = wet[len(block):]
+        carry[:len(new_tail)] += new_tail
+        self._tail = carry
+        return wet[:len(block)].astype(block.dtype, copy=False)
+
+
+class EffectsChain:
+    # Chorus mixed into the dry signal, then reverb, as used by augment_audio.
+    # Whole signals go through the same streaming stages block by block, so
+    # the temporaries never exceed one block per voice whatever the length.
+    def __init__(self, sr: int, voices: int = 3, chorus_delay: float = 0.02, chorus_step: float = 0.01,
+                 chorus_depth: float = 0.002, chorus_mix: float = 0.5, reverb_delay: float = 0.1,
+                 decay: float = 0.3, taps: int = 3, wet: float = 0.3):
+        self.chorus = StreamingChorus(sr, num_voices=voices, base_delay=chorus_delay,
+                                      delay_step=chorus_step, depth=chorus_depth) if voices > 0 else None
+        self.chorus_mix = chorus_mix
+        self.reverb = StreamingReverb(reverb_impulse_response(sr, delay=reverb_delay, decay=decay,
+                                                              taps=taps, wet=wet)) if taps > 0 else None
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        if self.chorus is not None:
+            block = block + self.chorus_mix * self.chorus.process(block)
+        if self.reverb is not None:
+            block = self.reverb.process(block)
+        return block
+
+    def apply(self, y: np.ndarray, blocksize: int = 65536) -> np.ndarray:
+        out = np.empty_like(y)
+        for start in range(0, len(y), blocksize):
+            out[start:start + blocksize] = self.process(y[start:start + blocksize])
+        return out
@@ -0,0 +1,140 @@
+import io
+from typing import Dict, Iterable, Optional, Tuple
+
+import librosa
+import numpy as np
+import soundfile as sf
+import soxr
+from scipy import signal
+
+from ..core.timing import stage
+from .audio_dsp import compress
+
+# Stages mixed into the processed signal, in the order they are computed
+PROCESS_STAGES = ('resample', 'bandpass', 'compress')
+
+# soxr's HQ filter reaches a few dozen samples past a position; this much
+# extra input keeps the partial resample identical to resampling everything
+RESAMPLE_CONTEXT = 4096
+
+# Defaults of librosa.feature.melspectrogram / mfcc
+N_FFT = 2048
+HOP_LENGTH = 512
+
+
+class AudioDecodeError(ValueError):
+    # The upload isn't audio any decoder can read, or holds no samples: a
+    # client error, unlike failures further down the pipeline
+    pass
+
+
+def load_audio(audio_data: bytes, **options) -> Tuple[np.ndarray, int]:
+    # librosa.load with decode failures reported as AudioDecodeError
+    try:
+        y, sr = librosa.load(io.BytesIO(audio_data), **options)
+    except Exception as e:
+        raise AudioDecodeError(f"Could not decode audio: {e}")
+    if len(y) == 0:
+        raise AudioDecodeError("Audio contains no samples")
+    return y, sr
+
+
+def decode_audio(audio_data: bytes) -> Tuple[np.ndarray, int]:
+    # Mono float32 at the file's own rate. libsndfile covers WAV, FLAC, OGG
+    # and (1.1+) MP3; anything else goes through librosa's fallback loader.
+    try:
+        y, sr = sf.read(io.BytesIO(audio_data), dtype='float32', always_2d=True)
+        y = y.mean(axis=1) if y.shape[1] > 1 else y[:, 0]
+    except (RuntimeError, sf.LibsndfileError):
+        y, sr = load_audio(audio_data, sr=None, mono=True)
+    if len(y) == 0:
+        raise AudioDecodeError("Audio contains no samples")
+    return np.ascontiguousarray(y, dtype=np.float32), int(sr)
+
+
+def parse_stages(stages: Optional[Iterable[str]]) -> Tuple[str, ...]:
+    if stages is None:
+        return PROCESS_STAGES
+    if isinstance(stages, str):
+        stages = stages.split(',')
+    chosen = {name.strip() for name in stages if name.strip()}
+    unknown = chosen - set(PROCESS_STAGES)
+    if unknown:
+        raise ValueError(f"Unknown audio stages: {', '.join(sorted(unknown))}")
+    if not chosen:
+        raise ValueError("At least one audio stage is required")
+    return tuple(name for name in PROCESS_STAGES if name in chosen)
+
+
+class AudioPipeline:
+    # One decoded signal and the intermediates derived from it. Stages pull
+    # what they need through the cached accessors, so the STFT is computed
+    # once however many spectral features use it, and every stage is timed.
+    def __init__(self, y: np.ndarray, sr: int):
+        self.y = y
+        self.sr = sr
+        self._power: Optional[np.ndarray] = None
+
+    @classmethod
+    def decode(cls, audio_data: bytes) -> 'AudioPipeline':
+        with stage('decode'):
+            return cls(*decode_audio(audio_data))
+
+    def power_spectrum(self) -> np.ndarray:
+        if self._power is None:
+            with stage('stft'):
+                self._power = np.abs(librosa.stft(self.y, n_fft=N_FFT, hop_length=HOP_LENGTH)) ** 2
+        return self._power
+
+    def mfcc(self, n_mfcc: int = 13) -> np.ndarray:
+        power = self.power_spectrum()
+        with stage('mfcc'):
+            mel = librosa.feature.melspectrogram(S=power, sr=self.sr)
+            return librosa.feature.mfcc(S=librosa.power_to_db(mel), n_mfcc=n_mfcc)
+
+    def resample(self, factor: float = 2.0) -> np.ndarray:
+        # The signal at factor x the rate, cut to the original length. Only
+        # the first len(y) / factor input samples reach the output, so only
+        # those (plus the filter's context) are resampled.
+        with stage('resample'):
+            n = len(self.y)
+            needed = min(n, int(np.ceil(n / factor)) + RESAMPLE_CONTEXT)
+            out = soxr.resample(self.y[:needed], self.sr, int(self.sr * factor), quality='HQ')
+            if needed < n:
+                return out[:n]
+            return np.pad(out, (0, max(0, n - len(out))))[:n]
+
+    def bandpass(self, low_hz: float = 500, high_hz: float = 4000, order: int = 4) -> np.ndarray:
+        with stage('bandpass'):
+            nyquist = self.sr / 2
+            b, a = signal.butter(order, [low_hz / nyquist, high_hz / nyquist], btype='band')
+            return signal.filtfilt(b, a, self.y).astype(np.float32)
+
+    def compress(self, **params) -> np.ndarray:
+        with stage('compress'):
+            return compress(self.y, self.sr, **params)
+
+    def process(self, stages: Tuple[str, ...] = PROCESS_STAGES, factor: float = 2.0,
+                compressor: Optional[Dict] = None) -> Tuple[np.ndarray, int]:
+        # Average of the chosen stages, peak normalised. The result is
+        # written at factor x the input rate, which is what raises the
+        # frequency of the band-passed and compressed versions.
+        mixed = np.zeros_like(self.y)
+        for name in stages:
+            if name == 'resample':
+                out = self.resample(factor)
+            elif name == 'bandpass':
+                out = self.bandpass()
+            else:
+                out = self.compress(**(compressor or {}))
+            # Accumulate in place so only one stage output is alive at a time
+            with stage('mix'):
+                mixed += out
+            del out
+
+        with stage('mix'):
+            # Dividing by the stage count cancels out in the peak normalisation
+            peak = float(np.max(np.abs(mixed)))
+            if peak > 0:
+                mixed *= 1.0 / peak
+        return mixed, int(self.sr * factor)
@@ -2,117 +2,180 @@ import numpy as np
 import librosa
 import soundfile as sf
 import io
-from typing import Dict, Tuple
-from scipy import signal
+from typing import Dict, Iterable, Iterator, Optional, Tuple
 import base64
-import matplotlib.pyplot as plt
+from .audio_dsp import EffectsChain, StreamingBandpass, StreamingCompressor
+from .audio_stream import STREAM_BLOCK_FRAMES, ResampledReader, mono_blocks, stream_wav
+from .audio_pipeline import AudioPipeline, load_audio, parse_stages
+from .mfcc_render import MfccRenderer
+from ..core.timing import stage
+
+MFCC_OUTPUTS = ('plot', 'raw', 'none')
+
+mfcc_renderer = MfccRenderer()
 
 class AudioService:
     def __init__(self):
         pass
 
-    def process_audio(self, audio_data: bytes) -> Dict[str, bytes]:
-        # Load audio data
-        audio_io = io.BytesIO(audio_data)
-        y, sr = librosa.load(audio_io)
-        
-        # 1. Process audio (multiple techniques)
-        # a. Frequency increase
-        new_sr = int(sr * 2.0)  # 100% increase
-        y_freq = librosa.resample(y, orig_sr=sr, target_sr=new_sr)
-        
-        # b. Apply bandpass filter (keep only mid-range frequencies)
-        nyquist = sr / 2
-        low_cutoff = 500 / nyquist
-        high_cutoff = 4000 / nyquist
-        b, a = signal.butter(4, [low_cutoff, high_cutoff], btype='band')
-        y_filtered = signal.filtfilt(b, a, y)
-        
-        # c. Apply compression (reduce dynamic range)
-        threshold = 0.1
-        ratio = 4.0
-        y_compressed = np.zeros_like(y)
-        for i, sample in enumerate(y):
-            if abs(sample) > threshold:
-                if sample > 0:
-                    y_compressed[i] = threshold + (sample - threshold) / ratio
-                else:
-                    y_compressed[i] = -threshold + (sample + threshold) / ratio
-            else:
-                y_compressed[i] = sample
-        
-        # Combine all processed versions
-        y_processed = (y_freq[:len(y)] + y_filtered + y_compressed) / 3
-        
-        # Normalize
-        y_processed = y_processed / np.max(np.abs(y_processed))
-        
+    def process_audio(self, audio_data: bytes, threshold: float = 0.1, ratio: float = 4.0,
+                      knee: float = 0.0, attack_ms: float = 0.0, release_ms: float = 0.0,
+                      mfcc: str = 'plot', stages: Optional[Iterable[str]] = None) -> Dict:
+        # mfcc: 'plot' for a PNG heatmap, 'raw' for the float32 matrix, 'none' to skip.
+        # stages: subset of PROCESS_STAGES to mix, all of them by default.
+        if mfcc not in MFCC_OUTPUTS:
+            raise ValueError(f"Unknown MFCC output: {mfcc}")
+
+        # 1. Decode once at the file's own rate, then mix the chosen stages:
+        # a. frequency increase, b. band-pass (mid-range frequencies only),
+        # c. compression (reduced dynamic range)
+        pipeline = AudioPipeline.decode(audio_data)
+        y_processed, new_sr = pipeline.process(
+            parse_stages(stages),
+            factor=2.0,  # 100% increase
+            compressor={
+                "threshold": threshold,
+                "ratio": ratio,
+                "knee": knee,
+                "attack_ms": attack_ms,
+                "release_ms": release_ms
+            }
+        )
+
         # Save processed audio to bytes
-        audio_output = io.BytesIO()
-        sf.write(audio_output, y_processed, new_sr, format='wav')
-        
-        # 2. Compute and visualize MFCC
-        mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-        
-        # Create MFCC visualization
-        plt.figure(figsize=(10, 4))
-        librosa.display.specshow(mfccs, x_axis='time', sr=sr)
-        plt.colorbar(format='%+2.0f dB')
-        plt.title('MFCC')
-        plt.tight_layout()
-        
-        # Save plot to bytes
-        mfcc_output = io.BytesIO()
-        plt.savefig(mfcc_output, format='png')
-        plt.close()
-        
-        return {
-            "processed_audio": audio_output.getvalue(),
-            "mfcc_plot": mfcc_output.getvalue()
-        }
-
-    def augment_audio(self, audio_data: bytes) -> bytes:
+        with stage('encode'):
+            audio_output = io.BytesIO()
+            sf.write(audio_output, y_processed, new_sr, format='wav')
+
+        result = {"processed_audio": audio_output.getvalue()}
+
+        # 2. Compute MFCC (from the pipeline's shared STFT) and either draw it
+        # or hand back the matrix
+        if mfcc != 'none':
+            mfccs = pipeline.mfcc(n_mfcc=13)
+            result["mfcc_range"] = [float(mfccs.min()), float(mfccs.max())]
+            if mfcc == 'plot':
+                with stage('render'):
+                    seconds = len(pipeline.y) / pipeline.sr
+                    result["mfcc_plot"] = mfcc_renderer.render_png(mfccs, seconds=seconds)
+            else:
+                result["mfcc"] = mfccs.astype(np.float32)
+                result["mfcc_sr"] = pipeline.sr
+
+        return result
+
+    def augment_audio(self, audio_data: bytes, hpss_margin: float = 1.0, **effects) -> bytes:
+        # effects: EffectsChain options (voices, chorus_delay, decay, taps, ...)
         # Load original audio data
-        audio_io = io.BytesIO(audio_data)
-        y, sr = librosa.load(audio_io)
-        
+        with stage('decode'):
+            y, sr = load_audio(audio_data)
+
         # 1. Apply pitch shift and time stretch
-        y_shifted = librosa.effects.pitch_shift(y, sr=sr, n_steps=2)
-        y_stretched = librosa.effects.time_stretch(y_shifted, rate=0.9)
-        
-        # 2. Add harmonic enhancement
-        y_harmonic = librosa.effects.harmonic(y_stretched)
-        
-        # 3. Add chorus effect
-        chorus = np.zeros_like(y_harmonic)
-        num_voices = 3
-        for i in range(num_voices):
-            delay = int(sr * (0.02 + 0.01 * i))  # Different delay for each voice
-            rate = 0.5 + 0.1 * i  # Different rate for each voice
-            depth = 0.002  # Modulation depth
-            t = np.arange(len(y_harmonic)) / sr
-            mod = depth * np.sin(2 * np.pi * rate * t)
-            delay_samples = (delay + (mod * sr).astype(int)) % len(y_harmonic)
-            chorus += y_harmonic[delay_samples] * (0.5 ** (i + 1))
-        
-        # Combine original and chorus
-        y_augmented = y_harmonic + 0.5 * chorus
-        
-        # 4. Add reverb
-        reverb = np.zeros_like(y_augmented)
-        delay_samples = int(0.1 * sr)
-        decay = 0.3
-        for i in range(3):
-            delay = delay_samples * (i + 1)
-            if delay < len(reverb):
-                reverb[delay:] += y_augmented[:-delay] * (decay ** (i + 1))
-        
-        y_augmented = y_augmented + 0.3 * reverb
-        
+        with stage('pitch_shift'):
+            y_shifted = librosa.effects.pitch_shift(y, sr=sr, n_steps=2)
+        with stage('time_stretch'):
+            y_stretched = librosa.effects.time_stretch(y_shifted, rate=0.9)
+        del y_shifted
+
+        # 2. Add harmonic enhancement (a full HPSS; margin 0 skips it)
+        if hpss_margin > 0:
+            with stage('harmonic'):
+                y_harmonic = librosa.effects.harmonic(y_stretched, margin=hpss_margin)
+        else:
+            y_harmonic = y_stretched
+        del y_stretched
+
+        # 3. Add chorus effect and 4. reverb (FFT convolution with the echo
+        # impulse response), block by block
+        with stage('effects'):
+            y_augmented = EffectsChain(sr, **effects).apply(y_harmonic)
+
         # Normalize
-        y_augmented = y_augmented / np.max(np.abs(y_augmented))
-        
+        peak = np.max(np.abs(y_augmented))
+        if peak > 0:
+            y_augmented *= 1.0 / peak
+
         # Save augmented audio to bytes
-        output = io.BytesIO()
-        sf.write(output, y_augmented, sr, format='wav')
-        return output.getvalue()
\ No newline at end of file
+        with stage('encode'):
+            output = io.BytesIO()
+            sf.write(output, y_augmented, sr, format='wav')
+        return output.getvalue()
+
+    def stream_process_audio(self, path: str, threshold: float = 0.1, ratio: float = 4.0,
+                             knee: float = 0.0, attack_ms: float = 0.0, release_ms: float = 0.0,
+                             normalize: bool = True, blocksize: int = STREAM_BLOCK_FRAMES) -> Iterator[bytes]:
+        # Same stages as process_audio, one block at a time at the file's native rate
+        sr = sf.info(path).samplerate
+        new_sr = int(sr * 2.0)
+
+        # a. y_freq[:len(y)] is the start of the signal resampled to twice the
+        # rate, so a second reader walks the file at half speed to produce it
+        freq_reader = ResampledReader(path, sr, new_sr, blocksize // 2)
+        # b. Band-pass with filter state carried across blocks
+        bandpass = StreamingBandpass(sr, 500, 4000)
+        # c. Compression with the envelope carried across blocks
+        compressor = StreamingCompressor(sr, threshold, ratio, knee, attack_ms, release_ms)
+
+        def blocks():
+            for block in mono_blocks(path, blocksize):
+                with stage('resample'):
+                    y_freq = freq_reader.read(len(block))
+                with stage('bandpass'):
+                    filtered = bandpass.process(block)
+                with stage('compress'):
+                    compressed = compressor.process(block)
+                yield (y_freq + filtered + compressed) / 3
+
+        return stream_wav(blocks(), new_sr, normalize=normalize, blocksize=blocksize)
+
+    def _stretched_segments(self, path: str, sr: int, blocksize: int, overlap: int,
+                            n_steps: float, rate: float, hpss_margin: float = 1.0) -> Iterator[np.ndarray]:
+        # Pitch shift, time stretch and harmonic enhancement per block. Each
+        # block is processed with the tail of the previous one in front of it
+        # and the shared region is crossfaded to hide the seams.
+        fade_len = int(round(overlap / rate))
+        context = np.zeros(0, dtype=np.float32)
+        held = None
+
+        for block in mono_blocks(path, blocksize):
+            x = np.concatenate([context, block])
+            with stage('pitch_shift'):
+                y = librosa.effects.pitch_shift(x, sr=sr, n_steps=n_steps)
+            with stage('time_stretch'):
+                y = librosa.effects.time_stretch(y, rate=rate)
+            if hpss_margin > 0:
+                with stage('harmonic'):
+                    y = librosa.effects.harmonic(y, margin=hpss_margin)
+
+            if held is not None:
+                lead = min(len(held), len(y))
+                fade = np.linspace(0.0, 1.0, lead, dtype=np.float32)
+                y[:lead] = held[len(held) - lead:] * (1 - fade) + y[:lead] * fade
+                if len(held) > lead:
+                    yield held[:len(held) - lead]
+
+            keep = min(fade_len, len(y))
+            yield y[:len(y) - keep]
+            held = y[len(y) - keep:]
+            context = x[len(x) - overlap:] if overlap else context
+
+        if held is not None:
+            yield held
+
+    def stream_augment_audio(self, path: str, normalize: bool = True, block_seconds: float = 10.0,
+                             overlap_seconds: float = 0.5, hpss_margin: float = 1.0, **effects) -> Iterator[bytes]:
+        sr = sf.info(path).samplerate
+        blocksize = max(1, int(block_seconds * sr))
+        overlap = min(int(overlap_seconds * sr), blocksize)
+
+        # Chorus keeps its delay-line history and reverb its overlap-add tail
+        chain = EffectsChain(sr, **effects)
+
+        def blocks():
+            for segment in self._stretched_segments(path, sr, blocksize, overlap, n_steps=2, rate=0.9,
+                                                    hpss_margin=hpss_margin):
+                with stage('effects'):
+                    wet = chain.process(segment)
+                yield wet
+
+        return stream_wav(blocks(), sr, normalize=normalize)
@@ -0,0 +1,102 @@
+import struct
+import tempfile
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+import soundfile as sf
+import soxr
+
+from ..core.timing import stage
+
+STREAM_BLOCK_FRAMES = 65536
+_UNKNOWN_SIZE = 0xFFFFFFFF
+
+
+def wav_header(sr: int, n_frames: Optional[int] = None, channels: int = 1) -> bytes:
+    # 16-bit PCM header. Without a frame count the sizes are left at the
+    # "unknown length" sentinel that streaming players accept.
+    block_align = channels * 2
+    if n_frames is None or n_frames * block_align > _UNKNOWN_SIZE - 36:
+        data_size = riff_size = _UNKNOWN_SIZE
+    else:
+        data_size = n_frames * block_align
+        riff_size = 36 + data_size
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', riff_size, b'WAVE',
+        b'fmt ', 16, 1, channels, sr, sr * block_align, block_align, 16,
+        b'data', data_size
+    )
+
+
+def to_pcm16(block: np.ndarray) -> bytes:
+    return (np.clip(block, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+
+
+def mono_blocks(path: str, blocksize: int = STREAM_BLOCK_FRAMES) -> Iterator[np.ndarray]:
+    for block in sf.blocks(path, blocksize=blocksize, dtype='float32', always_2d=True):
+        yield block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
+
+
+class ResampledReader:
+    # Reads `path` through a streaming resampler and hands out exactly as
+    # many output samples as requested, so only one block is ever buffered
+    def __init__(self, path: str, in_rate: int, out_rate: int, blocksize: int = STREAM_BLOCK_FRAMES):
+        self._blocks = mono_blocks(path, blocksize)
+        self._resampler = soxr.ResampleStream(in_rate, out_rate, 1, dtype='float32')
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._done = False
+
+    def read(self, n: int) -> np.ndarray:
+        parts = [self._pending]
+        available = len(self._pending)
+        while available < n and not self._done:
+            block = next(self._blocks, None)
+            if block is None:
+                out = self._resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+                self._done = True
+            else:
+                out = self._resampler.resample_chunk(block)
+            parts.append(out)
+            available += len(out)
+
+        data = np.concatenate(parts)
+        self._pending = data[n:]
+        if len(data) < n:
+            data = np.pad(data, (0, n - len(data)))
+        return data[:n]
+
+
+def stream_wav(blocks: Iterable[np.ndarray], sr: int, normalize: bool = True,
+               blocksize: int = STREAM_BLOCK_FRAMES) -> Iterator[bytes]:
+    if not normalize:
+        yield wav_header(sr)
+        for block in blocks:
+            with stage('encode'):
+                pcm = to_pcm16(block)
+            yield pcm
+        return
+
+    # Peak normalisation needs the whole signal, so spool the float samples to
+    # disk first and scale them on the way out. Memory stays at one block.
+    with tempfile.TemporaryFile() as spool:
+        peak = 0.0
+        frames = 0
+        for block in blocks:
+            with stage('spool'):
+                block = np.asarray(block, dtype=np.float32)
+                if len(block):
+                    peak = max(peak, float(np.max(np.abs(block))))
+                spool.write(block.tobytes())
+                frames += len(block)
+
+        scale = 1.0 / peak if peak > 0 else 1.0
+        yield wav_header(sr, frames)
+        spool.seek(0)
+        while True:
+            with stage('encode'):
+                raw = spool.read(blocksize * 4)
+                pcm = to_pcm16(np.frombuffer(raw, dtype=np.float32) * scale) if raw else None
+            if pcm is None:
+                break
+            yield pcm
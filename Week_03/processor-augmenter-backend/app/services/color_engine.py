@@ -0,0 +1,43 @@
+import cv2
+import numpy as np
+
+# Warm sepia used by ImageService.add_color_filter (BGR in, BGR out)
+SEPIA_KERNEL = np.array([[0.272, 0.534, 0.131],
+                         [0.349, 0.686, 0.168],
+                         [0.393, 0.769, 0.189]], dtype=np.float32)
+
+
+class ColorEngine:
+    # Fused version of the augment colour chain: contrast/brightness, hue
+    # shift, saturation boost and sepia. Every step is per pixel, so the
+    # per-channel steps are precomputed as 8-bit lookup tables and the only
+    # full-image passes left are two LUTs, the HSV round trip and one
+    # float32 matrix transform.
+    def __init__(self, alpha: float = 1.3, beta: float = 30, hue_shift: int = 20,
+                 saturation: float = 1.2, kernel: np.ndarray = SEPIA_KERNEL):
+        levels = np.arange(256, dtype=np.uint8).reshape(1, 256)
+
+        # Same rounding and saturation as cv2.convertScaleAbs
+        self.scale_lut = cv2.convertScaleAbs(levels, alpha=alpha, beta=beta)
+
+        # One 3-channel LUT for HSV: hue rotates within OpenCV's 0-179 range,
+        # saturation is scaled and truncated like the uint8 assignment it replaces
+        hue = (np.arange(256) + hue_shift) % 180
+        sat = np.floor(np.minimum(np.arange(256) * saturation, 255))
+        value = np.arange(256)
+        self.hsv_lut = np.stack([hue, sat, value], axis=-1).astype(np.uint8).reshape(1, 256, 3)
+
+        self.kernel = np.ascontiguousarray(kernel, dtype=np.float32)
+
+    def adjust(self, img: np.ndarray) -> np.ndarray:
+        return cv2.LUT(img, self.scale_lut)
+
+    def color_filter(self, img: np.ndarray) -> np.ndarray:
+        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+        cv2.LUT(hsv, self.hsv_lut, dst=hsv)
+        colored = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+        # cv2.transform saturates uint8 output itself
+        return cv2.transform(colored, self.kernel)
+
+    def apply(self, img: np.ndarray) -> np.ndarray:
+        return self.color_filter(self.adjust(img))
@@ -0,0 +1,319 @@
+import json
+import math
+import re
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .color_engine import ColorEngine
+from .image_codec import clip_crop, fit_max_dim
+
+# Variants one image may produce in a batch, counting repeats
+MAX_VARIANTS = 256
+MAX_REPEATS = 64
+
+# The two variants /api/augment-image returns, as batch specs
+DEFAULT_SPECS = [
+    {'name': 'adjusted', 'ops': ['color']},
+    {'name': 'flipped', 'ops': ['color', 'flip']},
+]
+
+VARIANT_NAME = re.compile(r'^[A-Za-z0-9_-][A-Za-z0-9_.-]{0,63}$')
+
+FLIP_CODES = {'h': 1, 'v': 0, 'hv': -1}
+ROTATE_CODES = {1: cv2.ROTATE_90_COUNTERCLOCKWISE, 2: cv2.ROTATE_180, 3: cv2.ROTATE_90_CLOCKWISE}
+BORDERS = {'reflect': cv2.BORDER_REFLECT_101, 'replicate': cv2.BORDER_REPLICATE, 'constant': cv2.BORDER_CONSTANT}
+
+_color_engine = ColorEngine()
+
+
+# Option checkers: each takes (value, option name) and returns the
+# normalised value or raises ValueError. Ranges become (low, high) tuples
+# that are sampled once per variant.
+
+def number(low: float = -math.inf, high: float = math.inf) -> Callable:
+    def check(value, name):
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not low <= value <= high:
+            raise ValueError(f"{name} must be a number between {low:g} and {high:g}")
+        return float(value)
+    return check
+
+
+def number_range(low: float = -math.inf, high: float = math.inf) -> Callable:
+    single = number(low, high)
+
+    def check(value, name):
+        if not isinstance(value, (list, tuple)):
+            return single(value, name)
+        if len(value) != 2:
+            raise ValueError(f"{name} must be a number or a [low, high] pair")
+        lo, hi = single(value[0], name), single(value[1], name)
+        if lo > hi:
+            raise ValueError(f"{name} range is reversed: [{lo:g}, {hi:g}]")
+        return (lo, hi)
+    return check
+
+
+def choice(*values: str) -> Callable:
+    def check(value, name):
+        if value not in values:
+            raise ValueError(f"{name} must be one of {', '.join(values)}")
+        return value
+    return check
+
+
+def ints(count: int, minimum: int = 0) -> Callable:
+    def check(value, name):
+        if value is None:
+            return None
+        if (not isinstance(value, (list, tuple)) or len(value) != count
+                or not all(isinstance(v, int) and not isinstance(v, bool) and v >= minimum for v in value)):
+            raise ValueError(f"{name} must be a list of {count} integers >= {minimum}")
+        return tuple(value)
+    return check
+
+
+def optional_int(minimum: int) -> Callable:
+    def check(value, name):
+        if value is None:
+            return None
+        if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+            raise ValueError(f"{name} must be an integer >= {minimum}")
+        return value
+    return check
+
+
+def draw(value, rng: np.random.Generator) -> float:
+    return rng.uniform(*value) if isinstance(value, tuple) else value
+
+
+# Operations take a BGR uint8 image and return a new array (or a view);
+# they never write into their input, which may be shared between variants
+
+def color(img, rng):
+    # The fixed /api/augment-image chain: contrast, warm tint, sepia
+    return _color_engine.apply(img)
+
+
+def flip(img, rng, axis):
+    return cv2.flip(img, FLIP_CODES[axis])
+
+
+def rotate(img, rng, degrees, border):
+    # Counter-clockwise; right angles are exact and swap the sides,
+    # anything else keeps the size and fills the corners from `border`
+    angle = draw(degrees, rng)
+    if angle % 90 == 0:
+        turns = int(angle // 90) % 4
+        return cv2.rotate(img, ROTATE_CODES[turns]) if turns else img
+    h, w = img.shape[:2]
+    matrix = cv2.getRotationMatrix2D(((w - 1) / 2, (h - 1) / 2), angle, 1.0)
+    return cv2.warpAffine(img, matrix, (w, h), flags=cv2.INTER_LINEAR, borderMode=BORDERS[border])
+
+
+def crop(img, rng, box, scale, ratio):
+    # A fixed x,y,width,height box, or a random region covering `scale` of
+    # the area with an aspect ratio drawn log-uniformly from `ratio`
+    h, w = img.shape[:2]
+    if box is not None:
+        x, y, cw, ch = clip_crop(box, w, h)
+        return img[y:y + ch, x:x + cw]
+    area = w * h * draw(scale, rng)
+    if isinstance(ratio, tuple):
+        aspect = math.exp(rng.uniform(math.log(ratio[0]), math.log(ratio[1])))
+    else:
+        aspect = ratio
+    cw = min(w, max(1, round(math.sqrt(area * aspect))))
+    ch = min(h, max(1, round(math.sqrt(area / aspect))))
+    x = int(rng.integers(0, w - cw + 1))
+    y = int(rng.integers(0, h - ch + 1))
+    return img[y:y + ch, x:x + cw]
+
+
+def resize(img, rng, size, max_dim):
+    if size is None:
+        return fit_max_dim(img, max_dim)
+    h, w = img.shape[:2]
+    shrinking = size[0] * size[1] < w * h
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR)
+
+
+def jitter(img, rng, brightness, contrast, saturation, hue):
+    # Factors drawn from [1 - x, 1 + x] (hue: a shift of up to `hue` turns).
+    # Brightness and contrast (around mid grey) fold into one 8-bit LUT,
+    # saturation and hue into one HSV LUT, as in ColorEngine.
+    b = rng.uniform(1 - brightness, 1 + brightness)
+    c = rng.uniform(1 - contrast, 1 + contrast)
+    s = rng.uniform(1 - saturation, 1 + saturation)
+    shift = int(round(rng.uniform(-hue, hue) * 180))
+
+    levels = np.arange(256, dtype=np.float32)
+    lut = np.clip((levels * b - 128) * c + 128 + 0.5, 0, 255).astype(np.uint8).reshape(1, 256)
+    out = cv2.LUT(img, lut)
+    if s == 1 and shift == 0:
+        return out
+
+    hsv = cv2.cvtColor(out, cv2.COLOR_BGR2HSV)
+    hue_lut = (np.arange(256) + shift) % 180
+    sat_lut = np.clip(np.arange(256) * s + 0.5, 0, 255)
+    hsv_lut = np.stack([hue_lut, sat_lut, np.arange(256)], axis=-1).astype(np.uint8).reshape(1, 256, 3)
+    cv2.LUT(hsv, hsv_lut, dst=hsv)
+    return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+
+
+def blur(img, rng, sigma):
+    return cv2.GaussianBlur(img, (0, 0), draw(sigma, rng))
+
+
+def noise(img, rng, std):
+    # Additive Gaussian noise, std in 8-bit levels
+    sigma = draw(std, rng)
+    if sigma <= 0:
+        return img
+    noisy = img + rng.standard_normal(img.shape, dtype=np.float32) * np.float32(sigma)
+    return np.clip(noisy + 0.5, 0, 255).astype(np.uint8)
+
+
+# op -> (function, {option: (checker, default)}). Every op also takes `p`,
+# the probability that it is applied at all (default 1).
+OPS: Dict[str, Tuple[Callable, Dict[str, Tuple[Callable, Any]]]] = {
+    'color': (color, {}),
+    'flip': (flip, {'axis': (choice(*FLIP_CODES), 'h')}),
+    'rotate': (rotate, {'degrees': (number_range(-360, 360), (-15.0, 15.0)),
+                        'border': (choice(*BORDERS), 'reflect')}),
+    'crop': (crop, {'box': (ints(4), None),
+                    'scale': (number_range(0.01, 1), (0.5, 1.0)),
+                    'ratio': (number_range(0.1, 10), (0.75, 4 / 3))}),
+    'resize': (resize, {'size': (ints(2, minimum=1), None),
+                        'max_dim': (optional_int(1), None)}),
+    'jitter': (jitter, {'brightness': (number(0, 1), 0.2),
+                        'contrast': (number(0, 1), 0.2),
+                        'saturation': (number(0, 1), 0.2),
+                        'hue': (number(0, 0.5), 0.0)}),
+    'blur': (blur, {'sigma': (number_range(0.05, 50), (0.1, 2.0))}),
+    'noise': (noise, {'std': (number_range(0, 128), (0.0, 10.0))}),
+}
+
+# Options whose [low, high] form makes the op random
+RANGE_OPTIONS = {'rotate': ('degrees',), 'blur': ('sigma',), 'noise': ('std',)}
+
+PROBABILITY = number(0, 1)
+
+
+class Step(NamedTuple):
+    name: str
+    options: Dict[str, Any]
+    probability: float
+    # No random draws: its output depends only on its input, so variants
+    # that start with the same such steps share the result
+    deterministic: bool
+    key: str
+
+
+class Variant(NamedTuple):
+    name: str
+    steps: Tuple[Step, ...]
+    count: int
+    seed: Optional[int]
+
+
+def parse_step(value) -> Step:
+    # "flip" or {"op": "rotate", "degrees": [-10, 10], "p": 0.5}
+    options = dict(value) if isinstance(value, dict) else {'op': value}
+    name = options.pop('op', None)
+    if name not in OPS:
+        raise ValueError(f"Unknown image augmentation: {name!r}; expected one of {', '.join(OPS)}")
+    _, schema = OPS[name]
+    probability = PROBABILITY(options.pop('p', 1.0), f"{name}.p")
+    unknown = set(options) - set(schema)
+    if unknown:
+        raise ValueError(f"Unknown option(s) for {name}: {', '.join(sorted(unknown))}")
+
+    resolved = {}
+    for option, (check, default) in schema.items():
+        resolved[option] = check(options[option], f"{name}.{option}") if option in options else default
+    if name == 'resize' and resolved['size'] is None and resolved['max_dim'] is None:
+        raise ValueError("resize needs a size [width, height] or a max_dim")
+
+    deterministic = (
+        probability == 1
+        and name not in ('jitter', 'noise')
+        and not (name == 'crop' and resolved['box'] is None)
+        and not any(isinstance(resolved[option], tuple) for option in RANGE_OPTIONS.get(name, ()))
+    )
+    key = json.dumps([name, probability, resolved], sort_keys=True)
+    return Step(name, resolved, probability, deterministic, key)
+
+
+def parse_specs(specs) -> List[Variant]:
+    # A spec is an op ("flip" or {"op": "flip", ...}), a list of ops, or
+    # {"name": ..., "ops": [...], "count": N, "seed": S}
+    if not isinstance(specs, list) or not specs:
+        raise ValueError("specs must be a non-empty JSON list")
+    variants, names = [], set()
+    for position, spec in enumerate(specs):
+        if not isinstance(spec, dict) or 'op' in spec:
+            spec = {'ops': spec if isinstance(spec, list) else [spec]}
+        unknown = set(spec) - {'name', 'ops', 'count', 'seed'}
+        if unknown:
+            raise ValueError(f"Unknown spec field(s): {', '.join(sorted(unknown))}")
+        ops = spec.get('ops', [])
+        steps = tuple(parse_step(op) for op in (ops if isinstance(ops, list) else [ops]))
+
+        count = spec.get('count', 1)
+        if isinstance(count, bool) or not isinstance(count, int) or not 1 <= count <= MAX_REPEATS:
+            raise ValueError(f"count must be an integer between 1 and {MAX_REPEATS}")
+        seed = spec.get('seed')
+        if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int) or seed < 0):
+            raise ValueError("seed must be a non-negative integer")
+
+        name = spec.get('name') or '-'.join(step.name for step in steps) or 'original'
+        if not VARIANT_NAME.match(name):
+            raise ValueError(f"Invalid variant name {name!r}: use letters, digits, '_', '-' and '.'")
+        if name in names:
+            if 'name' in spec:
+                raise ValueError(f"Duplicate variant name {name!r}")
+            name = f"{name}-{position}"
+        names.add(name)
+        variants.append(Variant(name, steps, count, seed))
+
+    if sum(variant.count for variant in variants) > MAX_VARIANTS:
+        raise ValueError(f"At most {MAX_VARIANTS} variants per image")
+    return variants
+
+
+def apply_step(step: Step, img: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    if step.probability < 1 and rng.random() >= step.probability:
+        return img
+    function, _ = OPS[step.name]
+    return function(img, rng, **step.options)
+
+
+def apply_variant(img: np.ndarray, steps: Tuple[Step, ...], rng: np.random.Generator,
+                  shared: Dict[Tuple[str, ...], np.ndarray]) -> np.ndarray:
+    # Leading deterministic steps are looked up in `shared` (per image), so
+    # e.g. "color" followed by different random ops runs the colour chain once
+    prefix: Tuple[str, ...] = ()
+    sharing = True
+    for step in steps:
+        if sharing and step.deterministic:
+            prefix += (step.key,)
+            cached = shared.get(prefix)
+            if cached is None:
+                cached = shared[prefix] = apply_step(step, img, rng)
+            img = cached
+        else:
+            sharing = False
+            img = apply_step(step, img, rng)
+    return img
+
+
+def variant_rng(variant: Variant, position: int, repeat: int, index: int, seed: int) -> np.random.Generator:
+    # A spec's own seed gives every image the same draws (paired data such as
+    # masks stay aligned); otherwise the batch seed is mixed with the image
+    # index, so each image gets its own and any single output can be
+    # reproduced from (seed, index, spec position, repeat)
+    if variant.seed is not None:
+        return np.random.default_rng([variant.seed, repeat])
+    return np.random.default_rng([seed, index, position, repeat])
@@ -0,0 +1,197 @@
+import base64
+import io
+import json
+import posixpath
+import tarfile
+import time
+import zipfile
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from ..core.timing import stage
+from .image_codec import IMAGE_FORMATS, media_type
+
+# Archive members taken as images; anything else (READMEs, labels) is skipped
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.jpe', '.png', '.webp', '.bmp', '.tif', '.tiff', '.avif')
+
+ARCHIVE_MEDIA_TYPES = {
+    'tar': 'application/x-tar',
+    'zip': 'application/zip',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def is_image_member(name: str) -> bool:
+    base = posixpath.basename(name)
+    return (not base.startswith('.') and not name.startswith('__MACOSX/')
+            and base.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def open_archive(buffer):
+    # zip or (optionally compressed) tar over an upload buffer; mmaps are
+    # used in place, small in-memory uploads through a BytesIO
+    if hasattr(buffer, 'seek'):
+        buffer.seek(0)
+        fileobj = buffer
+    else:
+        fileobj = io.BytesIO(buffer)
+    if bytes(buffer[:4]) in (b'PK\x03\x04', b'PK\x05\x06'):
+        return zipfile.ZipFile(fileobj)
+    try:
+        return tarfile.open(fileobj=fileobj, mode='r:*')
+    except tarfile.TarError:
+        raise ValueError("Expected a zip or tar archive of images")
+
+
+def list_archive_images(buffer, max_images: int, max_bytes: int) -> List[str]:
+    # Image members in archive order, checked against the limits from their
+    # headers before anything is decompressed
+    with open_archive(buffer) as archive:
+        if isinstance(archive, zipfile.ZipFile):
+            members = [(info.filename, info.file_size) for info in archive.infolist() if not info.is_dir()]
+        else:
+            members = [(info.name, info.size) for info in archive.getmembers() if info.isfile()]
+    names = []
+    for name, size in members:
+        if not is_image_member(name):
+            continue
+        if size > max_bytes:
+            raise ValueError(f"{name} is larger than the {max_bytes // (1024 * 1024)} MB image limit")
+        names.append(name)
+        if len(names) > max_images:
+            raise ValueError(f"Archive holds more than {max_images} images")
+    if not names:
+        raise ValueError("Archive contains no images")
+    return names
+
+
+def iter_archive_images(buffer, names: List[str]) -> Iterator[Tuple[str, bytes]]:
+    # One member in memory at a time, read as the batch asks for it
+    wanted = set(names)
+    with open_archive(buffer) as archive:
+        if isinstance(archive, zipfile.ZipFile):
+            for name in names:
+                yield name, archive.read(name)
+            return
+        for info in archive:
+            if info.isfile() and info.name in wanted:
+                yield info.name, archive.extractfile(info).read()
+
+
+def entry_stem(source: str, index: int, seen: set) -> str:
+    # "train/cat 01.jpg" -> "train/cat 01"; unsafe parts are dropped and
+    # repeated names get the image index appended
+    parts = [part for part in source.replace('\\', '/').split('/') if part not in ('', '.', '..')]
+    stem = posixpath.splitext('/'.join(parts))[0] or f"image-{index}"
+    if stem in seen:
+        stem = f"{stem}-{index}"
+    seen.add(stem)
+    return stem
+
+
+def output_paths(results: Iterable[Dict], fmt: str) -> Iterator[Dict]:
+    # Adds a relative path to every output: <source stem>/<variant>[_<repeat>].<ext>
+    extension = IMAGE_FORMATS[fmt][0]
+    seen: set = set()
+    for result in results:
+        stem = entry_stem(result['source'], result['index'], seen)
+        for output in result.get('outputs', ()):
+            suffix = f"_{output['repeat']}" if output['count'] > 1 else ''
+            output['path'] = f"{stem}/{output['variant']}{suffix}{extension}"
+        yield result
+
+
+def manifest_entry(result: Dict, output: Dict) -> Dict:
+    return {
+        'path': output['path'],
+        'source': result['source'],
+        'index': result['index'],
+        'variant': output['variant'],
+        'repeat': output['repeat'],
+        'seed': output['seed'],
+        'width': output['width'],
+        'height': output['height'],
+    }
+
+
+class ChunkWriter:
+    # Write-only file object for tarfile/zipfile in streaming mode; take()
+    # hands over what has been written since the last call. It has no
+    # tell(), so zipfile writes data descriptors instead of seeking back.
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def stream_archive(results: Iterable[Dict], kind: str, fmt: str, seed: int) -> Iterator[bytes]:
+    # tar or zip of every output, sent image by image, ending with a
+    # manifest.json that lists the outputs, their seeds and any failures.
+    # Images are already compressed, so zip entries are stored as is.
+    writer = ChunkWriter()
+    entries, errors = [], []
+    now = time.time()
+    if kind == 'zip':
+        archive = zipfile.ZipFile(writer, 'w', compression=zipfile.ZIP_STORED)
+    else:
+        archive = tarfile.open(fileobj=writer, mode='w|', format=tarfile.PAX_FORMAT)
+
+    def add(path: str, data: bytes):
+        if kind == 'zip':
+            info = zipfile.ZipInfo(path, time.localtime(now)[:6])
+            archive.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(path)
+            info.size = len(data)
+            info.mtime = now
+            archive.addfile(info, io.BytesIO(data))
+
+    with archive:
+        for result in output_paths(results, fmt):
+            if 'error' in result:
+                errors.append({'source': result['source'], 'index': result['index'], 'error': result['error']})
+                continue
+            with stage('archive'):
+                for output in result['outputs']:
+                    add(output['path'], output['data'])
+                    entries.append(manifest_entry(result, output))
+            chunk = writer.take()
+            if chunk:
+                yield chunk
+        manifest = {'seed': seed, 'format': fmt, 'outputs': entries, 'errors': errors}
+        add('manifest.json', json.dumps(manifest, indent=1).encode('utf-8'))
+    yield writer.take()
+
+
+def stream_ndjson(results: Iterable[Dict], fmt: str, seed: int) -> Iterator[bytes]:
+    # One line per output with the image base64-encoded, one per failed
+    # image, and a closing summary line
+    part_type = media_type(fmt)
+    images = outputs = failed = 0
+    for result in output_paths(results, fmt):
+        images += 1
+        if 'error' in result:
+            failed += 1
+            line = json.dumps({'source': result['source'], 'index': result['index'], 'error': result['error']})
+            yield (line + '\n').encode('utf-8')
+            continue
+        with stage('archive'):
+            lines = []
+            for output in result['outputs']:
+                entry = manifest_entry(result, output)
+                entry['media_type'] = part_type
+                entry['data'] = base64.b64encode(output['data']).decode('ascii')
+                lines.append(json.dumps(entry))
+            outputs += len(lines)
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+    summary = {'done': True, 'seed': seed, 'images': images, 'outputs': outputs, 'errors': failed}
+    yield (json.dumps(summary) + '\n').encode('utf-8')
@@ -0,0 +1,158 @@
+import io
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# format -> (OpenCV extension, media type)
+IMAGE_FORMATS = {
+    'png': ('.png', 'image/png'),
+    'jpeg': ('.jpg', 'image/jpeg'),
+    'webp': ('.webp', 'image/webp'),
+    'avif': ('.avif', 'image/avif'),
+}
+
+# libjpeg can decode at 1/2, 1/4 or 1/8 scale straight from the DCT
+# coefficients, skipping most of the IDCT work and the full-size frame.
+# Every mode applies the EXIF orientation, so it happens once, in decode.
+REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+# The JPEG header (with EXIF and ICC segments) sits well within this
+HEADER_BYTES = 256 * 1024
+
+# EXIF orientations that swap width and height
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+DEFAULT_QUALITY = {'jpeg': 90, 'webp': 85, 'avif': 60}
+
+# AVIF support depends on how OpenCV was built (4.9+ with libavif)
+_QUALITY_FLAGS = {
+    'jpeg': cv2.IMWRITE_JPEG_QUALITY,
+    'webp': cv2.IMWRITE_WEBP_QUALITY,
+    'avif': getattr(cv2, 'IMWRITE_AVIF_QUALITY', None),
+}
+
+
+def media_type(fmt: str) -> str:
+    return IMAGE_FORMATS[fmt][1]
+
+
+def format_for_accept(accept: Optional[str], default: str = 'png') -> str:
+    # First image type listed in the Accept header that we can produce
+    for item in (accept or '').split(','):
+        value = item.split(';')[0].strip().lower()
+        for fmt, (_, type_) in IMAGE_FORMATS.items():
+            if value == type_:
+                return fmt
+    return default
+
+
+def fit_max_dim(img: np.ndarray, max_dim: Optional[int]) -> np.ndarray:
+    # Shrink so the longer side is at most max_dim; never enlarge
+    h, w = img.shape[:2]
+    if not max_dim or max(h, w) <= max_dim:
+        return img
+    scale = max_dim / max(h, w)
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+
+def jpeg_size(data) -> Optional[Tuple[int, int]]:
+    # (width, height) after EXIF orientation, read from the header only;
+    # None for anything that isn't a readable JPEG
+    if bytes(data[:3]) != b'\xff\xd8\xff':
+        return None
+    try:
+        with Image.open(io.BytesIO(bytes(data[:HEADER_BYTES]))) as im:
+            w, h = im.size
+            orientation = im.getexif().get(0x0112, 1)
+    except Exception:
+        return None
+    return (h, w) if orientation in TRANSPOSED_ORIENTATIONS else (w, h)
+
+
+class ImageDecodeError(ValueError):
+    # The upload can't be decoded as an image, or the requested crop misses
+    # it: client errors, unlike failures further down the pipeline
+    pass
+
+
+class CropError(ImageDecodeError):
+    pass
+
+
+def clip_crop(crop: Tuple[int, int, int, int], w: int, h: int) -> Tuple[int, int, int, int]:
+    # (x, y, width, height) clipped to a w x h image
+    x, y, cw, ch = crop
+    x0, y0 = min(max(0, x), w), min(max(0, y), h)
+    x1, y1 = min(max(0, x + cw), w), min(max(0, y + ch), h)
+    if x1 <= x0 or y1 <= y0:
+        raise CropError(f"Crop region {x},{y},{cw},{ch} lies outside the {w}x{h} image")
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def reduction_factor(size: Tuple[int, int], max_dim: Optional[int],
+                     crop: Optional[Tuple[int, int, int, int]] = None) -> int:
+    # Largest decode scale that still leaves the output region at least
+    # max_dim pixels on its longer side, so the final resize only shrinks
+    if not max_dim:
+        return 1
+    w, h = size
+    if crop is not None:
+        _, _, w, h = clip_crop(crop, w, h)
+    for factor, _ in REDUCED_FLAGS:
+        if max(w, h) // factor >= max_dim:
+            return factor
+    return 1
+
+
+def decode_image(data, max_dim: Optional[int] = None,
+                 crop: Optional[Tuple[int, int, int, int]] = None) -> np.ndarray:
+    # BGR image of the crop region (in pixels of the upright original),
+    # shrunk so its longer side is at most max_dim. Large JPEGs are decoded
+    # at reduced scale when the output is small enough, so decode time and
+    # memory follow the requested size rather than the source resolution.
+    size = jpeg_size(data) if max_dim else None
+    factor = reduction_factor(size, max_dim, crop) if size is not None else 1
+    flag = dict(REDUCED_FLAGS).get(factor, cv2.IMREAD_COLOR)
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), flag)
+    if img is None:
+        raise ImageDecodeError("Could not decode image")
+
+    if crop is not None:
+        x, y, cw, ch = crop
+        # Round outwards so the scaled region covers the requested one
+        scaled = (x // factor, y // factor, -(-(x + cw) // factor) - x // factor, -(-(y + ch) // factor) - y // factor)
+        h, w = img.shape[:2]
+        x0, y0, cw, ch = clip_crop(scaled, w, h)
+        img = img[y0:y0 + ch, x0:x0 + cw]
+    return fit_max_dim(img, max_dim)
+
+
+def encode_params(fmt: str, quality: Optional[int] = None, png_level: Optional[int] = None) -> List[int]:
+    if fmt == 'png':
+        return [cv2.IMWRITE_PNG_COMPRESSION, png_level] if png_level is not None else []
+    flag = _QUALITY_FLAGS[fmt]
+    if flag is None:
+        return []
+    return [flag, quality if quality is not None else DEFAULT_QUALITY[fmt]]
+
+
+def encode_image(img: np.ndarray, fmt: str = 'png', quality: Optional[int] = None,
+                 png_level: Optional[int] = None, max_dim: Optional[int] = None) -> bytes:
+    # img is a BGR uint8 array as used throughout ImageService
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown image format: {fmt}")
+    img = fit_max_dim(img, max_dim)
+    try:
+        ok, buffer = cv2.imencode(IMAGE_FORMATS[fmt][0], img, encode_params(fmt, quality, png_level))
+    except cv2.error:
+        ok = False
+    if not ok:
+        raise ValueError(f"{fmt} encoding is not available in this OpenCV build")
+    return buffer.tobytes()
@@ -1,82 +1,241 @@
 from PIL import Image, ImageEnhance, ImageOps
 import io
+import threading
 import numpy as np
 import cv2
-from typing import Dict, List
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from ..core.config import settings
+from ..core.timing import stage
+from .color_engine import ColorEngine
+from .image_augment import Variant, apply_variant, variant_rng
+from .image_codec import decode_image, encode_image
+
+if settings.cv_threads:
+    cv2.setNumThreads(settings.cv_threads)
+
+PROCESS_MODES = ('quality', 'fast')
+
+# How far (in pixels) the denoise chain reaches around each output pixel:
+# bilateral d=9 -> 4, NLM template 7 + search 21 -> 3 + 10, median 3 -> 1,
+# Gaussian 3x3 -> 1. Every filter is local, so a tile read with this much
+# context gives bit for bit the full-image result in its core: the seams
+# need no blending (tests/test_image_service.py checks this).
+FILTER_SUPPORT = 19
+TILE_PADDING = FILTER_SUPPORT
+TILE_SIZE = 1024
+
+# Fast mode denoises a copy whose longer side is at most this many pixels
+FAST_MAX_SIDE = 1024
+GUIDED_RADIUS = 4
+GUIDED_EPS = 1e-3
+
+_tile_executor: Optional[ThreadPoolExecutor] = None
+_tile_executor_lock = threading.Lock()
+
+
+def tile_executor() -> ThreadPoolExecutor:
+    # OpenCV releases the GIL, so tiles run in parallel on plain threads
+    global _tile_executor
+    with _tile_executor_lock:
+        if _tile_executor is None:
+            _tile_executor = ThreadPoolExecutor(
+                max_workers=settings.image_tile_workers,
+                thread_name_prefix='pa-image-tile'
+            )
+        return _tile_executor
+
 
 class ImageService:
     def __init__(self):
-        pass
+        self.color_engine = ColorEngine()
 
-    def process_image(self, image_data: bytes) -> bytes:
-        # Convert bytes to numpy array
-        nparr = np.frombuffer(image_data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
+    def decode(self, image_data: bytes, max_dim: Optional[int] = None,
+               crop: Optional[Tuple[int, int, int, int]] = None) -> np.ndarray:
+        # Crop and target size are applied here, so every later stage only
+        # sees the pixels that end up in the output
+        return decode_image(image_data, max_dim=max_dim, crop=crop)
+
+    def denoise(self, img: np.ndarray) -> np.ndarray:
         # Apply multiple noise reduction techniques
-        bilateral = cv2.bilateralFilter(img, d=9, sigmaColor=75, sigmaSpace=75)
-        denoised = cv2.fastNlMeansDenoisingColored(
-            bilateral,
-            None,
-            h=15,
-            hColor=15,
-            templateWindowSize=7,
-            searchWindowSize=21
-        )
-        median = cv2.medianBlur(denoised, 3)
-        final = cv2.GaussianBlur(median, (3, 3), 0)
-        
-        # Convert back to PIL Image
-        final_rgb = cv2.cvtColor(final, cv2.COLOR_BGR2RGB)
-        processed_image = Image.fromarray(final_rgb)
-        
-        # Convert back to bytes
-        img_byte_arr = io.BytesIO()
-        processed_image.save(img_byte_arr, format='PNG')
-        return img_byte_arr.getvalue()
+        with stage('bilateral'):
+            bilateral = cv2.bilateralFilter(img, d=9, sigmaColor=75, sigmaSpace=75)
+        with stage('nlmeans'):
+            denoised = cv2.fastNlMeansDenoisingColored(
+                bilateral,
+                None,
+                h=15,
+                hColor=15,
+                templateWindowSize=7,
+                searchWindowSize=21
+            )
+        with stage('smooth'):
+            median = cv2.medianBlur(denoised, 3)
+            return cv2.GaussianBlur(median, (3, 3), 0)
+
+    def denoise_tiled(self, img: np.ndarray) -> np.ndarray:
+        # Split into TILE_SIZE tiles, each read with TILE_PADDING pixels of
+        # context, denoise them in parallel and paste back only the cores
+        h, w = img.shape[:2]
+        if h <= TILE_SIZE and w <= TILE_SIZE:
+            return self.denoise(img)
+
+        def run_tile(y0, x0):
+            y1, x1 = min(y0 + TILE_SIZE, h), min(x0 + TILE_SIZE, w)
+            py0, px0 = max(0, y0 - TILE_PADDING), max(0, x0 - TILE_PADDING)
+            py1, px1 = min(h, y1 + TILE_PADDING), min(w, x1 + TILE_PADDING)
+            tile = self.denoise(img[py0:py1, px0:px1])
+            return y0, x0, tile[y0 - py0:y1 - py0, x0 - px0:x1 - px0]
+
+        result = np.empty_like(img)
+        tiles = [(y0, x0) for y0 in range(0, h, TILE_SIZE) for x0 in range(0, w, TILE_SIZE)]
+        for y0, x0, core in tile_executor().map(lambda t: run_tile(*t), tiles):
+            result[y0:y0 + core.shape[0], x0:x0 + core.shape[1]] = core
+        return result
+
+    def guided_upsample(self, low: np.ndarray, low_denoised: np.ndarray, full: np.ndarray) -> np.ndarray:
+        # Fast guided filter: fit the local linear model denoised ~ a * input + b
+        # on the small images, then apply the upsampled (a, b) to the full
+        # resolution input so edges come from the original pixels
+        size = (2 * GUIDED_RADIUS + 1, 2 * GUIDED_RADIUS + 1)
+        guide = low.astype(np.float32) / 255
+        target = low_denoised.astype(np.float32) / 255
+
+        mean_i = cv2.boxFilter(guide, -1, size)
+        mean_p = cv2.boxFilter(target, -1, size)
+        cov_ip = cv2.boxFilter(guide * target, -1, size) - mean_i * mean_p
+        var_i = cv2.boxFilter(guide * guide, -1, size) - mean_i * mean_i
+        a = cov_ip / (var_i + GUIDED_EPS)
+        b = mean_p - a * mean_i
+
+        h, w = full.shape[:2]
+        mean_a = cv2.resize(cv2.boxFilter(a, -1, size), (w, h), interpolation=cv2.INTER_LINEAR)
+        mean_b = cv2.resize(cv2.boxFilter(b, -1, size), (w, h), interpolation=cv2.INTER_LINEAR)
+        output = mean_a * (full.astype(np.float32) / 255) + mean_b
+        return np.clip(output * 255 + 0.5, 0, 255).astype(np.uint8)
+
+    def denoise_fast(self, img: np.ndarray) -> np.ndarray:
+        h, w = img.shape[:2]
+        scale = FAST_MAX_SIDE / max(h, w)
+        if scale >= 1:
+            return self.denoise(img)
+
+        with stage('downscale'):
+            low = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))),
+                             interpolation=cv2.INTER_AREA)
+        low_denoised = self.denoise(low)
+        with stage('upsample'):
+            return self.guided_upsample(low, low_denoised, img)
+
+    def process_image(self, image_data: bytes, mode: str = 'quality', fmt: str = 'png',
+                      quality: Optional[int] = None, png_level: Optional[int] = None,
+                      max_dim: Optional[int] = None, crop: Optional[Tuple[int, int, int, int]] = None) -> bytes:
+        if mode not in PROCESS_MODES:
+            raise ValueError(f"Unknown processing mode: {mode}")
+
+        # Denoising at the output size keeps its cost independent of the
+        # camera resolution
+        with stage('decode'):
+            img = self.decode(image_data, max_dim=max_dim, crop=crop)
+
+        if mode == 'fast':
+            final = self.denoise_fast(img)
+        else:
+            # Stages inside parallel tiles overlap, so time the tiling as a whole
+            with stage('denoise'):
+                final = self.denoise_tiled(img)
+
+        with stage('encode'):
+            return encode_image(final, fmt, quality=quality, png_level=png_level)
 
     def add_color_filter(self, img):
-        # Convert to HSV for color manipulation
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        
-        # Add a warm color tint (orange-yellow)
-        hsv[:, :, 0] = (hsv[:, :, 0] + 20) % 180  # Shift hue towards warm colors
-        hsv[:, :, 1] = np.clip(hsv[:, :, 1] * 1.2, 0, 255)  # Increase saturation
-        
-        # Convert back to BGR
-        colored = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
-        
-        # Apply a slight sepia effect
-        kernel = np.array([[0.272, 0.534, 0.131],
-                          [0.349, 0.686, 0.168],
-                          [0.393, 0.769, 0.189]])
-        
-        sepia = cv2.transform(colored, kernel)
-        return np.clip(sepia, 0, 255).astype(np.uint8)
+        # Warm tint (hue shift, +20% saturation) followed by a slight sepia
+        return self.color_engine.color_filter(img)
 
     def apply_adjustments(self, img):
-        # Apply brightness and contrast adjustments
-        adjusted = cv2.convertScaleAbs(img, alpha=1.3, beta=30)  # alpha for contrast, beta for brightness
-        
-        # Apply color filter
-        colored = self.add_color_filter(adjusted)
-        return colored
-
-    def augment_image(self, image_data: bytes) -> Dict[str, bytes]:
-        # Convert bytes to numpy array for OpenCV processing
-        nparr = np.frombuffer(image_data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
+        # Brightness/contrast (alpha 1.3, beta 30), then the color filter
+        return self.color_engine.apply(img)
+
+    def augment_image(self, image_data: bytes, fmt: str = 'png', quality: Optional[int] = None,
+                      png_level: Optional[int] = None, max_dim: Optional[int] = None,
+                      crop: Optional[Tuple[int, int, int, int]] = None) -> Dict[str, bytes]:
+        # Previews only need the small image, so shrink before the color work
+        with stage('decode'):
+            img = self.decode(image_data, max_dim=max_dim, crop=crop)
+
         # 1. Apply adjustments to original image
-        adjusted = self.apply_adjustments(img)
-        adjusted_bytes = cv2.imencode('.png', adjusted)[1].tobytes()
+        with stage('color'):
+            adjusted = self.apply_adjustments(img)
+        
+        # 2. The color chain is per pixel, so adjusting the flipped image is
+        # the same as flipping the adjusted one
+        with stage('flip'):
+            flipped_adjusted = cv2.flip(adjusted, 1)  # 1 for horizontal flip
         
-        # 2. First flip the image, then apply the same adjustments
-        flipped = cv2.flip(img, 1)  # 1 for horizontal flip
-        flipped_adjusted = self.apply_adjustments(flipped)
-        flipped_bytes = cv2.imencode('.png', flipped_adjusted)[1].tobytes()
+        with stage('encode'):
+            adjusted_bytes = encode_image(adjusted, fmt, quality=quality, png_level=png_level)
+            flipped_bytes = encode_image(flipped_adjusted, fmt, quality=quality, png_level=png_level)
         
         return {
             "adjusted": adjusted_bytes,
             "flipped": flipped_bytes
-        }
\ No newline at end of file
+        }
+
+    def augment_variants(self, index: int, source: str, image_data: bytes, variants: List[Variant], seed: int,
+                         fmt: str = 'png', quality: Optional[int] = None, png_level: Optional[int] = None,
+                         max_dim: Optional[int] = None,
+                         crop: Optional[Tuple[int, int, int, int]] = None) -> Dict:
+        # Every variant of one image from a single decode. A broken image
+        # only fails its own entry; the batch around it carries on.
+        try:
+            img = self.decode(image_data, max_dim=max_dim, crop=crop)
+            shared: Dict[Tuple[str, ...], np.ndarray] = {}
+            outputs = []
+            for position, variant in enumerate(variants):
+                for repeat in range(variant.count):
+                    rng = variant_rng(variant, position, repeat, index, seed)
+                    result = apply_variant(img, variant.steps, rng, shared)
+                    outputs.append({
+                        'variant': variant.name,
+                        'repeat': repeat,
+                        'count': variant.count,
+                        'seed': seed if variant.seed is None else variant.seed,
+                        'width': result.shape[1],
+                        'height': result.shape[0],
+                        'data': encode_image(result, fmt, quality=quality, png_level=png_level),
+                    })
+            return {'index': index, 'source': source, 'outputs': outputs}
+        except Exception as e:
+            return {'index': index, 'source': source, 'error': str(e)}
+
+    def augment_batch(self, sources: Iterable[Tuple[str, bytes]], variants: List[Variant], seed: int,
+                      **options) -> Iterator[Dict]:
+        # Images are augmented in parallel on the tile threads (OpenCV
+        # releases the GIL) with a bounded window, so only a few decoded
+        # images are in memory at once; results come back in input order.
+        # Per-image stages overlap, so the wait is timed as a whole.
+        executor = tile_executor()
+        pending = deque()
+        sources = enumerate(sources)
+
+        def submit_next() -> bool:
+            with stage('read'):
+                item = next(sources, None)
+            if item is None:
+                return False
+            index, (source, data) = item
+            pending.append(executor.submit(self.augment_variants, index, source, data, variants, seed, **options))
+            return True
+
+        try:
+            while len(pending) < settings.image_tile_workers and submit_next():
+                pass
+            while pending:
+                with stage('augment'):
+                    result = pending.popleft().result()
+                submit_next()
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,287 @@
+import io
+import re
+import struct
+import warnings
+from typing import Tuple
+
+import numpy as np
+
+# [ST][C][N][4][n]OFF keyword; some ModelNet files glue the counts onto it ("OFF490 518 0")
+_HEADER = re.compile(rb'\s*(ST)?(C)?(N)?(4)?(n)?OFF', re.ASCII)
+_COUNTS = re.compile(rb'\s*(\d+)\s+(\d+)(?:[ \t]+(\d+))?', re.ASCII)
+_COMMENT = re.compile(rb'#[^\n]*')
+_FIRST_LINE = re.compile(rb'\S[^\n]*')
+
+# Binary mesh layout: 16-byte header then little-endian float32 vertices and int32 faces
+MESH_MAGIC = b'MSH1'
+_MESH_HEADER = struct.Struct('<4sIII')
+
+# Batch layout: 20-byte header, the shared int32 faces once, then one
+# float32 vertex block per sample
+MESH_BATCH_MAGIC = b'MSHB'
+_MESH_BATCH_HEADER = struct.Struct('<4sIIII')
+
+
+
+class MeshFormatError(ValueError):
+    # A malformed mesh upload or payload: a client error, unlike other failures
+    pass
+
+
+MEDIA_TYPES = {
+    'json': 'application/json',
+    'binary': 'application/octet-stream',
+    'npz': 'application/x-npz',
+}
+
+
+def format_for_media_type(media_type: str) -> str:
+    # Map a Content-Type/Accept value onto one of the MEDIA_TYPES keys
+    media_type = (media_type or '').lower()
+    for fmt in ('binary', 'npz'):
+        if MEDIA_TYPES[fmt] in media_type:
+            return fmt
+    return 'json'
+
+
+def _parse_numbers(text: bytes) -> np.ndarray:
+    with warnings.catch_warnings():
+        # numpy only warns (and truncates) on malformed numeric text
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            return np.fromstring(text, dtype=np.float64, sep=' ')
+        except (DeprecationWarning, ValueError):
+            raise MeshFormatError("OFF file contains malformed numeric data")
+
+
+def _walk_faces(tokens: np.ndarray, num_faces: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Mixed polygon sizes: follow the per-face vertex counts through the token stream
+    values = tokens.tolist()
+    starts = np.empty(num_faces, dtype=np.int64)
+    counts = np.empty(num_faces, dtype=np.int64)
+    pos = 0
+    for i in range(num_faces):
+        n = int(values[pos])
+        starts[i] = pos + 1
+        counts[i] = n
+        pos += n + 1
+    if pos != len(values):
+        raise MeshFormatError("face block has trailing values")
+    return starts, counts
+
+
+def _line_faces(face_lines) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Slow path for faces that carry per-face colours after their indices
+    flat, starts, counts = [], [], []
+    for line in face_lines:
+        values = line.split()
+        try:
+            n = int(values[0])
+            indices = [int(v) for v in values[1:n + 1]]
+        except ValueError:
+            raise MeshFormatError("OFF face indices must be integers")
+        if len(indices) < n:
+            raise MeshFormatError("OFF face line has fewer indices than its vertex count")
+        starts.append(len(flat))
+        counts.append(n)
+        flat.extend(indices)
+    return np.array(flat, dtype=np.int64), np.array(starts, dtype=np.int64), np.array(counts, dtype=np.int64)
+
+
+def triangulate(indices: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    # Fan-triangulate polygons given as offsets into a flat index array;
+    # faces with fewer than three vertices are dropped
+    fans = np.maximum(counts - 2, 0)
+    total = int(fans.sum())
+    if total == 0:
+        return np.zeros((0, 3), dtype=np.int64)
+
+    face_id = np.repeat(np.arange(len(counts)), fans)
+    first = np.cumsum(fans) - fans
+    k = np.arange(total) - first[face_id]
+    start = starts[face_id]
+    return np.stack([
+        indices[start],
+        indices[start + 1 + k],
+        indices[start + 2 + k],
+    ], axis=1)
+
+
+def polygon_faces(indices: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    # Faces of one size stay as they are; mixed sizes are fan-triangulated
+    if len(counts) and counts[0] >= 3 and bool(np.all(counts == counts[0])):
+        return indices[starts[:, None] + np.arange(counts[0])]
+    return triangulate(indices, starts, counts)
+
+
+def parse_off(data: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    # (vertices, faces). Faces keep their polygon size when every face has
+    # the same number of vertices; files mixing polygon sizes have them
+    # fan-triangulated, since faces are returned as one rectangular array.
+    data = bytes(data)
+    if b'#' in data:
+        data = _COMMENT.sub(b'', data)
+
+    header = _HEADER.match(data)
+    if not header:
+        raise MeshFormatError("Not a valid OFF file")
+    if header.group(4):
+        raise MeshFormatError("4OFF (homogeneous coordinates) is not supported")
+
+    counts = _COUNTS.match(data, header.end())
+    if not counts:
+        raise MeshFormatError("OFF header is missing vertex/face counts")
+    num_vertices, num_faces = int(counts.group(1)), int(counts.group(2))
+
+    body = data[counts.end():]
+    # Columns per vertex line (xyz plus optional normals/colours/texcoords)
+    first_line = _FIRST_LINE.search(body)
+    columns = len(first_line.group(0).split()) if num_vertices and first_line else 3
+    if columns < 3:
+        raise MeshFormatError("OFF vertex lines need at least three coordinates")
+
+    # 1. Parse every number after the header in a single pass
+    tokens = _parse_numbers(body)
+    vertex_values = num_vertices * columns
+    if len(tokens) < vertex_values:
+        raise MeshFormatError("OFF file ends inside the vertex block")
+    vertices = tokens[:vertex_values].reshape(num_vertices, columns)[:, :3].astype(np.float32)
+
+    # 2. Faces: uniform polygons reshape directly, otherwise walk the counts.
+    # Only whole numbers can be counts or indices; anything else (per-face
+    # colours, or a malformed index) goes through the line by line parser.
+    raw_faces = tokens[vertex_values:]
+    face_tokens = raw_faces.astype(np.int64)
+    integral = bool(np.array_equal(face_tokens, raw_faces))
+    if num_faces == 0:
+        faces = np.zeros((0, 3), dtype=np.int64)
+    else:
+        n = int(face_tokens[0]) if len(face_tokens) else 0
+        uniform = (
+            integral
+            and n >= 3
+            and len(face_tokens) == num_faces * (n + 1)
+            and bool(np.all(face_tokens[::n + 1] == n))
+        )
+        if uniform:
+            faces = np.ascontiguousarray(face_tokens.reshape(num_faces, n + 1)[:, 1:])
+        else:
+            try:
+                if not integral:
+                    raise MeshFormatError("face block has non-integer values")
+                starts, sizes = _walk_faces(face_tokens, num_faces)
+                faces = polygon_faces(face_tokens, starts, sizes)
+            except (ValueError, IndexError):
+                lines = [line for line in body.splitlines() if line.strip()]
+                face_lines = lines[num_vertices:num_vertices + num_faces]
+                if len(face_lines) < num_faces:
+                    raise MeshFormatError("OFF file ends inside the face block")
+                indices, starts, sizes = _line_faces(face_lines)
+                faces = polygon_faces(indices, starts, sizes)
+
+    if len(faces) and (faces.min() < 0 or faces.max() >= num_vertices):
+        raise MeshFormatError("OFF face references a vertex that does not exist")
+
+    return vertices, faces
+
+
+def check_mesh(vertices: np.ndarray, faces: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Shapes and face indices of a mesh that came from a client
+    if vertices.ndim != 2 or vertices.shape[1] != 3 or len(vertices) == 0:
+        raise MeshFormatError("vertices must be a non-empty list of [x, y, z] points")
+    if faces.ndim == 1 and faces.size == 0:
+        faces = faces.reshape(0, 3)
+    if faces.ndim != 2 or faces.shape[1] < 3:
+        raise MeshFormatError("faces must be a list of polygons with at least three vertex indices")
+    if not np.issubdtype(faces.dtype, np.integer):
+        raise MeshFormatError("face indices must be integers")
+    if len(faces) and (faces.min() < 0 or faces.max() >= len(vertices)):
+        raise MeshFormatError("a face references a vertex that does not exist")
+    return vertices, faces
+
+
+def mesh_arrays(vertices, faces) -> Tuple[np.ndarray, np.ndarray]:
+    # Checked float32 vertices and int64 faces from the nested lists of a
+    # JSON model_data; whole floats are accepted as indices, fractions are not
+    try:
+        vertices = np.asarray(vertices, dtype=np.float32)
+        faces = np.asarray(faces)
+    except (TypeError, ValueError):
+        raise MeshFormatError("vertices and faces must be lists of equally sized numeric lists")
+    if faces.dtype.kind == 'f' and np.array_equal(faces, np.floor(faces)):
+        faces = faces.astype(np.int64)
+    elif faces.dtype.kind in 'iu':
+        faces = faces.astype(np.int64, copy=False)
+    elif faces.size:
+        raise MeshFormatError("face indices must be integers")
+    return check_mesh(vertices, faces)
+
+
+def encode_mesh(vertices: np.ndarray, faces: np.ndarray, fmt: str = 'binary') -> bytes:
+    vertices = np.ascontiguousarray(vertices, dtype='<f4')
+    faces = np.ascontiguousarray(faces, dtype='<i4')
+
+    if fmt == 'binary':
+        face_size = faces.shape[1] if faces.ndim == 2 else 3
+        header = _MESH_HEADER.pack(MESH_MAGIC, len(vertices), len(faces), face_size)
+        return header + vertices.tobytes() + faces.tobytes()
+
+    if fmt == 'npz':
+        buffer = io.BytesIO()
+        np.savez(buffer, vertices=vertices, faces=faces)
+        return buffer.getvalue()
+
+    raise ValueError(f"Unknown mesh format: {fmt}")
+
+
+def decode_mesh(data: bytes, fmt: str = 'binary') -> Tuple[np.ndarray, np.ndarray]:
+    if fmt == 'binary':
+        if len(data) < _MESH_HEADER.size:
+            raise MeshFormatError("Binary mesh is shorter than its header")
+        magic, num_vertices, num_faces, face_size = _MESH_HEADER.unpack_from(data)
+        if magic != MESH_MAGIC:
+            raise MeshFormatError("Binary mesh has an unknown header")
+        vertex_bytes = num_vertices * 3 * 4
+        face_bytes = num_faces * face_size * 4
+        if len(data) != _MESH_HEADER.size + vertex_bytes + face_bytes:
+            raise MeshFormatError("Binary mesh size does not match its header")
+
+        # Views straight into the request body, no copies
+        vertices = np.frombuffer(data, dtype='<f4', count=num_vertices * 3,
+                                 offset=_MESH_HEADER.size).reshape(num_vertices, 3)
+        faces = np.frombuffer(data, dtype='<i4', count=num_faces * face_size,
+                              offset=_MESH_HEADER.size + vertex_bytes).reshape(num_faces, face_size)
+        return check_mesh(vertices, faces)
+
+    if fmt == 'npz':
+        try:
+            with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+                vertices, faces = archive['vertices'], archive['faces']
+        except (OSError, ValueError, KeyError, EOFError):
+            raise MeshFormatError("Expected an .npz archive with 'vertices' and 'faces' arrays")
+        return check_mesh(vertices, faces)
+
+    raise ValueError(f"Unknown mesh format: {fmt}")
+
+
+def encode_mesh_batch_header(count: int, num_vertices: int, faces: np.ndarray) -> bytes:
+    faces = np.ascontiguousarray(faces, dtype='<i4')
+    face_size = faces.shape[1] if faces.ndim == 2 else 3
+    header = _MESH_BATCH_HEADER.pack(MESH_BATCH_MAGIC, count, num_vertices, len(faces), face_size)
+    return header + faces.tobytes()
+
+
+def encode_mesh_batch_samples(vertices: np.ndarray) -> bytes:
+    # (k, V, 3) block of samples following encode_mesh_batch_header
+    return np.ascontiguousarray(vertices, dtype='<f4').tobytes()
+
+
+def decode_mesh_batch(data: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    magic, count, num_vertices, num_faces, face_size = _MESH_BATCH_HEADER.unpack_from(data)
+    if magic != MESH_BATCH_MAGIC:
+        raise ValueError("Binary mesh batch has an unknown header")
+    offset = _MESH_BATCH_HEADER.size
+    faces = np.frombuffer(data, dtype='<i4', count=num_faces * face_size, offset=offset)
+    offset += faces.nbytes
+    vertices = np.frombuffer(data, dtype='<f4', count=count * num_vertices * 3, offset=offset)
+    return vertices.reshape(count, num_vertices, 3), faces.reshape(num_faces, face_size)
@@ -0,0 +1,138 @@
+from typing import Optional, Tuple
+
+import torch
+
+from ..core.timing import stage
+
+SIMPLIFY_METHODS = ('cluster', 'unique')
+PLACEMENTS = ('quadric', 'mean')
+
+
+def clean_faces(faces: torch.Tensor) -> torch.Tensor:
+    # Drop faces that collapsed onto an edge or a point, and duplicates that
+    # several source triangles collapsed into
+    if len(faces) == 0:
+        return faces
+    degenerate = (faces[:, 0] == faces[:, 1]) | (faces[:, 1] == faces[:, 2]) | (faces[:, 0] == faces[:, 2])
+    faces = faces[~degenerate]
+    if len(faces) == 0:
+        return faces
+
+    # Rotate each triangle so its smallest index comes first; this keeps the
+    # winding while making identical triangles compare equal
+    first = faces.argmin(dim=1, keepdim=True)
+    order = (first + torch.arange(3)) % 3
+    canonical = torch.gather(faces, 1, order)
+    return faces[first_occurrences(canonical)]
+
+
+def first_occurrences(rows: torch.Tensor) -> torch.Tensor:
+    # Indices of the first occurrence of each distinct row, in original order
+    _, inverse = torch.unique(rows, dim=0, return_inverse=True)
+    first = torch.full((int(inverse.max()) + 1,), len(rows), dtype=torch.int64)
+    first.scatter_reduce_(0, inverse, torch.arange(len(rows)), reduce='amin')
+    return torch.sort(first).values
+
+
+def compact(vertices: torch.Tensor, faces: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    # Remove vertices that no face references
+    used = torch.zeros(len(vertices), dtype=torch.bool)
+    used[faces.reshape(-1)] = True
+    remap = torch.cumsum(used, dim=0) - 1
+    return vertices[used], remap[faces]
+
+
+def face_quadrics(vertices: torch.Tensor, faces: torch.Tensor) -> torch.Tensor:
+    # Area-weighted plane quadric p p^T (4x4) for every face
+    v0, v1, v2 = vertices[faces[:, 0]], vertices[faces[:, 1]], vertices[faces[:, 2]]
+    normal = torch.cross(v1 - v0, v2 - v0, dim=1)
+    double_area = torch.norm(normal, dim=1, keepdim=True)
+    unit = normal / double_area.clamp_min(1e-12)
+    plane = torch.cat([unit, -(unit * v0).sum(dim=1, keepdim=True)], dim=1)
+    return (double_area / 2).unsqueeze(2) * plane.unsqueeze(2) * plane.unsqueeze(1)
+
+
+def cluster_vertices(vertices: torch.Tensor, faces: torch.Tensor, cell_size: float,
+                     placement: str = 'quadric') -> Tuple[torch.Tensor, torch.Tensor]:
+    # Voxel-grid vertex clustering: every vertex in a cell collapses onto one
+    # representative. With quadric placement the representative minimises the
+    # summed squared distance to the planes of the faces around the cell
+    # (out-of-core QEM), which keeps sharp features the plain mean smears.
+    if cell_size <= 0:
+        raise ValueError("cell_size must be positive")
+    if len(vertices) == 0:
+        return vertices, faces
+
+    origin = vertices.min(dim=0).values
+    cells = torch.floor((vertices - origin) / cell_size).to(torch.int64)
+    dims = cells.max(dim=0).values + 1
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    with stage('unique'):
+        _, cluster = torch.unique(keys, return_inverse=True)
+    num_clusters = int(cluster.max()) + 1
+
+    counts = torch.bincount(cluster, minlength=num_clusters).to(vertices.dtype).unsqueeze(1)
+    mean = torch.zeros(num_clusters, 3, dtype=vertices.dtype).index_add_(0, cluster, vertices) / counts
+
+    if placement == 'quadric' and len(faces):
+        with stage('quadrics'):
+            quadrics = face_quadrics(vertices, faces)
+        totals = torch.zeros(num_clusters, 4, 4, dtype=vertices.dtype)
+        for corner in range(3):
+            totals.index_add_(0, cluster[faces[:, corner]], quadrics)
+
+        # Minimise x^T A x + 2 b^T x plus a small pull towards the cluster
+        # mean, which keeps flat or isolated clusters well-posed
+        a = totals[:, :3, :3]
+        b = totals[:, :3, 3]
+        trace = a.diagonal(dim1=1, dim2=2).sum(dim=1)
+        reg = (trace * 1e-3 + 1e-9).view(-1, 1, 1)
+        eye = torch.eye(3, dtype=vertices.dtype)
+        rhs = (reg.view(-1, 1) * mean - b).unsqueeze(2)
+        positions = torch.linalg.solve(a + reg * eye, rhs).squeeze(2)
+        positions = torch.where(torch.isfinite(positions), positions, mean)
+    elif placement in PLACEMENTS:
+        positions = mean
+    else:
+        raise ValueError(f"Unknown vertex placement: {placement}")
+
+    new_faces = clean_faces(cluster[faces]) if len(faces) else faces
+    return compact(positions, new_faces)
+
+
+def cell_size_for_target(vertices: torch.Tensor, faces: torch.Tensor, target_faces: int,
+                         iterations: int = 12) -> float:
+    # Log-scale bisection for the smallest cell size whose clustering has at
+    # most target_faces faces. Face counts don't depend on placement, so the
+    # search uses the cheap mean placement.
+    extent = float((vertices.max(dim=0).values - vertices.min(dim=0).values).max())
+    if extent <= 0:
+        return 1.0
+    lo, hi = extent * 1e-5, extent
+    for _ in range(iterations):
+        mid = (lo * hi) ** 0.5
+        _, clustered = cluster_vertices(vertices, faces, mid, placement='mean')
+        if len(clustered) > target_faces:
+            lo = mid
+        else:
+            hi = mid
+    return hi
+
+
+def simplify(vertices: torch.Tensor, faces: torch.Tensor, method: str = 'cluster', cell_size: float = 0.01,
+             target_faces: Optional[int] = None, placement: str = 'quadric') -> Tuple[torch.Tensor, torch.Tensor]:
+    if method == 'unique':
+        # Only merges bit-identical vertices
+        with stage('unique'):
+            unique_vertices, indices = torch.unique(vertices, dim=0, return_inverse=True)
+        return unique_vertices, indices[faces]
+
+    if method != 'cluster':
+        raise ValueError(f"Unknown simplification method: {method}")
+
+    if target_faces is not None:
+        if len(faces) <= target_faces:
+            # Already small enough; only drop degenerate/duplicate faces
+            return compact(vertices, clean_faces(faces))
+        cell_size = cell_size_for_target(vertices, faces, target_faces)
+    return cluster_vertices(vertices, faces, cell_size, placement)
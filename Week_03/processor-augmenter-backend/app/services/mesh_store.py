@@ -0,0 +1,136 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from ..core.config import env_int
+
+
+class MeshEntry:
+    def __init__(self, vertices: np.ndarray, faces: np.ndarray, parent: Optional[str] = None,
+                 operations: Tuple[str, ...] = ()):
+        self.vertices = vertices
+        self.faces = faces
+        self.parent = parent
+        self.operations = operations
+        self.nbytes = vertices.nbytes + faces.nbytes
+        self.created = time.monotonic()
+        self.last_access = self.created
+
+    def info(self, mesh_id: str) -> Dict:
+        return {
+            'mesh_id': mesh_id,
+            'vertices': len(self.vertices),
+            'faces': len(self.faces),
+            'bytes': self.nbytes,
+            'parent': self.parent,
+            'operations': list(self.operations),
+        }
+
+
+class MeshStore:
+    # Parsed meshes kept server-side between calls, keyed by content hash.
+    # Least recently used meshes are evicted once the byte budget is
+    # exceeded, and meshes not touched for `ttl` seconds expire.
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, MeshEntry]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def hash_bytes(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()[:32]
+
+    @staticmethod
+    def hash_mesh(vertices: np.ndarray, faces: np.ndarray) -> str:
+        digest = hashlib.sha256()
+        digest.update(np.ascontiguousarray(vertices, dtype='<f4').tobytes())
+        digest.update(np.ascontiguousarray(faces, dtype='<i8').tobytes())
+        return digest.hexdigest()[:32]
+
+    def _drop(self, mesh_id: str):
+        entry = self._entries.pop(mesh_id)
+        self._bytes -= entry.nbytes
+
+    def _expire(self, now: float):
+        while self._entries:
+            mesh_id, entry = next(iter(self._entries.items()))
+            if now - entry.last_access < self.ttl:
+                break
+            self._drop(mesh_id)
+            self.expirations += 1
+
+    def get(self, mesh_id: str) -> Optional[MeshEntry]:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(mesh_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            entry.last_access = now
+            self._entries.move_to_end(mesh_id)
+            self.hits += 1
+            return entry
+
+    def put(self, mesh_id: str, vertices: np.ndarray, faces: np.ndarray, parent: Optional[str] = None,
+            operations: Tuple[str, ...] = ()) -> str:
+        entry = MeshEntry(vertices, faces, parent, tuple(operations))
+        if entry.nbytes > self.max_bytes:
+            # Too big to keep; callers still get the id back, it just won't resolve later
+            return mesh_id
+
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if mesh_id in self._entries:
+                self._drop(mesh_id)
+            self._entries[mesh_id] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+        return mesh_id
+
+    def add(self, vertices: np.ndarray, faces: np.ndarray, parent: Optional[str] = None,
+            operations: Tuple[str, ...] = ()) -> str:
+        return self.put(self.hash_mesh(vertices, faces), vertices, faces, parent, operations)
+
+    def delete(self, mesh_id: str) -> bool:
+        with self._lock:
+            if mesh_id not in self._entries:
+                return False
+            self._drop(mesh_id)
+            return True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                'meshes': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+mesh_store = MeshStore(
+    max_bytes=env_int('PA_MESH_STORE_MB', 512) * 1024 * 1024,
+    ttl=env_int('PA_MESH_STORE_TTL', 3600)
+)
@@ -0,0 +1,138 @@
+import io
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# Control points of matplotlib's "coolwarm" (what librosa.display.specshow
+# picks for data with both signs), sampled at nine evenly spaced positions
+COOLWARM = np.array([[0.2298, 0.2987, 0.7537],
+                     [0.3837, 0.5102, 0.9178],
+                     [0.5543, 0.6901, 0.9955],
+                     [0.7240, 0.8149, 0.9757],
+                     [0.8674, 0.8644, 0.8626],
+                     [0.9595, 0.7670, 0.6741],
+                     [0.9567, 0.5980, 0.4773],
+                     [0.8654, 0.3711, 0.2958],
+                     [0.7057, 0.0156, 0.1502]])
+
+PLOT_SIZE = (1000, 400)  # Same pixels as the old 10x4 inch figure at 100 dpi
+COLORBAR_WIDTH = 24
+COLORBAR_GAP = 8
+
+# Label strips around the heatmap: title above, time axis below, the colour
+# bar's dB range to its right
+TITLE_HEIGHT = 22
+AXIS_HEIGHT = 22
+SCALE_WIDTH = 48
+TICK_LENGTH = 4
+
+
+def colormap_lut(points: np.ndarray = COOLWARM) -> np.ndarray:
+    # 256 RGB entries interpolated linearly between the control points
+    positions = np.linspace(0.0, 1.0, len(points))
+    levels = np.linspace(0.0, 1.0, 256)
+    channels = [np.interp(levels, positions, points[:, c]) for c in range(3)]
+    return np.round(np.stack(channels, axis=-1) * 255).astype(np.uint8)
+
+
+def tick_step(span: float, max_ticks: int = 10) -> float:
+    # 1, 2 or 5 times a power of ten, giving at most max_ticks intervals
+    raw = span / max_ticks
+    power = 10 ** math.floor(math.log10(raw)) if raw > 0 else 1
+    for multiple in (1, 2, 5, 10):
+        if multiple * power >= raw:
+            return multiple * power
+    return 10 * power
+
+
+class MfccRenderer:
+    # Draws a coefficient x frame matrix as a heatmap: values are scaled to
+    # 0-255 between the matrix's min and max, looked up in a precomputed
+    # colormap and resized by index so every output pixel is one gather.
+    # Only NumPy and PIL are involved, so there is no global plotting state
+    # and it is safe to call from any worker thread or process.
+    def __init__(self, points: np.ndarray = COOLWARM):
+        self.lut = colormap_lut(points)
+
+    def levels(self, data: np.ndarray) -> Tuple[np.ndarray, float, float]:
+        vmin, vmax = float(data.min()), float(data.max())
+        scale = 255.0 / (vmax - vmin) if vmax > vmin else 0.0
+        index = np.clip(np.rint((data - vmin) * scale), 0, 255).astype(np.uint8)
+        return index, vmin, vmax
+
+    def render(self, data: np.ndarray, size: Tuple[int, int] = PLOT_SIZE, colorbar: bool = True) -> np.ndarray:
+        # Returns an RGB uint8 array; the first coefficient is the bottom row
+        width, height = size
+        index, _, _ = self.levels(np.flipud(data))
+
+        plot_width = width - (COLORBAR_WIDTH + COLORBAR_GAP if colorbar else 0)
+        rows = np.arange(height) * index.shape[0] // height
+        cols = np.arange(plot_width) * index.shape[1] // plot_width
+        image = np.full((height, width, 3), 255, dtype=np.uint8)
+        image[:, :plot_width] = self.lut[index[rows[:, None], cols[None, :]]]
+
+        if colorbar:
+            # Highest value at the top, like a matplotlib colorbar
+            ramp = np.linspace(255, 0, height).round().astype(np.uint8)
+            image[:, width - COLORBAR_WIDTH:] = self.lut[ramp][:, None, :]
+        return image
+
+    def render_labelled(self, data: np.ndarray, size: Tuple[int, int] = PLOT_SIZE, colorbar: bool = True,
+                        seconds: Optional[float] = None) -> Image.Image:
+        # The heatmap with what the matplotlib figure had around it: an
+        # "MFCC" title, time ticks (in seconds, or frames if the duration is
+        # unknown) and the colour bar's range in dB
+        width, height = size
+        inner = (width - (SCALE_WIDTH if colorbar else 0), height - TITLE_HEIGHT - AXIS_HEIGHT)
+        canvas = Image.new('RGB', size, 'white')
+        canvas.paste(Image.fromarray(self.render(data, inner, colorbar)), (0, TITLE_HEIGHT))
+        draw = ImageDraw.Draw(canvas)
+        font = ImageFont.load_default()
+
+        def text(x: float, y: float, label: str, align: str = 'left') -> float:
+            # Draws label and returns where its left edge ended up
+            left, top, right, _ = draw.textbbox((0, 0), label, font=font)
+            shift = {'left': left, 'center': (left + right) / 2, 'right': right}[align]
+            draw.text((x - shift, y - top), label, fill='black', font=font)
+            return x - shift + left
+
+        text(width / 2, 6, 'MFCC', 'center')
+
+        plot_width = inner[0] - (COLORBAR_WIDTH + COLORBAR_GAP if colorbar else 0)
+        axis_y = TITLE_HEIGHT + inner[1]
+        label_y = axis_y + TICK_LENGTH + 3
+        # The unit goes at the end of the axis; tick labels that would run into it are left out
+        unit_left = text(plot_width, label_y, 's' if seconds else 'frame', 'right')
+        span = seconds if seconds else float(data.shape[1])
+        step = tick_step(span)
+        for i in range(int(span / step) + 1):
+            x = round(i * step / span * (plot_width - 1))
+            draw.line([(x, axis_y), (x, axis_y + TICK_LENGTH)], fill='black')
+            label = f"{i * step:g}"
+            half = draw.textlength(label, font=font) / 2
+            if max(x, half) + half < unit_left - 6:
+                text(max(x, half), label_y, label, 'center')
+
+        if colorbar:
+            vmin, vmax = float(data.min()), float(data.max())
+            text(inner[0] + 4, TITLE_HEIGHT, f"{vmax:+2.0f} dB")
+            text(inner[0] + 4, TITLE_HEIGHT + inner[1] - 10, f"{vmin:+2.0f} dB")
+        return canvas
+
+    def render_png(self, data: np.ndarray, size: Tuple[int, int] = PLOT_SIZE, colorbar: bool = True,
+                   seconds: Optional[float] = None, labels: bool = True, compress_level: int = 3) -> bytes:
+        if labels:
+            image = self.render_labelled(data, size, colorbar, seconds)
+        else:
+            image = Image.fromarray(self.render(data, size, colorbar))
+        output = io.BytesIO()
+        image.save(output, format='PNG', compress_level=compress_level)
+        return output.getvalue()
+
+
+def encode_npy(data: np.ndarray) -> bytes:
+    output = io.BytesIO()
+    np.save(output, np.ascontiguousarray(data, dtype=np.float32), allow_pickle=False)
+    return output.getvalue()
@@ -1,8 +1,14 @@
+import numpy as np
 import torch
-from typing import Dict
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 import io
+import json
 import random
 import math
+import warnings
+from ..core.timing import stage
+from .mesh_simplify import simplify
+from .mesh_io import parse_off, encode_mesh, encode_mesh_batch_header, encode_mesh_batch_samples
 
 class ModelService:
     def __init__(self):
@@ -15,9 +21,9 @@ class ModelService:
         vertices = vertices / max_dist
         return vertices
 
-    def random_rotation_matrix(self, max_angle=10):
+    def random_rotation_matrix(self, max_angle=10, rng=random):
         # Convert degrees to radians
-        angle = random.uniform(-max_angle, max_angle) * math.pi / 180
+        angle = rng.uniform(-max_angle, max_angle) * math.pi / 180
         
         # Create rotation matrices for each axis
         cos_t = torch.cos(torch.tensor(angle))
@@ -48,100 +54,219 @@ class ModelService:
         rotation_matrix = torch.matmul(torch.matmul(rot_x, rot_y), rot_z)
         return rotation_matrix
 
-    def random_scale(self, vertices, scale_range=0.2):
-        scale = torch.rand(3) * scale_range * 2 + (1 - scale_range)  # Random scale between 0.8 and 1.2
+    def batch_rotation_matrices(self, angles: torch.Tensor) -> torch.Tensor:
+        # (K, 3) angles in radians -> (K, 3, 3) matrices Rx @ Ry @ Rz, with an
+        # independent angle per axis
+        cos_t, sin_t = torch.cos(angles), torch.sin(angles)
+        k = angles.shape[0]
+        ones, zeros = torch.ones(k), torch.zeros(k)
+
+        rot_x = torch.stack([
+            ones, zeros, zeros,
+            zeros, cos_t[:, 0], -sin_t[:, 0],
+            zeros, sin_t[:, 0], cos_t[:, 0]
+        ], dim=1).view(k, 3, 3)
+        rot_y = torch.stack([
+            cos_t[:, 1], zeros, sin_t[:, 1],
+            zeros, ones, zeros,
+            -sin_t[:, 1], zeros, cos_t[:, 1]
+        ], dim=1).view(k, 3, 3)
+        rot_z = torch.stack([
+            cos_t[:, 2], -sin_t[:, 2], zeros,
+            sin_t[:, 2], cos_t[:, 2], zeros,
+            zeros, zeros, ones
+        ], dim=1).view(k, 3, 3)
+        return torch.bmm(torch.bmm(rot_x, rot_y), rot_z)
+
+    def random_scale(self, vertices, scale_range=0.2, generator=None):
+        scale = torch.rand(3, generator=generator) * scale_range * 2 + (1 - scale_range)  # Random scale between 0.8 and 1.2
         return vertices * scale
 
-    def horizontal_flip(self, vertices, probability=0.5):
-        if random.random() < probability:
+    def horizontal_flip(self, vertices, probability=0.5, rng=random):
+        if rng.random() < probability:
             vertices[:, 0] = -vertices[:, 0]  # Flip x-coordinates
         return vertices
 
-    def load_off_file(self, file_data: bytes) -> Dict:
-        try:
-            # Read OFF file content
-            content = io.StringIO(file_data.decode('utf-8'))
-            lines = content.readlines()
-            
-            # Parse OFF header
-            if lines[0].strip() != 'OFF':
-                raise ValueError("Not a valid OFF file")
-            
-            # Get counts
-            num_vertices, num_faces, _ = map(int, lines[1].strip().split())
-            
-            # Read vertices
-            vertices = []
-            for i in range(num_vertices):
-                x, y, z = map(float, lines[i + 2].strip().split())
-                vertices.append([x, y, z])
-            
-            # Read faces
-            faces = []
-            for i in range(num_faces):
-                face = list(map(int, lines[i + num_vertices + 2].strip().split()))[1:]
-                faces.append(face)
-            
-            # Convert to torch tensors
-            vertices = torch.tensor(vertices, dtype=torch.float32)
-            faces = torch.tensor(faces, dtype=torch.int64)
-            
-            # Normalize vertices
-            vertices = self.normalize(vertices)
-            
+    def to_tensors(self, model_data: Dict) -> Tuple[torch.Tensor, torch.Tensor]:
+        # model_data holds nested lists (JSON) or NumPy arrays (binary payloads)
+        vertices, faces = model_data['vertices'], model_data['faces']
+        if isinstance(vertices, list):
+            return (torch.tensor(vertices, dtype=torch.float32),
+                    torch.tensor(faces, dtype=torch.int64))
+
+        with warnings.catch_warnings():
+            # Arrays decoded from a request body are read-only views. The
+            # tensors built here are never modified in place, so share them.
+            warnings.simplefilter('ignore', UserWarning)
+            vertices = torch.from_numpy(vertices)
+            faces = torch.from_numpy(faces)
+        return vertices.to(torch.float32), faces.to(torch.int64)
+
+    def export(self, vertices: torch.Tensor, faces: torch.Tensor, fmt: str = 'json') -> Union[Dict, bytes]:
+        if fmt == 'json':
             return {
                 'vertices': vertices.tolist(),
                 'faces': faces.tolist()
             }
+        return encode_mesh(vertices.numpy(), faces.numpy(), fmt)
+
+    def load_off_mesh(self, file_data: bytes) -> Tuple[torch.Tensor, torch.Tensor]:
+        # Parse the numeric blocks in bulk, then normalize the vertices
+        with stage('parse'):
+            vertices, faces = parse_off(file_data)
+        with stage('normalize'):
+            vertices = self.normalize(torch.from_numpy(vertices))
+        return vertices, torch.from_numpy(faces)
+
+    def load_off_file(self, file_data: bytes) -> Dict:
+        try:
+            vertices, faces = self.load_off_mesh(file_data)
+            return self.export(vertices, faces)
         except Exception as e:
             print(f"Error loading OFF file: {str(e)}")
             raise
 
-    def process_model(self, model_data: Dict) -> Dict:
+    def process_mesh(self, vertices: torch.Tensor, faces: torch.Tensor, method: str = 'cluster',
+                     cell_size: float = 0.01, target_faces: Optional[int] = None,
+                     placement: str = 'quadric') -> Tuple[torch.Tensor, torch.Tensor]:
+        # Normalize vertices
+        vertices = self.normalize(vertices)
+        
+        # Simplify mesh by clustering vertices on a voxel grid (cell_size is
+        # relative to the unit sphere after normalization)
+        return simplify(vertices, faces, method=method, cell_size=cell_size,
+                        target_faces=target_faces, placement=placement)
+
+    def augment_mesh(self, vertices: torch.Tensor, faces: torch.Tensor,
+                     seed: Optional[int] = None) -> Tuple[torch.Tensor, torch.Tensor]:
+        # With a seed every random draw comes from private generators, so the
+        # result is reproducible (and cacheable)
+        rng, generator = random, None
+        if seed is not None:
+            rng = random.Random(seed)
+            generator = torch.Generator().manual_seed(seed)
+
+        # Apply augmentations
+        # 1. Random rotation
+        rotation_matrix = self.random_rotation_matrix(rng=rng)
+        vertices = torch.matmul(vertices, rotation_matrix)
+        
+        # 2. Random scaling
+        vertices = self.random_scale(vertices, generator=generator)
+        
+        # 3. Random horizontal flip
+        vertices = self.horizontal_flip(vertices, rng=rng)
+        
+        # Normalize after transformations
+        vertices = self.normalize(vertices)
+        return vertices, faces
+
+    def process_model(self, model_data: Dict, fmt: str = 'json', **options) -> Union[Dict, bytes]:
         try:
-            # Convert to torch tensors
-            vertices = torch.tensor(model_data['vertices'], dtype=torch.float32)
-            faces = torch.tensor(model_data['faces'], dtype=torch.int64)
-            
-            # Normalize vertices
-            vertices = self.normalize(vertices)
-            
-            # Simplify mesh by averaging nearby vertices
-            unique_vertices, indices = torch.unique(vertices, dim=0, return_inverse=True)
-            new_faces = indices[faces]
-            
-            return {
-                'vertices': unique_vertices.tolist(),
-                'faces': new_faces.tolist()
-            }
+            vertices, faces = self.process_mesh(*self.to_tensors(model_data), **options)
+            return self.export(vertices, faces, fmt)
         except Exception as e:
             print(f"Error processing model: {str(e)}")
             raise
 
-    def augment_model(self, model_data: Dict) -> Dict:
+    def augment_model(self, model_data: Dict, fmt: str = 'json', seed: Optional[int] = None) -> Union[Dict, bytes]:
         try:
-            # Convert to torch tensors
-            vertices = torch.tensor(model_data['vertices'], dtype=torch.float32)
-            faces = torch.tensor(model_data['faces'], dtype=torch.int64)
-            
-            # Apply augmentations
-            # 1. Random rotation
-            rotation_matrix = self.random_rotation_matrix()
-            vertices = torch.matmul(vertices, rotation_matrix)
-            
-            # 2. Random scaling
-            vertices = self.random_scale(vertices)
-            
-            # 3. Random horizontal flip
-            vertices = self.horizontal_flip(vertices)
-            
-            # Normalize after transformations
-            vertices = self.normalize(vertices)
-            
-            return {
-                'vertices': vertices.tolist(),
-                'faces': faces.tolist()
-            }
+            vertices, faces = self.augment_mesh(*self.to_tensors(model_data), seed=seed)
+            return self.export(vertices, faces, fmt)
         except Exception as e:
             print(f"Error augmenting model: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    def augment_batch(self, vertices: torch.Tensor, count: int, seed: Optional[int] = None,
+                      max_angle: float = 10, scale_range: float = 0.2, flip_probability: float = 0.5,
+                      chunk_size: int = 16) -> Iterator[torch.Tensor]:
+        # K augmented copies of one mesh. All random parameters are drawn up
+        # front from one generator, so a seed reproduces the batch regardless
+        # of how it is chunked. Yields (chunk, V, 3) vertex tensors.
+        generator = torch.Generator()
+        if seed is None:
+            generator.seed()
+        else:
+            generator.manual_seed(seed)
+
+        angles = (torch.rand(count, 3, generator=generator) * 2 - 1) * max_angle * math.pi / 180
+        scales = torch.rand(count, 1, 3, generator=generator) * scale_range * 2 + (1 - scale_range)
+        flips = torch.rand(count, generator=generator) < flip_probability
+        rotations = self.batch_rotation_matrices(angles)
+
+        for start in range(0, count, chunk_size):
+            stop = min(start + chunk_size, count)
+            k = stop - start
+
+            with stage('augment'):
+                # 1. Rotation, 2. scaling, 3. horizontal flip, all batched
+                batch = torch.bmm(vertices.expand(k, -1, -1), rotations[start:stop])
+                batch = batch * scales[start:stop]
+                batch[:, :, 0] *= torch.where(flips[start:stop], -1.0, 1.0).unsqueeze(1)
+
+                # Normalize each sample
+                batch = batch - batch.mean(dim=1, keepdim=True)
+                max_dist = torch.norm(batch, dim=2).max(dim=1).values
+                batch = batch / max_dist.view(k, 1, 1)
+            yield batch
+
+    def augment_model_batch(self, model_data: Dict, count: int, seed: Optional[int] = None,
+                            fmt: str = 'binary') -> Iterator[bytes]:
+        vertices, faces = self.to_tensors(model_data)
+        samples = self.augment_batch(vertices, count, seed)
+
+        if fmt == 'binary':
+            # Faces are shared by every sample and sent once
+            yield encode_mesh_batch_header(count, len(vertices), faces.numpy())
+            for batch in samples:
+                with stage('encode'):
+                    chunk = encode_mesh_batch_samples(batch.numpy())
+                yield chunk
+            return
+
+        batches = [batch.numpy() for batch in samples]
+        stacked = np.concatenate(batches) if batches else np.zeros((0, len(vertices), 3), dtype=np.float32)
+        if fmt == 'npz':
+            buffer = io.BytesIO()
+            np.savez(buffer, vertices=stacked.astype('<f4'), faces=faces.numpy().astype('<i4'))
+            yield buffer.getvalue()
+            return
+
+        yield json.dumps({
+            'faces': faces.tolist(),
+            'augmented_models': [{'vertices': sample.tolist()} for sample in stacked]
+        }).encode('utf-8')
+
+    def run_operations(self, model_data: Dict, operations: List[Union[str, Dict]],
+                       fmt: str = 'json') -> Tuple[np.ndarray, np.ndarray, Union[Dict, bytes]]:
+        # Apply a chain of operations and return the raw arrays (for the mesh
+        # store) together with the encoded result (for the response). Each
+        # operation is a name or a dict like {"op": "process", "cell_size": 0.02}.
+        try:
+            steps = {'process': self.process_mesh, 'augment': self.augment_mesh}
+            with stage('decode'):
+                vertices, faces = self.to_tensors(model_data)
+            for operation in operations:
+                options = dict(operation) if isinstance(operation, dict) else {'op': operation}
+                name = options.pop('op', None)
+                if name not in steps:
+                    raise ValueError(f"Unknown model operation: {name}")
+                with stage(name):
+                    vertices, faces = steps[name](vertices, faces, **options)
+            with stage('encode'):
+                encoded = self.export(vertices, faces, fmt)
+            return vertices.numpy(), faces.numpy(), encoded
+        except Exception as e:
+            print(f"Error running model operations: {str(e)}")
+            raise
+
+    def load_off_stored(self, file_data: bytes, fmt: str = 'json') -> Tuple[np.ndarray, np.ndarray, Union[Dict, bytes]]:
+        # Like load_off_file, but also hands back the arrays for the mesh store
+        try:
+            vertices, faces = self.load_off_mesh(file_data)
+            with stage('encode'):
+                encoded = self.export(vertices, faces, fmt)
+            return vertices.numpy(), faces.numpy(), encoded
+        except Exception as e:
+            print(f"Error loading OFF file: {str(e)}")
+            raise
@@ -0,0 +1,117 @@
+import gzip
+import json
+import os
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Penn Treebank tag prefix (as produced by nltk.pos_tag) -> WordNet POS
+TAG_POS = {'NN': 'n', 'VB': 'v', 'JJ': 'a', 'RB': 'r'}
+WORDNET_POS = ('n', 'v', 'a', 'r')
+
+INDEX_VERSION = 1
+
+
+def wordnet_pos(tag: str) -> Optional[str]:
+    return TAG_POS.get(tag[:2])
+
+
+class SynonymIndex:
+    # (lemma, POS) -> synonyms, built once from every WordNet synset so a
+    # lookup is a dict access instead of a corpus query. Inflected or
+    # otherwise unknown words go through WordNet's morphy once and are kept
+    # in a bounded LRU.
+    def __init__(self, groups: Dict[str, List[List[str]]], morphy=None, oov_cache_size: int = 4096):
+        # groups: POS -> list of synsets, each a list of single-word lemma names
+        self.groups = groups
+        self.morphy = morphy
+        table = defaultdict(set)
+        for pos, synsets in groups.items():
+            for names in synsets:
+                for name in names:
+                    table[(name.lower(), pos)].update(names)
+        self.table: Dict[Tuple[str, str], Tuple[str, ...]] = {
+            key: tuple(sorted(names)) for key, names in table.items()
+        }
+        self._oov = lru_cache(maxsize=oov_cache_size)(self._lookup_base_form)
+
+    @classmethod
+    def from_wordnet(cls, wordnet, **kwargs) -> 'SynonymIndex':
+        groups = {pos: [] for pos in WORDNET_POS}
+        for synset in wordnet.all_synsets():
+            # Adjective satellites ('s') are tagged JJ like any other adjective
+            pos = 'a' if synset.pos() == 's' else synset.pos()
+            names = [lemma.name() for lemma in synset.lemmas() if '_' not in lemma.name()]
+            if len(names) > 1:
+                groups[pos].append(names)
+        return cls(groups, morphy=wordnet.morphy, **kwargs)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> 'SynonymIndex':
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != INDEX_VERSION:
+            raise ValueError(f"Unsupported synonym index version in {path}")
+        return cls(data['groups'], **kwargs)
+
+    @classmethod
+    def load_or_build(cls, path: str, wordnet, **kwargs) -> 'SynonymIndex':
+        # Prebuilt file when present, otherwise build from WordNet and save
+        # it for the next start
+        if os.path.exists(path):
+            try:
+                return cls.load(path, morphy=wordnet.morphy, **kwargs)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Rebuilding synonym index, could not load {path}: {e}")
+        index = cls.from_wordnet(wordnet, **kwargs)
+        try:
+            index.save(path)
+        except OSError as e:
+            print(f"Could not save synonym index to {path}: {e}")
+        return index
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = f"{path}.tmp"
+        with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'groups': self.groups}, f, separators=(',', ':'))
+        os.replace(tmp, path)
+
+    def _lookup_base_form(self, word: str, pos: str) -> Tuple[str, ...]:
+        if self.morphy is None:
+            return ()
+        base = self.morphy(word, pos)
+        if base is None:
+            return ()
+        names = self.table.get((base, pos))
+        if names is None:
+            return ()
+        # The base form itself is a valid replacement for an inflected word
+        return tuple(sorted(set(names) | {base}))
+
+    def lookup(self, word: str, pos: str) -> List[str]:
+        key = word.lower()
+        names = self.table.get((key, pos))
+        if names is None:
+            names = self._oov(key, pos)
+        return [name for name in names if name.lower() != key]
+
+    def lookup_tag(self, word: str, tag: str) -> List[str]:
+        pos = wordnet_pos(tag)
+        return self.lookup(word, pos) if pos else []
+
+    def lookup_any(self, word: str, poses: Iterable[str] = WORDNET_POS) -> List[str]:
+        names = set()
+        for pos in poses:
+            names.update(self.lookup(word, pos))
+        return sorted(names)
+
+    def stats(self) -> Dict:
+        info = self._oov.cache_info()
+        return {
+            'entries': len(self.table),
+            'oov_hits': info.hits,
+            'oov_misses': info.misses,
+            'oov_size': info.currsize,
+            'oov_max_size': info.maxsize,
+        }
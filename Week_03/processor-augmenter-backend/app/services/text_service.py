@@ -1,135 +1,278 @@
-from typing import Dict
-from transformers import AutoTokenizer
-import nltk
-from nltk.corpus import wordnet
+from typing import Dict, List, Optional, Tuple
 import random
 import os
+import re
+import threading
+import time
+from ..core.config import env_str, settings
+from ..core.timing import stage
+from .synonym_index import SynonymIndex
+
+# (resource paths to look for, packages that provide them). Newer NLTK
+# releases renamed the tagger, so either name is accepted.
+NLTK_RESOURCES = {
+    'punkt': (['tokenizers/punkt'], ['punkt']),  # English sentence tokenizer
+    'tagger': (
+        ['taggers/averaged_perceptron_tagger_eng', 'taggers/averaged_perceptron_tagger'],
+        ['averaged_perceptron_tagger_eng', 'averaged_perceptron_tagger']
+    ),  # English POS tagger
+    'wordnet': (['corpora/wordnet', 'corpora/wordnet.zip'], ['wordnet']),  # English WordNet
+}
+
+NLTK_DATA_DIR = os.path.join(os.path.dirname(__file__), 'nltk_data')
+
+
+# nltk and transformers take seconds to import, so they are imported inside
+# the methods that need them and only cost anything once text is used
+
+def find_nltk_resource(paths: List[str]) -> bool:
+    import nltk
+    for path in paths:
+        try:
+            nltk.data.find(path)
+            return True
+        except LookupError:
+            continue
+    return False
+
 
 class TextService:
     def __init__(self):
+        # Cheap on purpose: NLTK data, the tokenizer and the synonym index are
+        # loaded once by load(), either during warmup or on first use
+        self.nltk_initialized = False
+        self.tokenizer = None
+        self.synonym_index = None
+        self.insertions = {
+            'adjectives': ['interesting', 'remarkable', 'notable', 'significant', 'important'],
+            'adverbs': ['notably', 'interestingly', 'remarkably', 'significantly', 'particularly'],
+            'phrases': [', in fact,', ', indeed,', ', specifically,', ', in particular,']
+        }
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self.load_report: Dict = {}
+
+    def ensure_loaded(self) -> Dict:
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self.load_report = self._load()
+                    self._loaded = True
+        return self.load_report
+
+    def _load_nltk(self) -> List[str]:
+        # Use whatever is already on disk; only download what is missing, and
+        # never when running offline
+        import nltk
+        os.makedirs(NLTK_DATA_DIR, exist_ok=True)
+        if NLTK_DATA_DIR not in nltk.data.path:
+            nltk.data.path.append(NLTK_DATA_DIR)
+
+        missing = []
+        for name, (paths, packages) in NLTK_RESOURCES.items():
+            if find_nltk_resource(paths):
+                continue
+            if not settings.offline:
+                for package in packages:
+                    try:
+                        print(f"Downloading {package} for English...")
+                        nltk.download(package, download_dir=NLTK_DATA_DIR, quiet=True)
+                    except Exception as e:
+                        print(f"Error downloading {package}: {e}")
+                    if find_nltk_resource(paths):
+                        break
+            if not find_nltk_resource(paths):
+                missing.append(name)
+        return missing
+
+    def _load_tokenizer(self) -> Tuple[Optional[object], str]:
+        # Local directory or Hugging Face cache first; the network is only
+        # tried when not offline
+        from transformers import AutoTokenizer
+        source = settings.tokenizer_path
         try:
-            # Create a directory for NLTK data
-            nltk_data_dir = os.path.join(os.path.dirname(__file__), 'nltk_data')
-            os.makedirs(nltk_data_dir, exist_ok=True)
-            nltk.data.path.append(nltk_data_dir)
-
-            # Download only required English data
-            required_packages = {
-                'tokenizers/punkt/english.pickle': 'punkt',  # English sentence tokenizer
-                'taggers/averaged_perceptron_tagger/english.pickle': 'averaged_perceptron_tagger',  # English POS tagger
-                'corpora/wordnet': 'wordnet'  # English WordNet
-            }
-
-            for file_path, package in required_packages.items():
-                try:
-                    print(f"Downloading {package} for English...")
-                    nltk.download(package, download_dir=nltk_data_dir, quiet=True)
-                except Exception as e:
-                    print(f"Error downloading {package}: {e}")
-
-            self.tokenizer = AutoTokenizer.from_pretrained('bert-base-uncased')
-            self.insertions = {
-                'adjectives': ['interesting', 'remarkable', 'notable', 'significant', 'important'],
-                'adverbs': ['notably', 'interestingly', 'remarkably', 'significantly', 'particularly'],
-                'phrases': [', in fact,', ', indeed,', ', specifically,', ', in particular,']
-            }
-            self.nltk_initialized = True
-            print("NLTK initialization completed successfully")
+            return AutoTokenizer.from_pretrained(source, local_files_only=True), 'local'
         except Exception as e:
-            print(f"Error during initialization: {e}")
-            self.nltk_initialized = False
-            self.tokenizer = None
+            if settings.offline or os.path.isdir(source):
+                print(f"Tokenizer {source} is not available locally: {e}")
+                return None, 'unavailable'
+        try:
+            return AutoTokenizer.from_pretrained(source), 'downloaded'
+        except Exception as e:
+            print(f"Error loading tokenizer {source}: {e}")
+            return None, 'unavailable'
+
+    def _load(self) -> Dict:
+        import nltk
+        from nltk.corpus import wordnet
+        report = {}
 
-    def get_synonyms(self, word: str) -> list:
+        start = time.perf_counter()
+        missing = self._load_nltk()
+        if not missing:
+            # Pay for the tagger's model load and WordNet's lazy corpus load here
+            try:
+                nltk.pos_tag(['warmup'])
+                wordnet.synsets('warmup')
+            except LookupError as e:
+                print(f"Error loading NLTK data: {e}")
+                missing.append('tagger')
+        self.nltk_initialized = not missing
+        report['nltk'] = {'seconds': time.perf_counter() - start, 'missing': missing}
+        if self.nltk_initialized:
+            print("NLTK initialization completed successfully")
+
+        # Build (or load the prebuilt) synonym index up front so requests
+        # never touch the corpus for lookups
+        start = time.perf_counter()
+        if self.nltk_initialized:
+            index_path = env_str('PA_SYNONYM_INDEX', os.path.join(NLTK_DATA_DIR, 'synonyms.json.gz'))
+            try:
+                self.synonym_index = SynonymIndex.load_or_build(index_path, wordnet)
+                print(f"Synonym index ready: {len(self.synonym_index.table)} entries")
+            except Exception as e:
+                print(f"Error building synonym index, falling back to WordNet lookups: {e}")
+        report['synonyms'] = {
+            'seconds': time.perf_counter() - start,
+            'entries': len(self.synonym_index.table) if self.synonym_index else 0
+        }
+
+        start = time.perf_counter()
+        self.tokenizer, source = self._load_tokenizer()
+        report['tokenizer'] = {
+            'seconds': time.perf_counter() - start,
+            'path': settings.tokenizer_path,
+            'source': source
+        }
+
+        report['degraded'] = bool(missing) or self.tokenizer is None
+        return report
+
+    def get_synonyms(self, word: str, tag: Optional[str] = None) -> list:
+        self.ensure_loaded()
         if not self.nltk_initialized:
             return []
+        if self.synonym_index is not None:
+            # With a POS tag only synsets of that part of speech count
+            if tag is not None:
+                return self.synonym_index.lookup_tag(word, tag)
+            return self.synonym_index.lookup_any(word)
+        from nltk.corpus import wordnet
         try:
             synonyms = []
             for syn in wordnet.synsets(word):
                 for lemma in syn.lemmas():
                     if lemma.name() != word and '_' not in lemma.name():
                         synonyms.append(lemma.name())
-            return list(set(synonyms))
+            # Sorted so a seeded augmentation picks the same synonyms in every process
+            return sorted(set(synonyms))
         except Exception as e:
             print(f"Error getting synonyms for {word}: {e}")
             return []
 
-    def augment_text(self, text: str) -> str:
+    def augment_sentence(self, pos_tags, rng) -> str:
+        augmented_words = []
+        for word, tag in pos_tags:
+            if rng.random() < 0.3:
+                if tag.startswith(('NN', 'VB', 'JJ', 'RB')):
+                    synonyms = self.get_synonyms(word, tag)
+                    if synonyms:
+                        if rng.random() < 0.5:
+                            # Mark augmented words with <aug> tags
+                            augmented_words.append(f"<aug>{rng.choice(synonyms)}</aug>")
+                            if rng.random() < 0.2:
+                                insertion_type = rng.choice(['adjectives', 'adverbs', 'phrases'])
+                                augmented_words.append(f"<aug>{rng.choice(self.insertions[insertion_type])}</aug>")
+                            continue
+            augmented_words.append(word)
+
+        augmented_sentence = ' '.join(augmented_words)
+        augmented_sentence = augmented_sentence.replace(' ,', ',')
+        augmented_sentence = augmented_sentence.replace(' .', '.')
+        augmented_sentence = augmented_sentence.replace(' !', '!')
+        augmented_sentence = augmented_sentence.replace(' ?', '?')
+        return augmented_sentence
+
+    def augment_texts(self, texts: List[str], seed: Optional[int] = None,
+                      seeds: Optional[List[int]] = None) -> List[str]:
+        # seeds: one per text, in place of seed + i
+        self.ensure_loaded()
         if not self.nltk_initialized:
-            return f"Error: Text augmentation is not available (NLTK initialization failed)"
-        
+            return [f"Error: Text augmentation is not available (NLTK initialization failed)"] * len(texts)
+
+        import nltk
         try:
-            sentences = text.split('. ')
-            if not sentences:
-                return text
-
-            augmented_sentences = []
-            for sentence in sentences:
-                if not sentence:
-                    continue
-                    
-                try:
-                    words = sentence.split()
-                    pos_tags = nltk.pos_tag(words)
-                    
-                    augmented_words = []
-                    for word, tag in pos_tags:
-                        if random.random() < 0.3:
-                            if tag.startswith(('NN', 'VB', 'JJ', 'RB')):
-                                synonyms = self.get_synonyms(word)
-                                if synonyms:
-                                    if random.random() < 0.5:
-                                        # Mark augmented words with <aug> tags
-                                        augmented_words.append(f"<aug>{random.choice(synonyms)}</aug>")
-                                        if random.random() < 0.2:
-                                            insertion_type = random.choice(['adjectives', 'adverbs', 'phrases'])
-                                            augmented_words.append(f"<aug>{random.choice(self.insertions[insertion_type])}</aug>")
-                                        continue
-                        augmented_words.append(word)
-
-                    augmented_sentence = ' '.join(augmented_words)
-                    augmented_sentence = augmented_sentence.replace(' ,', ',')
-                    augmented_sentence = augmented_sentence.replace(' .', '.')
-                    augmented_sentence = augmented_sentence.replace(' !', '!')
-                    augmented_sentence = augmented_sentence.replace(' ?', '?')
-                    augmented_sentences.append(augmented_sentence)
-                except Exception as e:
-                    print(f"Error processing sentence: {e}")
-                    augmented_sentences.append(sentence)
-
-            return '. '.join(augmented_sentences)
+            # Tag every sentence of the batch in one tagger call
+            split = [[sentence for sentence in text.split('. ') if sentence] for text in texts]
+            with stage('pos_tag'):
+                tagged = iter(nltk.pos_tag_sents([sentence.split() for sentences in split for sentence in sentences]))
         except Exception as e:
             print(f"Error during augmentation: {e}")
-            return f"Error during text augmentation: {str(e)}"
+            return [f"Error during text augmentation: {str(e)}"] * len(texts)
 
-    def process_text(self, text: str) -> Dict[str, str]:
-        # 1. Add newlines after periods
-        text_with_newlines = text.replace('. ', '.\n')
-        
-        # 2. Convert to lowercase
-        processed_text = text_with_newlines.lower()
+        with stage('synonyms'):
+            results = []
+            for i, sentences in enumerate(split):
+                # A seed gives reproducible (and therefore cacheable) output; text i
+                # of a batch gets the same result as a single call with seed + i
+                if seeds is not None:
+                    rng = random.Random(seeds[i])
+                else:
+                    rng = random.Random(seed + i) if seed is not None else random
+
+                augmented_sentences = []
+                for sentence in sentences:
+                    pos_tags = next(tagged)
+                    try:
+                        augmented_sentences.append(self.augment_sentence(pos_tags, rng))
+                    except Exception as e:
+                        print(f"Error processing sentence: {e}")
+                        augmented_sentences.append(sentence)
+
+                results.append('. '.join(augmented_sentences))
+        return results
+
+    def augment_text(self, text: str, seed: Optional[int] = None) -> str:
+        return self.augment_texts([text], seed)[0]
 
-        # 3. Tokenize the text and get token IDs
+    def process_texts(self, texts: List[str], offsets: bool = False) -> List[Dict]:
+        self.ensure_loaded()
+        # 1. Add newlines after periods, 2. convert to lowercase
+        with stage('normalize'):
+            results = [{"processed_text": text.replace('. ', '.\n').lower()} for text in texts]
+
+        # 3. Tokenize the whole batch in one call and get token IDs
         try:
             if self.tokenizer:
-                # Get both tokens and their IDs
-                encoded = self.tokenizer.encode_plus(text, add_special_tokens=False)
-                tokens = self.tokenizer.convert_ids_to_tokens(encoded['input_ids'])
-                token_ids = encoded['input_ids']
-                
-                # Combine tokens with their IDs without space
-                tokens_with_ids = [f"{token}[{token_id}]" for token, token_id in zip(tokens, token_ids)]
-                tokens_str = ' '.join(tokens_with_ids)
+                fast = self.tokenizer.is_fast
+                with stage('tokenize'):
+                    encoded = self.tokenizer(
+                        texts,
+                        add_special_tokens=False,
+                        return_attention_mask=False,
+                        return_token_type_ids=False,
+                        return_offsets_mapping=offsets and fast
+                    )
+                for i, result in enumerate(results):
+                    token_ids = encoded['input_ids'][i]
+                    # The Rust tokenizer already holds the token strings
+                    tokens = encoded.tokens(i) if fast else self.tokenizer.convert_ids_to_tokens(token_ids)
+                    # Combine tokens with their IDs without space
+                    result["tokens"] = ' '.join(map('{}[{}]'.format, tokens, token_ids))
+                    if offsets and fast:
+                        result["offsets"] = [list(span) for span in encoded['offset_mapping'][i]]
             else:
                 # Fallback to basic tokenization
-                import re
-                tokens = re.findall(r'\w+|[^\w\s]', text)
-                tokens_str = ' '.join(f"{token}[N/A]" for token in tokens)
+                for text, result in zip(texts, results):
+                    tokens = re.findall(r'\w+|[^\w\s]', text)
+                    result["tokens"] = ' '.join(f"{token}[N/A]" for token in tokens)
         except Exception as e:
             print(f"Error during tokenization: {e}")
-            tokens_str = "Error during tokenization"
+            for result in results:
+                result["tokens"] = "Error during tokenization"
+                result.pop("offsets", None)
+
+        return results
 
-        return {
-            "processed_text": processed_text,
-            "tokens": tokens_str
-        }
\ No newline at end of file
+    def process_text(self, text: str) -> Dict[str, str]:
+        return self.process_texts([text])[0]
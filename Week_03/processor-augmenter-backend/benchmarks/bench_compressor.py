@@ -0,0 +1,64 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.audio_dsp import compress
+
+SR = 22050
+DURATIONS = [1, 10, 60, 180, 600]
+
+
+def legacy_compress(y, threshold=0.1, ratio=4.0):
+    # The per-sample loop that used to live in AudioService.process_audio
+    y_compressed = np.zeros_like(y)
+    for i, sample in enumerate(y):
+        if abs(sample) > threshold:
+            if sample > 0:
+                y_compressed[i] = threshold + (sample - threshold) / ratio
+            else:
+                y_compressed[i] = -threshold + (sample + threshold) / ratio
+        else:
+            y_compressed[i] = sample
+    return y_compressed
+
+
+def best_of(func, repeats):
+    best = float('inf')
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the legacy compressor loop with the vectorized one")
+    parser.add_argument('--durations', type=float, nargs='+', default=DURATIONS, help="clip lengths in seconds")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--legacy-limit', type=float, default=600,
+                        help="skip the legacy loop for clips longer than this many seconds")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'duration':>10} {'samples':>10} {'legacy s':>10} {'vector s':>10} {'speedup':>9} {'equal':>6}")
+    for duration in args.durations:
+        y = (rng.standard_normal(int(SR * duration)) * 0.3).astype(np.float32)
+
+        vector_time, vector_out = best_of(lambda: compress(y, SR), args.repeats)
+        if duration <= args.legacy_limit:
+            legacy_time, legacy_out = best_of(lambda: legacy_compress(y), 1)
+            equal = np.array_equal(legacy_out, vector_out)
+            print(f"{duration:>9}s {len(y):>10} {legacy_time:>10.3f} {vector_time:>10.4f} "
+                  f"{legacy_time / vector_time:>8.0f}x {str(equal):>6}")
+        else:
+            print(f"{duration:>9}s {len(y):>10} {'-':>10} {vector_time:>10.4f} {'-':>9} {'-':>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from scipy import signal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.audio_dsp import EffectsChain, StreamingReverb, reverb_impulse_response
+
+SR = 22050
+DURATIONS = [1, 10, 60, 180, 600]
+
+
+def legacy_effects(y_harmonic, sr):
+    # The chorus and reverb that used to live in AudioService.augment_audio
+    chorus = np.zeros_like(y_harmonic)
+    num_voices = 3
+    for i in range(num_voices):
+        delay = int(sr * (0.02 + 0.01 * i))
+        rate = 0.5 + 0.1 * i
+        depth = 0.002
+        t = np.arange(len(y_harmonic)) / sr
+        mod = depth * np.sin(2 * np.pi * rate * t)
+        delay_samples = (delay + (mod * sr).astype(int)) % len(y_harmonic)
+        chorus += y_harmonic[delay_samples] * (0.5 ** (i + 1))
+
+    y_augmented = y_harmonic + 0.5 * chorus
+
+    reverb = np.zeros_like(y_augmented)
+    delay_samples = int(0.1 * sr)
+    decay = 0.3
+    for i in range(3):
+        delay = delay_samples * (i + 1)
+        if delay < len(reverb):
+            reverb[delay:] += y_augmented[:-delay] * (decay ** (i + 1))
+
+    return y_augmented + 0.3 * reverb
+
+
+def measure(func, repeats):
+    # Best wall time, plus the peak of memory allocated during one run
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def reverb_matches(y, sr):
+    # Block-wise reverb against one full-length FFT convolution
+    ir = reverb_impulse_response(sr)
+    reverb = StreamingReverb(ir)
+    blockwise = np.concatenate([reverb.process(block) for block in np.array_split(y, 7)])
+    full = signal.oaconvolve(y.astype(np.float64), ir)[:len(y)]
+    return float(np.max(np.abs(blockwise - full)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the legacy chorus/reverb with the block-wise effects chain")
+    parser.add_argument('--durations', type=float, nargs='+', default=DURATIONS, help="clip lengths in seconds")
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'duration':>10} {'legacy s':>9} {'chain s':>9} {'speedup':>8} "
+          f"{'legacy MB':>10} {'chain MB':>9} {'reverb err':>11}")
+    for duration in args.durations:
+        y = (rng.standard_normal(int(SR * duration)) * 0.3).astype(np.float32)
+
+        legacy_time, legacy_peak, _ = measure(lambda: legacy_effects(y, SR), args.repeats)
+        chain_time, chain_peak, _ = measure(lambda: EffectsChain(SR).apply(y), args.repeats)
+        print(f"{duration:>9}s {legacy_time:>9.3f} {chain_time:>9.3f} {legacy_time / chain_time:>7.1f}x "
+              f"{legacy_peak / 2 ** 20:>10.1f} {chain_peak / 2 ** 20:>9.1f} {reverb_matches(y, SR):>11.1e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tracemalloc
+from typing import Callable, Dict, List, NamedTuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import (AUDIO_SECONDS, IMAGE_MEGAPIXELS, MESH_FACES, SR, TEXT_COUNTS, environment,
+                       image_array, mesh_arrays, noise_image, off_mesh, text_corpus, tone_samples, tone_wav)
+from app.core.timing import timed_call
+
+
+class Case(NamedTuple):
+    name: str
+    sizes: List[float]
+    unit: str
+    prepare: Callable  # size -> input, not timed
+    run: Callable      # input -> result, timed
+
+
+def image_cases() -> List[Case]:
+    from app.services.image_codec import encode_image
+    from app.services.image_service import ImageService
+    service = ImageService()
+    jpeg = lambda mp: noise_image(mp, 'jpeg')
+    return [
+        Case('image.decode', IMAGE_MEGAPIXELS, 'MP', jpeg, service.decode),
+        Case('image.decode_preview', IMAGE_MEGAPIXELS, 'MP', jpeg, lambda data: service.decode(data, max_dim=1024)),
+        Case('image.process_fast', IMAGE_MEGAPIXELS, 'MP', jpeg,
+             lambda data: service.process_image(data, 'fast', 'jpeg')),
+        Case('image.process_quality', IMAGE_MEGAPIXELS, 'MP', jpeg,
+             lambda data: service.process_image(data, 'quality', 'jpeg')),
+        Case('image.augment', IMAGE_MEGAPIXELS, 'MP', jpeg, lambda data: service.augment_image(data, 'jpeg')),
+        Case('image.encode_png', IMAGE_MEGAPIXELS, 'MP', image_array, lambda img: encode_image(img, 'png')),
+        Case('image.encode_jpeg', IMAGE_MEGAPIXELS, 'MP', image_array, lambda img: encode_image(img, 'jpeg')),
+    ]
+
+
+def audio_cases() -> List[Case]:
+    from app.services.audio_dsp import EffectsChain, compress
+    from app.services.audio_pipeline import AudioPipeline
+    from app.services.audio_service import AudioService
+    service = AudioService()
+    return [
+        Case('audio.decode', AUDIO_SECONDS, 's', tone_wav, AudioPipeline.decode),
+        Case('audio.process', AUDIO_SECONDS, 's', tone_wav, lambda data: service.process_audio(data, mfcc='none')),
+        Case('audio.process_mfcc_plot', AUDIO_SECONDS, 's', tone_wav, lambda data: service.process_audio(data)),
+        Case('audio.compress', AUDIO_SECONDS, 's', tone_samples, lambda y: compress(y, SR)),
+        Case('audio.effects', AUDIO_SECONDS, 's', tone_samples, lambda y: EffectsChain(SR).apply(y)),
+        Case('audio.augment', AUDIO_SECONDS, 's', tone_wav, service.augment_audio),
+    ]
+
+
+def model_cases() -> List[Case]:
+    from app.services.mesh_io import parse_off
+    from app.services.model_service import ModelService
+    service = ModelService()
+
+    def arrays(faces):
+        vertices, triangles = mesh_arrays(faces)
+        return {'vertices': vertices, 'faces': triangles}
+
+    def operations(ops, fmt='binary'):
+        return lambda model_data: service.run_operations(model_data, ops, fmt)
+
+    return [
+        Case('model.parse_off', MESH_FACES, 'faces', off_mesh, parse_off),
+        Case('model.upload', MESH_FACES, 'faces', off_mesh, lambda data: service.load_off_stored(data, 'binary')),
+        Case('model.process_cluster', MESH_FACES, 'faces', arrays, operations(['process'])),
+        Case('model.process_unique', MESH_FACES, 'faces', arrays, operations([{'op': 'process', 'method': 'unique'}])),
+        Case('model.augment', MESH_FACES, 'faces', arrays, operations([{'op': 'augment', 'seed': 0}])),
+        Case('model.encode_json', MESH_FACES, 'faces', arrays, operations([], 'json')),
+    ]
+
+
+def text_cases() -> List[Case]:
+    from app.services.text_service import TextService
+    service = TextService()
+    # Models and corpora load here, outside the timed runs
+    service.ensure_loaded()
+    return [
+        Case('text.process', TEXT_COUNTS, 'texts', text_corpus, service.process_texts),
+        Case('text.augment', TEXT_COUNTS, 'texts', text_corpus, lambda texts: service.augment_texts(texts, seed=0)),
+    ]
+
+
+MODALITIES = {'image': image_cases, 'audio': audio_cases, 'model': model_cases, 'text': text_cases}
+
+
+def traced_peak(run: Callable, data) -> float:
+    # Python-visible allocations only (NumPy reports its buffers, OpenCV and
+    # torch do not), so this is a lower bound on the working set
+    tracemalloc.start()
+    try:
+        run(data)
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+
+def bench_case(case: Case, sizes: List[float], repeats: int, budget: float, memory: bool) -> List[Dict]:
+    results = []
+    for position, size in enumerate(sizes):
+        data = case.prepare(size)
+        if position == 0:
+            # First call pays for lazy imports, FFT plans, tokenizer caches
+            case.run(data)
+
+        # Up to `repeats` runs, fewer once they add up to the time budget
+        times, stages = [], []
+        while len(times) < repeats and sum(times) < budget:
+            _, timings = timed_call(case.run, data)
+            times.append(timings.pop('total'))
+            stages.append(timings)
+
+        median = statistics.median(times)
+        entry = {
+            'case': case.name,
+            'size': size,
+            'unit': case.unit,
+            'runs': len(times),
+            'min_s': min(times),
+            'median_s': median,
+            'max_s': max(times),
+            'throughput': size / median if median > 0 else None,
+            'stages_s': {name: statistics.median(s.get(name, 0.0) for s in stages) for name in stages[-1]},
+        }
+        if memory:
+            entry['traced_peak_mb'] = traced_peak(case.run, data)
+        results.append(entry)
+        print_entry(entry)
+
+        if median > budget:
+            # Larger inputs would only take longer
+            for skipped in sizes[position + 1:]:
+                results.append({'case': case.name, 'size': skipped, 'unit': case.unit,
+                                'skipped': f"{size:g} {case.unit} already took {median:.1f}s"})
+                print_entry(results[-1])
+            break
+    return results
+
+
+def print_entry(entry: Dict):
+    label = f"{entry['size']:g} {entry['unit']}"
+    if entry.get('skipped'):
+        print(f"{entry['case']:<26} {label:>14}   skipped: {entry['skipped']}")
+        return
+    stages = sorted(entry['stages_s'].items(), key=lambda item: item[1], reverse=True)[:3]
+    memory = f" {entry['traced_peak_mb']:>8.1f}" if 'traced_peak_mb' in entry else ''
+    print(f"{entry['case']:<26} {label:>14} {entry['median_s'] * 1000:>10.1f} {entry['min_s'] * 1000:>10.1f} "
+          f"{entry['throughput']:>12.4g}{memory}   " + ', '.join(f"{name} {sec * 1000:.0f}" for name, sec in stages))
+
+
+def selected(name: str, only: List[str]) -> bool:
+    return not only or any(name == item or name.startswith(item + '.') for item in only)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the service methods on synthetic inputs")
+    parser.add_argument('--preset', choices=('quick', 'full'), default='quick',
+                        help="quick: the two smallest sizes of every sweep; full: all of them")
+    parser.add_argument('--only', nargs='*', default=[],
+                        help="modalities or case names, e.g. 'image' 'audio.compress'")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=20.0,
+                        help="seconds per size; slower sizes get fewer runs and end the sweep")
+    parser.add_argument('--memory', action='store_true', help="one extra run per size under tracemalloc")
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    cases = []
+    for modality, build in MODALITIES.items():
+        # Building a modality imports its libraries (and loads the text
+        # models), so only the requested ones are built
+        if args.only and not any(item.split('.')[0] == modality for item in args.only):
+            continue
+        cases += [case for case in build() if selected(case.name, args.only)]
+
+    print(f"{'case':<26} {'size':>14} {'median ms':>10} {'min ms':>10} {'per second':>12}"
+          f"{' peak MB' if args.memory else ''}   top stages (ms)")
+    results = []
+    for case in cases:
+        sizes = case.sizes if args.preset == 'full' else case.sizes[:2]
+        results += bench_case(case, sizes, args.repeats, args.budget, args.memory)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'benchmark': 'services',
+                'environment': environment(),
+                'settings': {'preset': args.preset, 'repeats': args.repeats, 'budget': args.budget},
+                'results': results,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIGS = ['text,image,audio,model', 'text', 'image', 'audio', 'model']
+
+# Runs in a fresh interpreter: import the app the way uvicorn does and report
+# wall time and peak RSS
+PROBE = """
+import json, resource, time
+start = time.perf_counter()
+import app.main
+seconds = time.perf_counter() - start
+print(json.dumps({
+    'seconds': seconds,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+
+def parse_importtime(stderr: str):
+    # -X importtime lines: "import time: self [us] | cumulative | imported package".
+    # Self time is summed per top-level package, so nested imports are not
+    # counted twice.
+    per_package = defaultdict(int)
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, _, name = line[len('import time:'):].split('|')
+            per_package[name.strip().split('.')[0]] += int(self_us)
+        except ValueError:
+            continue
+    return per_package
+
+
+def measure(modalities: str, repeats: int):
+    env = dict(os.environ, PA_MODALITIES=modalities, PA_PRELOAD='0')
+    best = None
+    packages = None
+    for _ in range(repeats):
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROBE],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"import failed for {modalities}:\n{proc.stderr[-2000:]}")
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+            packages = parse_importtime(proc.stderr)
+    return best, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start import time and memory per modality set")
+    parser.add_argument('--modalities', nargs='+', default=CONFIGS,
+                        help="PA_MODALITIES values to compare, e.g. 'image' 'text,image'")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--top', type=int, default=8, help="Most expensive packages to list per config")
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'modalities':<24} {'import s':>9} {'peak RSS MB':>12}")
+    for modalities in args.modalities:
+        best, packages = measure(modalities, args.repeats)
+        top = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        results[modalities] = {**best, 'top_packages_ms': {name: us / 1000 for name, us in top}}
+        print(f"{modalities:<24} {best['seconds']:>9.2f} {best['max_rss_mb']:>12.0f}")
+        print('    ' + ', '.join(f"{name} {us / 1000:.0f}ms" for name, us in top))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
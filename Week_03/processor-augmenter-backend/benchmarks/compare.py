@@ -0,0 +1,69 @@
+import argparse
+import json
+import sys
+
+# benchmark -> (fields identifying a result, [(metric, True if higher is better)])
+METRICS = {
+    'services': (('case', 'size'), [('median_s', False)]),
+    'load': (('scenario', 'concurrency'), [('p50_ms', False), ('p99_ms', False), ('throughput_rps', True)]),
+}
+
+
+def load(path: str):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two result files of bench_services.py or load_test.py")
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="relative change that counts as a regression (default 10%%)")
+    parser.add_argument('--min-ms', type=float, default=1.0,
+                        help="timings below this in the baseline are shown but never flagged (too noisy)")
+    args = parser.parse_args()
+
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    kind = baseline.get('benchmark')
+    if kind != candidate.get('benchmark') or kind not in METRICS:
+        sys.exit(f"Can't compare a {kind!r} run with a {candidate.get('benchmark')!r} run")
+    for name, side in (('baseline', baseline), ('candidate', candidate)):
+        env = side.get('environment', {})
+        print(f"{name:<10} commit {env.get('commit')}  python {env.get('python')}  cpus {env.get('cpus')}")
+    if baseline.get('environment', {}).get('cpus') != candidate.get('environment', {}).get('cpus'):
+        print("warning: the runs come from machines with different CPU counts")
+
+    keys, metrics = METRICS[kind]
+    before = {tuple(r.get(k) for k in keys): r for r in baseline['results'] if not r.get('skipped')}
+    regressions = 0
+    print(f"\n{' / '.join(keys):<40} {'metric':<16} {'baseline':>12} {'candidate':>12} {'change':>8}")
+    for result in candidate['results']:
+        key = tuple(result.get(k) for k in keys)
+        old = before.get(key)
+        if result.get('skipped') or old is None:
+            continue
+        for metric, higher_is_better in metrics:
+            a, b = old.get(metric), result.get(metric)
+            if not a or b is None:
+                continue
+            change = b / a - 1
+            worse = -change if higher_is_better else change
+            baseline_ms = a * 1000 if metric.endswith('_s') else a if metric.endswith('_ms') else None
+            flag = ''
+            if baseline_ms is not None and baseline_ms < args.min_ms:
+                pass
+            elif worse > args.threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+            elif worse < -args.threshold:
+                flag = '  faster'
+            label = ' / '.join(f"{part:g}" if isinstance(part, (int, float)) else str(part) for part in key)
+            print(f"{label:<40} {metric:<16} {a:>12.4g} {b:>12.4g} {change:>+7.0%}{flag}")
+
+    print(f"\n{regressions} regression(s) beyond {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, NamedTuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import environment, off_mesh, noise_image, text_corpus, tone_wav
+
+
+class Scenario(NamedTuple):
+    modality: str
+    method: str
+    path: str
+    build: Callable  # args -> httpx request kwargs
+
+
+SCENARIOS = {
+    'augment-image': Scenario('image', 'POST', '/api/augment-image?format=jpeg&response=multipart',
+                              lambda a: {'files': {'image': ('load.jpg', noise_image(a.image_mp), 'image/jpeg')}}),
+    'process-image': Scenario('image', 'POST', '/api/process-image?mode=fast&format=jpeg',
+                              lambda a: {'files': {'image': ('load.jpg', noise_image(a.image_mp), 'image/jpeg')}}),
+    'process-audio': Scenario('audio', 'POST', '/api/process-audio?mfcc=none',
+                              lambda a: {'files': {'audio': ('load.wav', tone_wav(a.audio_seconds), 'audio/wav')}}),
+    'augment-audio': Scenario('audio', 'POST', '/api/augment-audio',
+                              lambda a: {'files': {'audio': ('load.wav', tone_wav(a.audio_seconds), 'audio/wav')}}),
+    'upload-model': Scenario('model', 'POST', '/api/upload-model?format=binary',
+                             lambda a: {'files': {'model': ('load.off', off_mesh(a.mesh_faces), 'text/plain')}}),
+    'process-text': Scenario('text', 'POST', '/api/process-text',
+                             lambda a: {'json': {'text': text_corpus(1, sentences=a.text_sentences)[0]}}),
+}
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return float('nan')
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def parse_server_timing(value: str) -> Dict[str, float]:
+    stages = {}
+    for item in value.split(','):
+        name, _, rest = item.strip().partition(';dur=')
+        if rest:
+            stages[name] = float(rest)
+    return stages
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    # The server process and its largest live process-pool worker
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    workers = 0.0
+    for child in multiprocessing.active_children():
+        try:
+            with open(f"/proc/{child.pid}/status") as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        workers = max(workers, int(line.split()[1]) / 1024)
+        except OSError:
+            continue
+    return {'server_peak_rss_mb': own, 'worker_peak_rss_mb': workers}
+
+
+async def run_scenario(client, name: str, scenario: Scenario, request: Dict, concurrency: int,
+                       requests: int, duration: float) -> Dict:
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    stages: Dict[str, List[float]] = defaultdict(list)
+    issued = 0
+    deadline = time.perf_counter() + duration if duration else None
+
+    async def worker():
+        nonlocal issued
+        while (deadline is None and issued < requests) or (deadline is not None and time.perf_counter() < deadline):
+            issued += 1
+            start = time.perf_counter()
+            response = await client.request(scenario.method, scenario.path, headers={'X-Server-Timing': '1'},
+                                            **request)
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] += 1
+            for stage, ms in parse_server_timing(response.headers.get('server-timing', '')).items():
+                stages[stage].append(ms)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    return {
+        'scenario': name,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'seconds': elapsed,
+        'throughput_rps': len(latencies) / elapsed if elapsed > 0 else None,
+        'p50_ms': percentile(ordered, 50) * 1000,
+        'p90_ms': percentile(ordered, 90) * 1000,
+        'p99_ms': percentile(ordered, 99) * 1000,
+        'max_ms': ordered[-1] * 1000 if ordered else None,
+        'status': {str(code): count for code, count in sorted(statuses.items())},
+        'stages_mean_ms': {stage: sum(values) / len(values) for stage, values in stages.items()},
+        **peak_rss_mb(),
+    }
+
+
+async def run(args) -> List[Dict]:
+    import httpx
+    from app.main import app
+
+    results = []
+    # ASGITransport doesn't send lifespan events, so start the app's own
+    # lifespan (job queue, warmup, worker pools) around the whole run
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://load-test', timeout=None) as client:
+            for name in args.scenarios:
+                scenario = SCENARIOS[name]
+                request = scenario.build(args)
+                # One untimed request loads models and fills lazy caches
+                await client.request(scenario.method, scenario.path, **request)
+                for concurrency in args.concurrency:
+                    result = await run_scenario(client, name, scenario, request, concurrency,
+                                                args.requests, args.duration)
+                    results.append(result)
+                    print(f"{name:<16} {concurrency:>5} {result['requests']:>6} {result['throughput_rps']:>8.2f} "
+                          f"{result['p50_ms']:>9.1f} {result['p90_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+                          f"{result['server_peak_rss_mb']:>9.0f} {result['worker_peak_rss_mb']:>9.0f}   "
+                          + ' '.join(f"{code}x{count}" for code, count in result['status'].items()))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process load test of the FastAPI app through an ASGI client")
+    parser.add_argument('--scenarios', nargs='+', default=['augment-image', 'process-audio', 'upload-model'],
+                        choices=sorted(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=50, help="requests per scenario and concurrency level")
+    parser.add_argument('--duration', type=float, default=0,
+                        help="run each level for this many seconds instead of a fixed request count")
+    parser.add_argument('--image-mp', type=float, default=1)
+    parser.add_argument('--audio-seconds', type=float, default=10)
+    parser.add_argument('--mesh-faces', type=int, default=10_000)
+    parser.add_argument('--text-sentences', type=int, default=8)
+    parser.add_argument('--cache', action='store_true',
+                        help="keep the result cache on; by default it is off so every request computes")
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    # Settings are read when the app is imported
+    os.environ.setdefault('PA_MODALITIES', ','.join(sorted({SCENARIOS[name].modality for name in args.scenarios})))
+    if not args.cache:
+        os.environ['PA_CACHE_MB'] = '0'
+        os.environ.pop('PA_CACHE_DIR', None)
+
+    print(f"{'scenario':<16} {'conc':>5} {'reqs':>6} {'req/s':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} "
+          f"{'RSS MB':>9} {'wkr MB':>9}   status")
+    results = asyncio.run(run(args))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'benchmark': 'load',
+                'environment': environment(),
+                'settings': {key: value for key, value in vars(args).items() if key != 'json'},
+                'results': results,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import io
+import os
+import platform
+import subprocess
+import sys
+from typing import Dict, List
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Size sweeps shared by the benchmarks
+IMAGE_MEGAPIXELS = [0.3, 1, 4, 12, 24]
+AUDIO_SECONDS = [1, 10, 60, 300, 1800]
+MESH_FACES = [1_000, 10_000, 100_000, 1_000_000]
+TEXT_COUNTS = [1, 16, 256, 4096]
+
+SR = 22050
+
+WORDS = (
+    "the a model image sound signal quick slow bright dark large small river city forest engine "
+    "network camera voice music color light shadow window garden market winter summer runs jumps "
+    "reads writes builds breaks opens closes carefully quietly rapidly never always often"
+).split()
+
+
+def image_array(megapixels: float, seed: int = 0) -> np.ndarray:
+    # 4:3 BGR image: a smooth gradient (so encoders see some structure) under
+    # Gaussian noise (so denoisers have work to do)
+    height = max(8, int(round((megapixels * 1e6 * 3 / 4) ** 0.5)))
+    width = max(8, int(round(height * 4 / 3)))
+    rng = np.random.default_rng(seed)
+    ramp_x = np.linspace(0, 255, width, dtype=np.float32)
+    ramp_y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([np.broadcast_to(ramp_x, (height, width)),
+                     np.broadcast_to(ramp_y, (height, width)),
+                     np.full((height, width), 128, np.float32)], axis=2)
+    noisy = base + rng.normal(0, 20, (height, width, 3)).astype(np.float32)
+    return np.clip(noisy, 0, 255).astype(np.uint8)
+
+
+def noise_image(megapixels: float, fmt: str = 'jpeg', seed: int = 0) -> bytes:
+    import cv2
+    ok, buffer = cv2.imencode('.png' if fmt == 'png' else '.jpg', image_array(megapixels, seed))
+    if not ok:
+        raise RuntimeError(f"Could not encode a {fmt} test image")
+    return buffer.tobytes()
+
+
+def tone_samples(seconds: float, sr: int = SR, seed: int = 0) -> np.ndarray:
+    # A few harmonics with slow vibrato plus noise, float32 in [-1, 1]
+    t = np.arange(int(seconds * sr), dtype=np.float32) / sr
+    rng = np.random.default_rng(seed)
+    y = np.zeros_like(t)
+    for k, freq in enumerate((220.0, 440.0, 1320.0, 3520.0)):
+        y += np.sin(2 * np.pi * freq * t + 3 * np.sin(2 * np.pi * 0.5 * t)).astype(np.float32) * 0.2 / (k + 1)
+    y += rng.normal(0, 0.05, len(t)).astype(np.float32)
+    return np.clip(y, -1, 1)
+
+
+def tone_wav(seconds: float, sr: int = SR, seed: int = 0) -> bytes:
+    import soundfile as sf
+    output = io.BytesIO()
+    sf.write(output, tone_samples(seconds, sr, seed), sr, format='wav', subtype='PCM_16')
+    return output.getvalue()
+
+
+def mesh_arrays(faces: int, seed: int = 0):
+    # Jittered sphere from a latitude/longitude grid with about `faces`
+    # triangles; vertices on the seam and the poles are left unshared, so
+    # the clustering and unique paths both have something to merge
+    cols = max(3, int(round((faces / 2) ** 0.5 * 1.5)))
+    rows = max(2, int(np.ceil(faces / (2 * cols))))
+    theta = np.linspace(0, np.pi, rows + 1)
+    phi = np.linspace(0, 2 * np.pi, cols + 1)
+    grid_t, grid_p = np.meshgrid(theta, phi, indexing='ij')
+    vertices = np.stack([np.sin(grid_t) * np.cos(grid_p), np.sin(grid_t) * np.sin(grid_p), np.cos(grid_t)], axis=2)
+    vertices = vertices.reshape(-1, 3)
+    vertices += np.random.default_rng(seed).normal(0, 0.002, vertices.shape)
+
+    index = np.arange((rows + 1) * (cols + 1)).reshape(rows + 1, cols + 1)
+    a, b = index[:-1, :-1].ravel(), index[:-1, 1:].ravel()
+    c, d = index[1:, :-1].ravel(), index[1:, 1:].ravel()
+    triangles = np.concatenate([np.stack([a, c, b], 1), np.stack([b, c, d], 1)])[:faces]
+    return vertices.astype(np.float32), triangles.astype(np.int64)
+
+
+def off_mesh(faces: int, seed: int = 0) -> bytes:
+    vertices, triangles = mesh_arrays(faces, seed)
+    output = io.BytesIO()
+    output.write(f"OFF\n{len(vertices)} {len(triangles)} 0\n".encode())
+    np.savetxt(output, vertices, fmt='%.6f')
+    np.savetxt(output, np.hstack([np.full((len(triangles), 1), 3), triangles]), fmt='%d')
+    return output.getvalue()
+
+
+def text_corpus(count: int, sentences: int = 4, words: int = 12, seed: int = 0) -> List[str]:
+    rng = np.random.default_rng(seed)
+    texts = []
+    for _ in range(count):
+        parts = [' '.join(rng.choice(WORDS, words)).capitalize() for _ in range(sentences)]
+        texts.append('. '.join(parts) + '.')
+    return texts
+
+
+def environment() -> Dict:
+    # Enough context to tell whether two result files are comparable
+    info = {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'packages': {},
+    }
+    for name in ('numpy', 'cv2', 'scipy', 'librosa', 'soundfile', 'torch', 'fastapi'):
+        try:
+            module = __import__(name)
+            info['packages'][name] = getattr(module, '__version__', 'unknown')
+        except ImportError:
+            continue
+    try:
+        info['commit'] = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        info['commit'] = None
+    info['env'] = {name: value for name, value in os.environ.items() if name.startswith('PA_')}
+    return info
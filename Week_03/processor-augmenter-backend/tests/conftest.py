@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Configure the app before it is imported: everything runs on the thread
+# pool (no worker processes to spawn), nothing is cached between tests and
+# nothing is loaded in the background. Text needs downloaded models, so
+# only the other modalities are mounted.
+os.environ.setdefault('PA_MODALITIES', 'image,audio,model')
+os.environ.setdefault('PA_WARMUP', '0')
+os.environ.setdefault('PA_CACHE_MB', '0')
+os.environ.setdefault('PA_JOBS_DIR', tempfile.mkdtemp(prefix='pa-jobs-test-'))
+for endpoint in ('PROCESS_AUDIO', 'AUGMENT_AUDIO', 'UPLOAD_MODEL', 'PROCESS_MODEL', 'AUGMENT_MODEL'):
+    os.environ.setdefault(f'PA_POOL_{endpoint}', 'thread')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'benchmarks'))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def triangle():
+    return {'vertices': [[0, 0, 0], [1, 0, 0], [0, 1, 0]], 'faces': [[0, 1, 2]]}
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from synthetic import noise_image
+
+
+@pytest.fixture(scope='module')
+def jpeg():
+    return noise_image(0.01)
+
+
+def vary(response):
+    # CORS adds Origin to the list
+    return [name.strip() for name in response.headers.get('vary', '').split(',') if name.strip()]
+
+
+def post_image(client, path, data, accept=None):
+    headers = {'Accept': accept} if accept else {}
+    return client.post(path, files={'image': ('x.jpg', data, 'image/jpeg')}, headers=headers)
+
+
+@pytest.mark.parametrize('path, accept, media_type', [
+    ('/api/process-image', 'image/webp', 'image/webp'),
+    ('/api/process-image?mode=fast', None, 'image/png'),
+    ('/api/augment-image?response=json', 'image/webp', 'application/json'),
+    ('/api/augment-image?format=png', 'multipart/mixed', 'multipart/mixed'),
+])
+def test_negotiated_output_varies_on_accept(client, jpeg, path, accept, media_type):
+    response = post_image(client, path, jpeg, accept)
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith(media_type)
+    assert 'Accept' in vary(response)
+
+
+@pytest.mark.parametrize('path', [
+    '/api/process-image?format=jpeg',
+    '/api/augment-image?format=png&response=json',
+])
+def test_explicit_output_does_not_vary(client, jpeg, path):
+    response = post_image(client, path, jpeg, 'image/webp')
+    assert response.status_code == 200
+    assert 'Accept' not in vary(response)
+
+
+@pytest.mark.parametrize('path', ['/api/process-image', '/api/augment-image'])
+@pytest.mark.parametrize('query', ['crop=5000,5000,10,10', 'crop=5000,5000,10,10&max_dim=16'])
+def test_crop_outside_the_image_is_400(client, jpeg, path, query):
+    response = post_image(client, f'{path}?{query}', jpeg)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('path', ['/api/process-image', '/api/augment-image'])
+def test_crop_inside_the_image(client, jpeg, path):
+    response = post_image(client, f'{path}?crop=5,5,10,10&max_dim=16', jpeg)
+    assert response.status_code == 200
+
+
+def test_crop_outside_the_image_fails_the_job(client, jpeg):
+    response = client.post('/api/jobs/process-image?crop=5000,5000,10,10',
+                           files={'image': ('x.jpg', jpeg, 'image/jpeg')})
+    assert response.status_code == 202
+    job_id = response.json()['id']
+    for _ in range(200):
+        job = client.get(f'/api/jobs/{job_id}').json()
+        if job['status'] not in ('queued', 'running'):
+            break
+        time.sleep(0.02)
+    assert job['status'] == 'failed'
+    assert 'crop' in job['error'].lower()
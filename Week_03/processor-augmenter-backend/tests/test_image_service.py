@@ -0,0 +1,18 @@
+import numpy as np
+
+from app.services import image_service
+from synthetic import image_array
+
+
+def noisy_image(megapixels: float) -> np.ndarray:
+    img = image_array(megapixels).astype(np.int16)
+    noise = np.random.default_rng(0).integers(-20, 20, img.shape, dtype=np.int16)
+    return np.clip(img + noise, 0, 255).astype(np.uint8)
+
+
+def test_tiled_denoise_matches_the_full_image(monkeypatch):
+    # Small tiles so a modest image crosses many seams and corners
+    monkeypatch.setattr(image_service, 'TILE_SIZE', 96)
+    img = noisy_image(0.1)
+    service = image_service.ImageService()
+    assert np.array_equal(service.denoise_tiled(img), service.denoise(img))
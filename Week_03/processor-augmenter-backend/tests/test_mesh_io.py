@@ -0,0 +1,101 @@
+import pytest
+
+from app.services.mesh_io import MeshFormatError, parse_off
+
+SQUARE = b"OFF\n4 1 0\n0 0 0\n1 0 0\n1 1 0\n0 1 0\n"
+
+
+def test_uniform_polygons_keep_their_size():
+    _, faces = parse_off(SQUARE + b"4 0 1 2 3\n")
+    assert faces.tolist() == [[0, 1, 2, 3]]
+
+
+def test_uniform_polygons_with_colours_keep_their_size():
+    _, faces = parse_off(SQUARE + b"4 0 1 2 3 255 0 0\n")
+    assert faces.tolist() == [[0, 1, 2, 3]]
+
+
+def test_mixed_polygons_are_fan_triangulated():
+    data = SQUARE.replace(b"4 1 0", b"4 2 0") + b"4 0 1 2 3\n3 0 1 2\n"
+    _, faces = parse_off(data)
+    assert faces.tolist() == [[0, 1, 2], [0, 2, 3], [0, 1, 2]]
+
+
+def test_comments_and_glued_counts():
+    vertices, faces = parse_off(b"OFF3 1 0 # counts\n0 0 0\n1 0 0\n0 1 0 # last vertex\n3 0 1 2\n")
+    assert vertices.shape == (3, 3)
+    assert faces.tolist() == [[0, 1, 2]]
+
+
+@pytest.mark.parametrize('data', [
+    b"PLY\n3 1 0\n",
+    b"OFF\n3 1\n0 0 0\n1 0 0\n",
+    b"OFF\n3 1 0\n0 0 0\n1 0 0\n0 1 0\n3 0 1.7 2\n",
+    b"OFF\n3 1 0\n0 0 0\n1 0 0\n0 1 0\n3 0 1.7 2 0.5 0.5 0.5\n",
+    b"OFF\n3 1 0\n0 0 0\n1 0 0\n0 1 0\n3 0 1 9\n",
+    b"OFF\n3 1 0\n0 0 0\n1 0 0\n0 1 0\n3 0 -1 2\n",
+    b"OFF\n3 2 0\n0 0 0\n1 0 0\n0 1 0\n3 0 1 2\n",
+])
+def test_malformed_off_is_rejected(data):
+    with pytest.raises(MeshFormatError):
+        parse_off(data)
+
+
+def test_upload_keeps_quads(client):
+    response = client.post('/api/upload-model', files={'model': ('square.off', SQUARE + b"4 0 1 2 3\n")})
+    assert response.status_code == 200
+    assert response.json()['model_data']['faces'] == [[0, 1, 2, 3]]
+
+
+@pytest.mark.parametrize('face', [b"3 0 1 9\n", b"3 0 1.7 2\n"])
+def test_upload_rejects_bad_faces(client, face):
+    data = b"OFF\n3 1 0\n0 0 0\n1 0 0\n0 1 0\n" + face
+    response = client.post('/api/upload-model', files={'model': ('bad.off', data)})
+    assert response.status_code == 400
+
+
+def binary_mesh(vertices, faces, face_size=3):
+    import numpy as np
+    from app.services.mesh_io import encode_mesh
+    return encode_mesh(np.array(vertices, dtype=np.float32), np.array(faces, dtype=np.int32).reshape(-1, face_size))
+
+
+@pytest.mark.parametrize('faces', [[[0, 1, 9]], [[0, -1, 2]], [[0, 1.5, 2]], [[0, 1]], [[0, 1, 2], [0, 1]]])
+def test_json_model_rejects_bad_faces(client, triangle, faces):
+    triangle['faces'] = faces
+    for path in ('/api/process-model', '/api/augment-model', '/api/augment-model/batch'):
+        response = client.post(path, json={'model_data': triangle})
+        assert response.status_code == 400, path
+
+
+def test_json_model_accepts_whole_float_indices(client, triangle):
+    triangle['faces'] = [[0.0, 1.0, 2.0]]
+    response = client.post('/api/process-model', json={'model_data': triangle})
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('faces', [[0, 1, 9], [0, -1, 2]])
+def test_binary_model_rejects_out_of_range_faces(client, triangle, faces):
+    body = binary_mesh(triangle['vertices'], faces)
+    for path in ('/api/process-model', '/api/augment-model/batch'):
+        response = client.post(path, content=body, headers={'content-type': 'application/octet-stream'})
+        assert response.status_code == 400, path
+
+
+@pytest.mark.parametrize('body', [b'MSH1', b'XXXX' + bytes(12), b'MSH1' + bytes(4) + b'\x01' + bytes(7)])
+def test_binary_model_rejects_bad_payload(client, body):
+    response = client.post('/api/process-model', content=body, headers={'content-type': 'application/octet-stream'})
+    assert response.status_code == 400
+
+
+def test_npz_model_rejects_garbage(client):
+    response = client.post('/api/process-model', content=b'not a zip', headers={'content-type': 'application/x-npz'})
+    assert response.status_code == 400
+
+
+def test_binary_model_round_trip(client, triangle):
+    body = binary_mesh(triangle['vertices'], triangle['faces'])
+    response = client.post('/api/process-model', content=body,
+                           headers={'content-type': 'application/octet-stream', 'accept': 'application/octet-stream'})
+    assert response.status_code == 200
+    assert response.content[:4] == b'MSH1'
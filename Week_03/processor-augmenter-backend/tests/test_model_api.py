@@ -0,0 +1,37 @@
+import pytest
+
+
+@pytest.mark.parametrize('operations, detail', [
+    ('process', 'operations must be a list'),
+    ([3], 'must be a name'),
+    (['bogus'], "unknown model operation 'bogus'"),
+    ([{'op': 'process', 'nonsense': 1}], 'nonsense'),
+    ([{'op': 'process', 'cell_size': 0}], 'cell_size'),
+    ([{'op': 'process', 'cell_size': -1}], 'cell_size'),
+    ([{'op': 'process', 'cell_size': 3}], 'cell_size'),
+    ([{'op': 'process', 'method': 'nearest'}], 'method'),
+    ([{'op': 'process', 'target_faces': 0}], 'target_faces'),
+    ([{'op': 'augment', 'seed': 'x'}], 'seed'),
+])
+def test_process_model_rejects_bad_operations(client, triangle, operations, detail):
+    response = client.post('/api/process-model', json={'model_data': triangle, 'operations': operations})
+    assert response.status_code == 400
+    assert detail in response.json()['detail']
+
+
+def test_process_model_job_rejects_bad_operations(client, triangle):
+    response = client.post('/api/jobs/process-model', json={'model_data': triangle, 'operations': ['bogus']})
+    assert response.status_code == 400
+
+
+def test_process_model_accepts_operation_chain(client, triangle):
+    operations = ['process', {'op': 'process', 'cell_size': 0.5}, {'op': 'augment', 'seed': 1}]
+    response = client.post('/api/process-model', json={'model_data': triangle, 'operations': operations})
+    assert response.status_code == 200
+    assert len(response.json()['processed_model']['faces']) == 1
+
+
+@pytest.mark.parametrize('body', [b'{not json', b'[1, 2]', b'{"model_data": [1]}', b'{"model_data": {"vertices": []}}'])
+def test_process_model_rejects_malformed_body(client, body):
+    response = client.post('/api/process-model', content=body, headers={'content-type': 'application/json'})
+    assert response.status_code == 400
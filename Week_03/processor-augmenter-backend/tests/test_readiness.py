@@ -0,0 +1,35 @@
+import pytest
+
+from app.core.readiness import Component, Readiness, readiness
+
+
+def failing_loader():
+    raise RuntimeError("no tokenizer")
+
+
+def test_failed_component_is_not_ready():
+    state = Readiness()
+    state.register('ok', lambda: {})
+    state.register('broken', failing_loader)
+    state.warmup_all()
+    assert state.failed
+    assert not state.ready
+
+
+def test_degraded_component_is_ready():
+    state = Readiness()
+    state.register('offline', lambda: {'degraded': True})
+    state.warmup_all()
+    assert state.components['offline'].status == 'degraded'
+    assert state.ready
+
+
+@pytest.mark.parametrize('loader, status', [(failing_loader, 503), (lambda: {'degraded': True}, 200)])
+def test_ready_endpoint(client, monkeypatch, loader, status):
+    # The tests run with PA_WARMUP=0, which must not hide a failed load
+    component = Component('probe', loader)
+    component.load()
+    monkeypatch.setitem(readiness.components, 'probe', component)
+    response = client.get('/api/ready')
+    assert response.status_code == status
+    assert response.json()['components']['probe']['status'] == component.status
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.readiness import readiness
+
+
+@pytest.fixture(scope='module')
+def text_router():
+    # Text isn't mounted in the test app (it needs downloaded models), and
+    # importing the router registers its loader; keep /api/ready unaffected
+    components = dict(readiness.components)
+    from app.routers import text_router
+    readiness.components.clear()
+    readiness.components.update(components)
+    return text_router
+
+
+@pytest.fixture
+def text_client(text_router, monkeypatch):
+    # Stand-ins for the tokenizer and tagger that record each batch call
+    calls = []
+
+    def process_texts(texts, offsets=False):
+        calls.append(list(texts))
+        return [{'tokens': text.upper()} for text in texts]
+
+    def augment_texts(texts, seed=None, seeds=None):
+        calls.append(list(texts))
+        return [f'{text}:{seed}' for text, seed in zip(texts, seeds)]
+
+    monkeypatch.setattr(text_router.text_service, 'process_texts', process_texts)
+    monkeypatch.setattr(text_router.text_service, 'augment_texts', augment_texts)
+    app = FastAPI()
+    app.include_router(text_router.router, prefix='/api')
+    with TestClient(app) as client:
+        yield client, calls
+
+
+def ndjson(*lines):
+    return '\n'.join(lines).encode('utf-8')
+
+
+def post_ndjson(client, path, body):
+    return client.post(path, content=body, headers={'Content-Type': 'application/x-ndjson'})
+
+
+def records(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_ndjson_runs_in_bounded_batches(text_client):
+    client, calls = text_client
+    body = ndjson(*[json.dumps(f't{i}') for i in range(5)])
+    response = post_ndjson(client, '/api/process-text/batch?batch_size=2', body)
+    assert response.status_code == 200
+    assert [record['tokens'] for record in records(response)] == [f'T{i}' for i in range(5)]
+    assert calls == [['t0', 't1'], ['t2', 't3'], ['t4']]
+
+
+@pytest.mark.parametrize('line', ['{"text": 1}', 'not json', '["a"]'])
+def test_malformed_line_in_first_batch_is_400(text_client, line):
+    client, calls = text_client
+    body = ndjson('"ok"', line, '"later"')
+    response = post_ndjson(client, '/api/process-text/batch?batch_size=4', body)
+    assert response.status_code == 400
+    assert response.json()['detail'].startswith('Line 2:')
+    assert calls == []
+
+
+def test_malformed_line_after_first_batch_is_an_error_record(text_client):
+    client, _ = text_client
+    body = ndjson('"a"', '"b"', '"c"', '{"txt": "d"}', '"e"')
+    response = post_ndjson(client, '/api/augment-text/batch?batch_size=2&seed=10', body)
+    assert response.status_code == 200
+    out = records(response)
+    assert [record['index'] for record in out] == [0, 1, 2, 3, 4]
+    assert 'error' in out[3]
+    # Seeds follow the input index, whatever lines fail around them
+    assert [out[i]['augmented_text'] for i in (0, 1, 2, 4)] == ['a:10', 'b:11', 'c:12', 'e:14']
+
+
+@pytest.mark.parametrize('body', [b'{"texts": [1, 2]}', b'{"texts": "a"}', b'{not json'])
+def test_invalid_json_body_is_400(text_client, body):
+    client, _ = text_client
+    response = client.post('/api/process-text/batch', content=body, headers={'Content-Type': 'application/json'})
+    assert response.status_code == 400
+
+
+def test_json_list_body(text_client):
+    client, calls = text_client
+    response = client.post('/api/process-text/batch?batch_size=2', json={'texts': ['x', 'y', 'z']})
+    assert response.status_code == 200
+    assert [record['index'] for record in records(response)] == [0, 1, 2]
+    assert calls == [['x', 'y'], ['z']]
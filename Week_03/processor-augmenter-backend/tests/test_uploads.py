@@ -0,0 +1,63 @@
+import io
+import struct
+import tempfile
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from app.core.uploads import read_upload
+from synthetic import noise_image, tone_wav
+
+WAV_WITHOUT_DATA = (b'RIFF' + struct.pack('<I', 28) + b'WAVE'
+                    + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 1, 8000, 16000, 2, 16))
+
+
+def spooled(data: bytes, max_size: int) -> tempfile.SpooledTemporaryFile:
+    spool = tempfile.SpooledTemporaryFile(max_size=max_size)
+    spool.write(data)
+    return spool
+
+
+@pytest.mark.parametrize('make_file', [
+    lambda data: io.BytesIO(data),
+    lambda data: spooled(data, 1 << 20),
+    lambda data: spooled(data, 16),
+])
+def test_read_upload_returns_the_bytes(make_file):
+    data = noise_image(0.01, 'png')
+    buffer = read_upload(UploadFile(make_file(data)), 'image')
+    assert bytes(buffer) == data
+
+
+def test_read_upload_rejects_empty_and_mismatched_uploads():
+    with pytest.raises(HTTPException) as empty:
+        read_upload(UploadFile(io.BytesIO(b'')), 'image')
+    assert empty.value.status_code == 400
+    with pytest.raises(HTTPException) as mismatch:
+        read_upload(UploadFile(io.BytesIO(noise_image(0.01, 'png'))), 'audio')
+    assert mismatch.value.status_code == 415
+
+
+@pytest.mark.parametrize('path', ['/api/process-image', '/api/augment-image'])
+def test_undecodable_image_is_a_client_error(client, path):
+    response = client.post(path, files={'image': ('x.jpg', b'not an image at all', 'image/jpeg')})
+    assert response.status_code == 400
+    assert 'decode' in response.json()['detail']
+
+
+@pytest.mark.parametrize('path', ['/api/process-audio', '/api/augment-audio'])
+@pytest.mark.parametrize('data', [WAV_WITHOUT_DATA, WAV_WITHOUT_DATA + b'data' + struct.pack('<I', 0)])
+def test_undecodable_audio_is_a_client_error(client, path, data):
+    response = client.post(path, files={'audio': ('x.wav', data, 'audio/wav')})
+    assert response.status_code == 400
+
+
+def test_audio_sent_to_image_endpoint_is_unsupported(client):
+    response = client.post('/api/process-image', files={'image': ('x.wav', tone_wav(0.1), 'audio/wav')})
+    assert response.status_code == 415
+
+
+def test_decodable_audio_still_processes(client):
+    response = client.post('/api/process-audio?mfcc=none', files={'audio': ('x.wav', tone_wav(0.5), 'audio/wav')})
+    assert response.status_code == 200
+    assert response.json()['processed_audio'].startswith('data:audio/wav;base64,')